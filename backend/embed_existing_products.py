@@ -2,11 +2,23 @@
 
 from __future__ import annotations
 
-from typing import List, Dict, Any
+import argparse
+import json
+import multiprocessing
+import os
+import struct
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Iterator
 
-from sentence_transformers import SentenceTransformer
+import numpy as np
+import requests
 
-from supabase_utils import get_supabase, upsert_rows
+from supabase_utils import get_supabase, has_column
+from pipeline import BatchUpserter, iter_in_background
+from embedding_cache import EmbeddingCache, embed_text, text_hash
+from embedding_codec import FORMATS, pack
+from onnx_encoder import ensure_export, load_encoder
 
 from dotenv import load_dotenv
 load_dotenv()
@@ -14,94 +26,375 @@ load_dotenv()
 # --------------------------------------------------------------------
 # 1. Load Sentence Transformer model
 # --------------------------------------------------------------------
-print("[EMB] loading model...")
-EMBED_MODEL = SentenceTransformer("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
-print("[EMB] model loaded.")
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+ENCODE_BATCH_SIZE = 64
+# rows per select: PostgREST cuts a response off at its max-rows (1000 on Supabase)
+MAX_PAGE_SIZE = 1000
+
+# Loaded on first use: with --workers the parent never loads it, every pool worker
+# loads its own replica. EMBED_BACKEND=onnx runs the int8 ONNX export instead of
+# torch (scrapers/onnx_encoder.py).
+EMBED_MODEL = None
+
+
+def get_model(threads: int | None = None):
+    global EMBED_MODEL
+    if EMBED_MODEL is None:
+        print(f"[EMB] loading model (pid {os.getpid()})...")
+        EMBED_MODEL = load_encoder(MODEL_NAME, threads=threads)
+        print("[EMB] model loaded.")
+    return EMBED_MODEL
+
+
+def encode_array(texts: List[str]) -> np.ndarray:
+    return get_model().encode(
+        texts,
+        normalize_embeddings=True,
+        batch_size=ENCODE_BATCH_SIZE,
+        show_progress_bar=False,
+        convert_to_numpy=True,
+    ).astype("float32")
 
 
 def encode_texts(texts: List[str]) -> List[List[float]]:
     if not texts:
         return []
+    return [[float(x) for x in vec] for vec in encode_array(texts)]
 
-    embs = EMBED_MODEL.encode(
-        texts,
-        normalize_embeddings=True,
-        batch_size=64,
-        show_progress_bar=True,
-    )
- 
-    return [[float(x) for x in vec] for vec in embs]
+
+# --------------------------------------------------------------------
+# 1b. Multi-process encoding pool
+# --------------------------------------------------------------------
+def _init_worker(threads: int):
+    get_model(threads)
+
+
+class EncodePool:
+    """
+    `workers` processes with one model replica each, each using `threads` threads.
+
+    encode() sorts the texts by length and cuts them into chunks of `chunk_size`, so a
+    chunk pads to about the same length everywhere (little wasted compute on padding).
+    The chunks are encoded in parallel and written back by index, so the output order
+    is the input order, whatever the pool does.
+    """
+
+    def __init__(self, workers: int, threads: int | None = None, chunk_size: int = ENCODE_BATCH_SIZE):
+        self.workers = workers
+        self.threads = threads or max(1, (os.cpu_count() or 1) // workers)
+        self.chunk_size = chunk_size
+        # spawn: torch does not like being forked, and the parent holds reader / writer threads
+        self._pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.threads,),
+        )
+        print(f"[EMB] encode pool: {workers} workers x {self.threads} threads")
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        chunks = [order[i:i + self.chunk_size] for i in range(0, len(order), self.chunk_size)]
+        futures = [self._pool.submit(encode_array, [texts[i] for i in idx]) for idx in chunks]
+
+        out: List[List[float] | None] = [None] * len(texts)
+        for idx, fut in zip(chunks, futures):
+            for i, vec in zip(idx, fut.result()):
+                out[i] = vec.tolist()
+        return out
+
+    def close(self):
+        self._pool.shutdown(wait=True)
 
 
 # --------------------------------------------------------------------
-#  Embed the brand + product_name_du 
+# 1c. Remote encoding through the HF space bulk endpoint
 # --------------------------------------------------------------------
-def process_table(table_name: str, batch_size: int = 200):
-    total_updated = 0
-    print(f"\n[EMB] start table={table_name}")
+class BulkClient:
+    """
+    Encode through POST /embed/bulk of the HF space (hf-space/bulk.py) instead of a
+    local model: one length-prefixed request per page, raw float32 rows back in order.
+    """
 
-    while True:
-        supabase = get_supabase()
-
-        res = (
-            supabase.table(table_name)
-            .select("sku, brand, product_name_du, embedding_du")
-            .is_("embedding_du", "null")
-            .not_.is_("product_name_du", "null")
-            .limit(batch_size)
-            .execute()
+    def __init__(self, url: str, timeout: float = 600):
+        self.url = url
+        self.timeout = timeout
+        self._session = requests.Session()
+        print(f"[EMB] encoding through {url}")
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        if not texts:
+            return []
+        body = b"".join(struct.pack(">I", len(b)) + b for b in (t.encode("utf-8") for t in texts))
+        resp = self._session.post(
+            self.url,
+            data=body,
+            headers={"Content-Type": "application/x-length-prefixed", "Accept": "application/octet-stream"},
+            stream=True,
+            timeout=self.timeout,
         )
+        resp.raise_for_status()
+        raw = b"".join(resp.iter_content(chunk_size=1 << 16))
+        emb = np.frombuffer(raw, dtype="<f4").reshape(len(texts), -1)
+        return emb.tolist()
 
-        rows: List[Dict[str, Any]] = res.data or []
-        if not rows:
-            break
 
-        print(f"[EMB] {table_name}: fetched {len(rows)} rows")
+# --------------------------------------------------------------------
+# 2. Reader: rows without embedding, paged by sku (keyset)
+# --------------------------------------------------------------------
+def iter_missing_pages(
+    table_name: str,
+    page_size: int = 200,
+    stale: bool = False,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Pages of rows with embedding_du IS NULL, ordered by sku. Every page starts after
+    the last sku of the previous one, so rows that are skipped (empty names) or whose
+    write failed are not fetched again in this run.
 
-        texts: List[str] = []
-        skus: List[str] = []
+    stale=True pages through every named row instead; process_table keeps the ones
+    whose embedding_text_hash does not match their current text.
+    """
+    supabase = get_supabase()
+    last_sku = None
+    columns = "sku, brand, product_name_du"
+    if has_column(table_name, "embedding_text_hash"):
+        columns += ", embedding_text_hash"
+
+    while True:
+        q = supabase.table(table_name).select(columns)
+        if not stale:
+            q = q.is_("embedding_du", "null")
+        q = q.not_.is_("product_name_du", "null")
+        if last_sku is not None:
+            q = q.gt("sku", last_sku)
+        rows: List[Dict[str, Any]] = q.order("sku").limit(page_size).execute().data or []
+        # stop on an empty page, not a short one: PostgREST cuts every response off at
+        # its max-rows setting (1000 on Supabase) without an error
+        if not rows:
+            return
+        yield rows
+        last_sku = rows[-1]["sku"]
 
-        for r in rows:
-            brand = (r.get("brand") or "").strip()
-            name = (r.get("product_name_du") or "").strip()
 
-            if not name:
-                continue
+# --------------------------------------------------------------------
+#  Embed the brand + product_name_du
+# --------------------------------------------------------------------
+def process_table(
+    table_name: str,
+    batch_size: int = 200,
+    prefetch: int = 2,
+    write_batch_size: int = 500,
+    pool: EncodePool | BulkClient | None = None,
+    cache: EmbeddingCache | None = None,
+    stale: bool = False,
+    packed: str | None = None,
+) -> Dict[str, Any]:
+    """
+    Backfill embedding_du as a pipeline:
+      reader thread  -> pages of at most MAX_PAGE_SIZE rows, `prefetch` pages ahead
+      main thread    -> collects the rows to embed of several pages into batches of
+                        `batch_size` texts, cache lookup, encode the misses (in-process,
+                        spread over an EncodePool, or remote through a BulkClient)
+      writer thread  -> bulk upserts of {"sku", "embedding_du", "embedding_text_hash"}
+                        (pipeline.BatchUpserter)
+    stale=True re-embeds the rows whose embedding_text_hash does not match their text.
+    packed="f16" / "i8" also writes embedding_packed (embedding_codec.py).
+    Both columns are only written if the table has them (supabase_utils.has_column).
+    """
+    with_hash = has_column(table_name, "embedding_text_hash")
+    if stale and not with_hash:
+        raise ValueError(f"--stale needs {table_name}.embedding_text_hash (EMBEDDING_TEXT_HASH_DDL)")
+    if packed and not has_column(table_name, "embedding_packed"):
+        packed = None
+    encode = pool.encode if pool is not None else encode_texts
+    if cache is not None:
+        encode_misses = encode
+        encode = lambda texts: cache.encode(MODEL_NAME, texts, encode_misses)
+    print(f"\n[EMB] start table={table_name}" + (" (stale rows)" if stale else ""))
+    t0 = time.perf_counter()
+    encode_s = 0.0
+    counts = {"fetched": 0, "skipped": 0, "up_to_date": 0, "encoded": 0}
 
-            text = (brand + " " + name).strip()
-            if not text:
-                continue
+    skus: List[str] = []
+    texts: List[str] = []
+    hashes: List[str] = []
 
-            skus.append(str(r["sku"]))
-            texts.append(text)
+    def encode_batch(n: int):
+        """Encode and queue the first n collected rows."""
+        nonlocal encode_s
+        e0 = time.perf_counter()
+        embs = encode(texts[:n])
+        encode_s += time.perf_counter() - e0
+        counts["encoded"] += len(embs)
 
-        if not skus:
-            print(f"[EMB] {table_name}: all {len(rows)} rows in this batch have empty names, done.")
-            break
+        for sku, emb, h in zip(skus[:n], embs, hashes[:n]):
+            row = {"sku": sku, "embedding_du": emb}
+            if with_hash:
+                row["embedding_text_hash"] = h
+            if packed:
+                row["embedding_packed"] = pack(emb, packed)
+            upserter.put(row)
+        del skus[:n], texts[:n], hashes[:n]
 
-        embs = encode_texts(texts)
+        wall = time.perf_counter() - t0
+        print(
+            f"[EMB] {table_name}: {counts['encoded']} encoded "
+            f"({counts['encoded'] / encode_s if encode_s else 0:.0f} rows/s encode, "
+            f"{counts['encoded'] / wall:.0f} rows/s overall)"
+        )
 
-        updates = [
-            {"sku": sku, "embedding_du": emb}
-            for sku, emb in zip(skus, embs)
-        ]
+    upserter = BatchUpserter(table_name, conflict_col="sku", batch_size=write_batch_size)
+    try:
+        pages = iter_missing_pages(table_name, min(batch_size, MAX_PAGE_SIZE), stale=stale)
+        for rows in iter_in_background(pages, maxsize=prefetch):
+            counts["fetched"] += len(rows)
+            for r in rows:
+                text = embed_text(r)
+                if text is None:
+                    counts["skipped"] += 1
+                    continue
+                h = text_hash(text)
+                if stale and r.get("embedding_text_hash") == h:
+                    counts["up_to_date"] += 1
+                    continue
+                skus.append(str(r["sku"]))
+                texts.append(text)
+                hashes.append(h)
+            while len(texts) >= batch_size:
+                encode_batch(batch_size)
+        if texts:
+            encode_batch(len(texts))
+    finally:
+        written = upserter.close()
 
-        upsert_rows(table_name, updates, conflict_col="sku")
+    wall = time.perf_counter() - t0
+    stats = {
+        **counts,
+        "written": written,
+        "wall_s": round(wall, 2),
+        "encode_s": round(encode_s, 2),
+        "encode_rows_per_s": round(counts["encoded"] / encode_s, 1) if encode_s else None,
+        "end_to_end_rows_per_s": round(written / wall, 1) if wall else None,
+    }
+    if cache is not None:
+        stats["cache"] = cache.stats()
+    print(f"[EMB] DONE table={table_name}: {stats}")
+    return stats
 
-        updated_count = len(updates)
-        total_updated += updated_count
-        print(f"[EMB] {table_name}: upserted {updated_count} rows, total={total_updated}")
 
-    print(f"[EMB] DONE table={table_name}, total_updated={total_updated}")
+# --------------------------------------------------------------------
+#  Pack the embeddings that are already there (no model needed)
+# --------------------------------------------------------------------
+def pack_existing(
+    table_name: str,
+    fmt: str,
+    page_size: int = 500,
+    write_batch_size: int = 500,
+) -> int:
+    """Fill embedding_packed from embedding_du for rows embedded before packing was on."""
+    if not has_column(table_name, "embedding_packed"):
+        print(f"[EMB] {table_name}: run EMBEDDING_PACKED_DDL (scrapers/embedding_codec.py) first")
+        return 0
+    supabase = get_supabase()
+    print(f"\n[EMB] pack table={table_name} ({fmt})")
+    t0 = time.perf_counter()
+    last_sku = None
 
+    upserter = BatchUpserter(table_name, conflict_col="sku", batch_size=write_batch_size)
+    try:
+        while True:
+            q = (
+                supabase.table(table_name)
+                .select("sku, embedding_du")
+                .is_("embedding_packed", "null")
+                .not_.is_("embedding_du", "null")
+            )
+            if last_sku is not None:
+                q = q.gt("sku", last_sku)
+            rows = q.order("sku").limit(page_size).execute().data or []
+            if not rows:        # empty, not short: see iter_missing_pages
+                break
+            for r in rows:
+                emb = r["embedding_du"]
+                if isinstance(emb, str):
+                    emb = json.loads(emb)
+                upserter.put({"sku": str(r["sku"]), "embedding_packed": pack(emb, fmt)})
+            last_sku = rows[-1]["sku"]
+    finally:
+        written = upserter.close()
 
+    print(f"[EMB] DONE pack table={table_name}: {written} rows in {time.perf_counter() - t0:.1f}s")
+    return written
 
 
 # --------------------------------------------------------------------
 # 3. main： ah / dirk / hoogvliet
 # --------------------------------------------------------------------
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill embedding_du for rows without one.")
+    parser.add_argument("--tables", default="ah,dirk,hoogvliet")
+    parser.add_argument("--batch-size", type=int, default=None,
+                        help="texts per encode call, collected from pages of at most "
+                             f"{MAX_PAGE_SIZE} rows (default 200, workers * 256 with --workers, "
+                             "2048 with --remote)")
+    parser.add_argument("--prefetch", type=int, default=2, help="pages fetched ahead of the encoder")
+    parser.add_argument("--write-batch-size", type=int, default=500)
+    parser.add_argument("--workers", type=int, default=0,
+                        help="encoding processes, one model each (0 = encode in this process)")
+    parser.add_argument("--remote", default=os.environ.get("EMBED_BULK_URL"),
+                        help="encode through this HF space /embed/bulk URL instead of a local model")
+    parser.add_argument("--threads-per-worker", type=int, default=None,
+                        help="torch / onnxruntime threads per worker (default cpus / workers)")
+    parser.add_argument("--cache", default=os.environ.get("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite"),
+                        help="embedding cache file (scrapers/embedding_cache.py)")
+    parser.add_argument("--no-cache", action="store_true")
+    parser.add_argument("--stale", action="store_true",
+                        help="re-embed rows whose brand / name changed since they were embedded")
+    parser.add_argument("--packed", choices=FORMATS, default=os.environ.get("EMBEDDING_PACKED_FORMAT") or None,
+                        help="also write embedding_packed in this format (scrapers/embedding_codec.py)")
+    parser.add_argument("--pack-existing", action="store_true",
+                        help="only fill embedding_packed from the existing embedding_du, then exit")
+    args = parser.parse_args()
+    tables = [t.strip() for t in args.tables.split(",") if t.strip()]
+
+    if args.pack_existing:
+        if not args.packed:
+            parser.error("--pack-existing needs --packed (or EMBEDDING_PACKED_FORMAT)")
+        for table in tables:
+            pack_existing(table, args.packed, write_batch_size=args.write_batch_size)
+        raise SystemExit(0)
 
-    process_table("ah")
-    process_table("dirk")
-    process_table("hoogvliet")
\ No newline at end of file
+    cache = None if args.no_cache else EmbeddingCache(args.cache)
+    if args.remote and args.workers > 0:
+        parser.error("--remote and --workers do not go together")
+    if args.workers > 0 and os.environ.get("EMBED_BACKEND", "").lower() == "onnx":
+        ensure_export(MODEL_NAME)   # once here, not in every worker at the same time
+    if args.remote:
+        pool = BulkClient(args.remote)
+        # big batches, one round trip each (the space batches them for throughput),
+        # collected from several pages by process_table
+        batch_size = args.batch_size or 2048
+    else:
+        pool = EncodePool(args.workers, args.threads_per_worker) if args.workers > 0 else None
+        # a batch has to hold a few chunks per worker to keep the whole pool busy
+        batch_size = args.batch_size or (args.workers * 4 * ENCODE_BATCH_SIZE if pool else 200)
+    try:
+        for table in tables:
+            process_table(
+                table,
+                batch_size=batch_size,
+                prefetch=args.prefetch,
+                write_batch_size=args.write_batch_size,
+                pool=pool,
+                cache=cache,
+                stale=args.stale,
+                packed=args.packed,
+            )
+    finally:
+        if isinstance(pool, EncodePool):
+            pool.close()
+        if cache is not None:
+            cache.close()
@@ -0,0 +1,183 @@
+"""
+Embedding backends compared: PyTorch sentence-transformers vs ONNX Runtime (int8 / fp32).
+
+    python benchmarks/bench_embeddings.py                        # 2k synthetic names (fixtures.py)
+    python benchmarks/bench_embeddings.py --names names.txt      # one product text per line
+    python benchmarks/bench_embeddings.py --table ah --rows 5000 # brand + name sampled from Supabase
+    python benchmarks/bench_embeddings.py --backends torch,onnx-int8 --out /tmp/emb.json
+
+For every backend:
+    load_s         model load (+ ONNX export if ONNX_MODEL_DIR is not there yet)
+    p50/p95 ms     latency of single-text encodes (a search query)
+    texts/s        throughput of batch encodes over all the names, best of --repeat
+    cos mean/p01/min  cosine per text between its embedding and the reference one
+
+The first backend in --backends is the reference for the cosine columns.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "scrapers"))
+
+from embedding_cache import embed_text  # noqa: E402
+from onnx_encoder import MODEL_NAME, load_encoder  # noqa: E402
+
+import fixtures  # noqa: E402
+
+
+# backend label -> (EMBED_BACKEND, ONNX_QUANTIZED)
+BACKENDS = {
+    "torch": ("torch", "1"),
+    "onnx-int8": ("onnx", "1"),
+    "onnx-fp32": ("onnx", "0"),
+}
+
+
+# ---------------------------------------------------------------------------
+# Sample texts
+# ---------------------------------------------------------------------------
+def names_from_file(path: str, limit: int) -> List[str]:
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()][:limit]
+
+
+def names_from_table(table: str, limit: int) -> List[str]:
+    from supabase_utils import get_supabase
+
+    rows = (
+        get_supabase().table(table)
+        .select("brand, product_name_du")
+        .not_.is_("product_name_du", "null")
+        .limit(limit)
+        .execute().data or []
+    )
+    return [t for t in (embed_text(r) for r in rows) if t]
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+def load(label: str):
+    backend, quantized = BACKENDS[label]
+    os.environ["ONNX_QUANTIZED"] = quantized
+    t0 = time.perf_counter()
+    model = load_encoder(MODEL_NAME, backend=backend)
+    return model, time.perf_counter() - t0
+
+
+def encode(model, texts: List[str], batch_size: int) -> np.ndarray:
+    return np.asarray(model.encode(
+        texts,
+        batch_size=batch_size,
+        normalize_embeddings=True,
+        convert_to_numpy=True,
+        show_progress_bar=False,
+    ), dtype="float32")
+
+
+def bench_backend(label: str, texts: List[str], batch_size: int, repeat: int, queries: int) -> Dict[str, Any]:
+    model, load_s = load(label)
+    encode(model, texts[:batch_size], batch_size)        # warm-up, not timed
+
+    latencies = []
+    for t in texts[:queries]:
+        t0 = time.perf_counter()
+        encode(model, [t], 1)
+        latencies.append(time.perf_counter() - t0)
+
+    best = float("inf")
+    emb = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        emb = encode(model, texts, batch_size)
+        best = min(best, time.perf_counter() - t0)
+
+    return {
+        "load_s": round(load_s, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 2),
+        "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 2),
+        "texts_per_s": round(len(texts) / best, 1),
+        "embeddings": emb,
+    }
+
+
+def agreement(emb: np.ndarray, ref: np.ndarray) -> Dict[str, float]:
+    """Cosine per text between two normalized embedding matrices of the same texts."""
+    cos = np.sum(emb * ref, axis=1)
+    return {
+        "cos_mean": round(float(cos.mean()), 5),
+        "cos_p01": round(float(np.percentile(cos, 1)), 5),
+        "cos_min": round(float(cos.min()), 5),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the embedding inference backends.")
+    parser.add_argument("--backends", default="torch,onnx-int8",
+                        help=f"comma-separated, first is the reference ({', '.join(BACKENDS)})")
+    parser.add_argument("--rows", default="2000", help="number of texts (10k etc. also work)")
+    parser.add_argument("--names", help="file with one product text per line")
+    parser.add_argument("--table", help="sample brand + product_name_du from this Supabase table")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--queries", type=int, default=200, help="single-text encodes for the latency")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--out", help="write the report as JSON")
+    args = parser.parse_args()
+
+    labels = [b.strip() for b in args.backends.split(",") if b.strip()]
+    unknown = [b for b in labels if b not in BACKENDS]
+    if unknown:
+        parser.error(f"unknown backends {unknown}, choose from {list(BACKENDS)}")
+
+    n = fixtures.parse_size(args.rows)
+    if args.names:
+        texts, source = names_from_file(args.names, n), args.names
+    elif args.table:
+        texts, source = names_from_table(args.table, n), f"supabase:{args.table}"
+    else:
+        texts, source = fixtures.product_names(n), "fixtures.product_names"
+    print(f"[bench] {len(texts):,} texts from {source}, batch size {args.batch_size}\n")
+
+    results: Dict[str, Dict[str, Any]] = {}
+    ref = None
+    print(f"{'backend':<12} {'load s':>7} {'p50 ms':>8} {'p95 ms':>8} {'texts/s':>9} "
+          f"{'cos mean':>9} {'cos p01':>8} {'cos min':>8}")
+    for label in labels:
+        r = bench_backend(label, texts, args.batch_size, args.repeat, args.queries)
+        emb = r.pop("embeddings")
+        if ref is None:
+            ref = emb
+        r.update(agreement(emb, ref))
+        results[label] = r
+        print(f"{label:<12} {r['load_s']:>7.2f} {r['p50_ms']:>8.2f} {r['p95_ms']:>8.2f} "
+              f"{r['texts_per_s']:>9,.0f} {r['cos_mean']:>9.5f} {r['cos_p01']:>8.5f} {r['cos_min']:>8.5f}")
+
+    if args.out:
+        report = {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "texts": len(texts),
+            "source": source,
+            "batch_size": args.batch_size,
+            "reference": labels[0],
+            "python": platform.python_version(),
+            "machine": f"{platform.system()} {platform.machine()} ({os.cpu_count()} cpus)",
+            "results": results,
+        }
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\n[bench] report -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
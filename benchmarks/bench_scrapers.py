@@ -0,0 +1,281 @@
+"""
+Benchmarks for the scraper hot paths, on synthetic catalogs (fixtures.py).
+
+    python benchmarks/bench_scrapers.py --size 10k
+    python benchmarks/bench_scrapers.py --size 100k --only parse_unit --repeat 5
+    python benchmarks/bench_scrapers.py --size 100k --save-baseline before
+    python benchmarks/bench_scrapers.py --size 100k --compare before
+
+For every benchmark:
+    ops/s        rows per second, best of --repeat timed runs
+    peak KiB     tracemalloc peak of one extra (untimed) run, incl. the results it keeps
+    B/op         peak bytes per row
+
+Baselines are JSON files in benchmarks/baselines/<name>.json. They are only comparable
+on the same machine and Python version, both are stored with the numbers.
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import gc
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "scrapers"))
+
+import ah_core  # noqa: E402
+import chain_adapter  # noqa: E402
+import dirk_core  # noqa: E402
+import hoogvliet_core  # noqa: E402
+from supabase_utils import sanitize_rows  # noqa: E402
+
+import fixtures  # noqa: E402
+
+
+BASELINE_DIR = os.path.join(HERE, "baselines")
+
+# run() -> result; ops = number of rows it processes
+Prepared = Tuple[Callable[[], Any], int]
+
+
+# ---------------------------------------------------------------------------
+# Benchmarks: name -> prepare(n) (setup is not timed)
+# ---------------------------------------------------------------------------
+def prepare_parse_unit(n: int) -> Prepared:
+    units = fixtures.unit_strings(n)
+    parse = chain_adapter.parse_unit
+    return (lambda: [parse(u) for u in units]), n
+
+
+def prepare_ah_map(n: int) -> Prepared:
+    raw = fixtures.ah_products(n)
+    return (lambda: [ah_core.map_product_to_row(p) for p in raw]), n
+
+
+def prepare_dirk_map(n: int) -> Prepared:
+    raw = fixtures.dirk_products(n)
+    return (lambda: [dirk_core.map_dirk_product(it) for it in raw]), n
+
+
+def prepare_hoogvliet_units(n: int) -> Prepared:
+    items = fixtures.hoogvliet_items(n)
+    parse_attrs = hoogvliet_core.parse_unit_from_attributes
+    format_unit = hoogvliet_core.format_unit
+
+    def run():
+        return [format_unit(*parse_attrs(it["attributes"])) for it in items]
+    return run, n
+
+
+def prepare_hoogvliet_merge(n: int) -> Prepared:
+    items = []
+    for it in fixtures.hoogvliet_items(n):
+        base_unit, ratio = hoogvliet_core.parse_unit_from_attributes(it["attributes"])
+        items.append({"sku": it["itemno"], "brand": it["brand"], "title": it["title"],
+                      "price": it["price"], "url": it["url"], "base_unit": base_unit, "ratio": ratio})
+    price = {"regular_price": 2.49, "current_price": 1.99}
+    return (lambda: [hoogvliet_core.merge_product(it, price) for it in items]), n
+
+
+def prepare_sanitize_rows(n: int) -> Prepared:
+    records = [ah_core.map_product_to_row(p).to_row() for p in fixtures.ah_products(n)]
+    rows = fixtures.insert_rows(records)
+    return (lambda: sanitize_rows(rows)), n
+
+
+def _joint_diff(records: List[Dict[str, Any]], build_update_row) -> Prepared:
+    old_by_sku = fixtures.db_rows(records)
+    pairs = [(str(r["sku"]), r) for r in records]
+
+    def run():
+        rows = []
+        for sku, new in pairs:
+            row = build_update_row(sku, old_by_sku[sku], new)
+            if row is not None:
+                rows.append(row)
+        return rows
+    return run, len(pairs)
+
+
+def prepare_ah_diff(n: int) -> Prepared:
+    records = [ah_core.map_product_to_row(p) for p in fixtures.ah_products(n)]
+    return _joint_diff(records, ah_core.build_update_row)
+
+
+def prepare_dirk_diff(n: int) -> Prepared:
+    records = [dirk_core.map_dirk_product(it) for it in fixtures.dirk_products(n)]
+    return _joint_diff(records, dirk_core.build_update_row)
+
+
+def prepare_hoogvliet_diff(n: int) -> Prepared:
+    records = []
+    for it in fixtures.hoogvliet_items(n):
+        base_unit, ratio = hoogvliet_core.parse_unit_from_attributes(it["attributes"])
+        item = {"sku": it["itemno"], "brand": it["brand"], "title": it["title"],
+                "url": it["url"], "base_unit": base_unit, "ratio": ratio}
+        price = float(it["price"])
+        records.append(hoogvliet_core.merge_product(item, {"regular_price": price, "current_price": price}))
+
+    # fetch_period=False: the promotion page lookup is network, not diff work
+    def build_update_row(sku, old, new):
+        return hoogvliet_core.build_update_row(sku, old, new, fetch_period=False)
+    return _joint_diff(records, build_update_row)
+
+
+BENCHMARKS: Dict[str, Callable[[int], Prepared]] = {
+    "chain_adapter.parse_unit": prepare_parse_unit,
+    "ah.map_product_to_row": prepare_ah_map,
+    "dirk.map_dirk_product": prepare_dirk_map,
+    "hoogvliet.format_unit_from_attributes": prepare_hoogvliet_units,
+    "hoogvliet.merge_product": prepare_hoogvliet_merge,
+    "supabase_utils.sanitize_rows": prepare_sanitize_rows,
+    "ah.joint_diff": prepare_ah_diff,
+    "dirk.joint_diff": prepare_dirk_diff,
+    "hoogvliet.joint_diff": prepare_hoogvliet_diff,
+}
+
+
+# ---------------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------------
+@contextlib.contextmanager
+def _quiet():
+    """The parsers print a warning per unparseable unit; keep that out of the timings."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def measure(run: Callable[[], Any], ops: int, repeat: int) -> Dict[str, Any]:
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        with _quiet():
+            t0 = time.perf_counter()
+            result = run()
+            times.append(time.perf_counter() - t0)
+        del result
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        with _quiet():
+            result = run()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+
+    best = min(times)
+    return {
+        "ops": ops,
+        "best_s": round(best, 6),
+        "mean_s": round(sum(times) / len(times), 6),
+        "ops_per_s": round(ops / best, 1) if best > 0 else None,
+        "peak_bytes": peak,
+        "bytes_per_op": round(peak / ops, 1) if ops else None,
+    }
+
+
+def run_benchmarks(size: int, names: List[str], repeat: int) -> Dict[str, Any]:
+    results = {}
+    for name in names:
+        with _quiet():
+            run, ops = BENCHMARKS[name](size)
+        results[name] = measure(run, ops, repeat)
+        r = results[name]
+        print(f"{name:<40} {r['ops_per_s']:>14,.0f} ops/s {r['peak_bytes'] / 1024:>12,.0f} KiB {r['bytes_per_op']:>8,.0f} B/op")
+    return results
+
+
+def baseline_path(name_or_path: str) -> str:
+    if name_or_path.endswith(".json") or os.sep in name_or_path:
+        return name_or_path
+    return os.path.join(BASELINE_DIR, f"{name_or_path}.json")
+
+
+def save_baseline(name: str, report: Dict[str, Any]) -> str:
+    path = baseline_path(name)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Print the speed / memory ratio per benchmark; return the names that regressed."""
+    if baseline.get("size") != report["size"]:
+        print(f"[bench] note: baseline size {baseline.get('size')} != {report['size']}")
+    if baseline.get("python") != report["python"]:
+        print(f"[bench] note: baseline python {baseline.get('python')} != {report['python']}")
+
+    regressed = []
+    print(f"\n{'benchmark':<40} {'speed':>8} {'memory':>8}")
+    for name, r in report["results"].items():
+        b = baseline.get("results", {}).get(name)
+        if not b or not b.get("ops_per_s") or not r.get("ops_per_s"):
+            print(f"{name:<40} {'new':>8}")
+            continue
+        speed = r["ops_per_s"] / b["ops_per_s"]
+        memory = r["peak_bytes"] / b["peak_bytes"] if b["peak_bytes"] else float("inf")
+        flag = ""
+        if speed < 1 - threshold or memory > 1 + threshold:
+            flag = "  <-- regression"
+            regressed.append(name)
+        print(f"{name:<40} {speed:>7.2f}x {memory:>7.2f}x{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the scraper hot paths.")
+    parser.add_argument("--size", default="10k", help="10k / 100k / 1m or a number of rows")
+    parser.add_argument("--only", default=None, help="comma-separated substrings of benchmark names")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--save-baseline", metavar="NAME", help="write results to baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare with baselines/NAME.json (or a path)")
+    parser.add_argument("--threshold", type=float, default=0.10, help="regression threshold (0.10 = 10%%)")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--list", action="store_true", help="list the benchmarks and exit")
+    args = parser.parse_args()
+
+    if args.list:
+        print("\n".join(BENCHMARKS))
+        return
+
+    names = list(BENCHMARKS)
+    if args.only:
+        wanted = [w.strip() for w in args.only.split(",") if w.strip()]
+        names = [n for n in names if any(w in n for w in wanted)]
+
+    size = fixtures.parse_size(args.size)
+    print(f"[bench] {len(names)} benchmarks, {size:,} rows, best of {args.repeat}\n")
+
+    report = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "size": size,
+        "repeat": args.repeat,
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()} ({os.cpu_count()} cpus)",
+        "results": run_benchmarks(size, names, args.repeat),
+    }
+
+    if args.save_baseline:
+        print(f"\n[bench] baseline -> {save_baseline(args.save_baseline, report)}")
+
+    if args.compare:
+        with open(baseline_path(args.compare)) as f:
+            baseline = json.load(f)
+        regressed = compare(report, baseline, args.threshold)
+        if regressed and args.fail_on_regression:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Synthetic catalog fixtures for the scraper benchmarks (bench_scrapers.py).
+
+Everything is generated from a seed, so a size always gives the same catalog:
+    ah_products(n)        raw AH product-search JSON (what map_product_to_row gets)
+    dirk_products(n)      raw Dirk GraphQL productAssortment items (map_dirk_product)
+    hoogvliet_items(n)    raw Tweakwise items with BaseUnit / RatioBasePackingUnit attributes
+    unit_strings(n)       messy Dutch unit strings as they come from the three shops
+    db_rows(records)      "existing" Supabase rows for the joint-SKU diff, ~10% changed
+    insert_rows(records)  full insert rows with NaN / numpy values for sanitize_rows
+    product_names(n)      brand + product name texts as they are embedded (bench_embeddings.py)
+
+Dump a fixture to JSONL to look at it or to reuse it elsewhere:
+    python benchmarks/fixtures.py --kind ah --rows 10k --out /tmp/ah_10k.jsonl
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+from datetime import date, timedelta
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+
+
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+
+# Unit strings seen in the AH salesUnitSize / Dirk packaging / Hoogvliet fields.
+UNIT_STRINGS = [
+    "500 g", "1 kg", "250 gram", "1,5 l", "1.5 l", "750 ml", "75 cl", "0,33 l",
+    "6 x 330 ml", "4 x 125 g", "12 x 25 cl", "2 x 1,5 l", "8 × 100 g",
+    "per stuk", "stuk", "1 stuk", "10 stuks", "2 st.", "6 stuks", "4 + 2 stuks",
+    "ca. 115 g", "ca 444 g", "los per 500 g", "per 500 g", "per 100 gram",
+    "1 kg (ca. 5 stuks)", "500 g (ca. 4 stuks)", "2-3 pers | 20 min", "4 pers",
+    "3-pack", "5-pack", "8 rollen", "1 kilo", "20 zakjes", "1 bos", "per bos",
+    "300 gr", "154 gram", "0,75 l", "2 liter", "400g", "1,2 kg", "30 wasbeurten",
+]
+
+# Hoogvliet (BaseUnit, RatioBasePackingUnit) pairs, format_unit turns them into "750 gram" etc.
+HOOGVLIET_UNITS = [
+    ("gram", "750"), ("gram", "250"), ("gram", "1000"), ("stuk", "1"), ("stuk", "6"),
+    ("milliliter", "1500"), ("milliliter", "330"), ("kg", "1.5"), ("l", "1"), ("cl", "75"),
+]
+
+BRANDS = ["AH", "AH Biologisch", "Dirk", "1 de Beste", "Hoogvliet", "Unox", "Calvé", "Verkade",
+          "Douwe Egberts", "Lay's", "Coca-Cola", "Heineken", "Optimel", "Zwan", "Hak", ""]
+
+WORDS = ["halfvolle", "melk", "kaas", "jong", "belegen", "plakken", "appels", "elstar", "kipfilet",
+         "gehakt", "rundergehakt", "volkoren", "brood", "bolletjes", "wit", "pindakaas", "chips",
+         "naturel", "paprika", "yoghurt", "griekse", "tomaten", "cherry", "bananen", "koffie",
+         "bonen", "thee", "rooibos", "pasta", "penne", "rijst", "pandan", "wasmiddel", "color"]
+
+
+def parse_size(size: str | int) -> int:
+    if isinstance(size, int):
+        return size
+    s = size.lower()
+    return SIZES.get(s) or int(s.replace("_", ""))
+
+
+def _name(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5)))
+
+
+def _price(rng: random.Random) -> float:
+    return round(rng.uniform(0.39, 24.99), 2)
+
+
+def _promo(rng: random.Random, today: date):
+    """~20% of products are on promotion: (current_price factor, start, end) or None."""
+    if rng.random() >= 0.2:
+        return None
+    start = today - timedelta(days=rng.randint(0, 6))
+    return rng.choice((0.5, 0.75, 0.8, 0.9)), start.isoformat(), (start + timedelta(days=6)).isoformat()
+
+
+# ---------------------------------------------------------------------------
+# Raw API payloads
+# ---------------------------------------------------------------------------
+def unit_strings(n: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    return [rng.choice(UNIT_STRINGS) for _ in range(n)]
+
+
+def ah_products(n: int, seed: int = 1) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    today = date.today()
+    out = []
+    for i in range(n):
+        brand = rng.choice(BRANDS)
+        price = _price(rng)
+        p = {
+            "webshopId": 100_000 + i,
+            "hqId": 900_000 + i,
+            "title": f"{brand} {_name(rng)}".strip(),
+            "brand": brand or None,
+            "salesUnitSize": rng.choice(UNIT_STRINGS),
+            "priceBeforeBonus": price,
+            "currentPrice": price,
+            "unitPriceDescription": f"prijs per kg €{_price(rng)}",
+            "images": [{"width": 200, "height": 200, "url": f"https://static.ah.nl/{i}.jpg"}],
+            "mainCategory": "Zuivel, eieren",
+            "subCategory": "Melk",
+            "isBonus": False,
+        }
+        promo = _promo(rng, today)
+        if promo:
+            factor, start, end = promo
+            p["currentPrice"] = round(price * factor, 2)
+            p["bonusStartDate"], p["bonusEndDate"] = start, end
+            p["isBonus"] = True
+        out.append(p)
+    return out
+
+
+def dirk_products(n: int, seed: int = 2) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    today = date.today()
+    out = []
+    for i in range(n):
+        price = _price(rng)
+        promo = _promo(rng, today)
+        item = {
+            "productId": 20_000 + i,
+            "normalPrice": price,
+            "offerPrice": 0.0,
+            "isSingleUsePlastic": False,
+            "singleUsePlasticValue": 0,
+            "startDate": None,
+            "endDate": None,
+            "productOffer": None,
+            "productInformation": {
+                "productId": 20_000 + i,
+                "headerText": _name(rng).capitalize(),
+                "subText": "",
+                "packaging": rng.choice(UNIT_STRINGS),
+                "image": f"/{i}.png",
+                "department": "Zuivel",
+                "webgroup": "Melk",
+                "brand": rng.choice(BRANDS) or None,
+            },
+        }
+        if promo:
+            factor, start, end = promo
+            item["offerPrice"] = round(price * factor, 2)
+            item["productOffer"] = {
+                "textPriceSign": "2 voor",
+                "startDate": start,
+                "endDate": end,
+                "disclaimerStartDate": start,
+                "disclaimerEndDate": end,
+            }
+        out.append(item)
+    return out
+
+
+def hoogvliet_items(n: int, seed: int = 3) -> List[Dict[str, Any]]:
+    """Tweakwise items as returned by the search API (before parse_unit_from_attributes)."""
+    rng = random.Random(seed)
+    out = []
+    for i in range(n):
+        base_unit, ratio = rng.choice(HOOGVLIET_UNITS)
+        attributes = [
+            {"name": "BaseUnit", "values": [base_unit]},
+            {"name": "RatioBasePackingUnit", "values": [ratio]},
+            {"name": "Merk", "values": [rng.choice(BRANDS)]},
+        ]
+        if rng.random() < 0.05:
+            attributes = attributes[2:]  # no unit attributes at all
+        out.append(
+            {
+                "itemno": str(700_000_000 + i),
+                "brand": rng.choice(BRANDS) or None,
+                "title": _name(rng).capitalize(),
+                "price": str(_price(rng)),
+                "url": f"/product/{700_000_000 + i}/{_name(rng).replace(' ', '-')}",
+                "attributes": attributes,
+            }
+        )
+    return out
+
+
+# ---------------------------------------------------------------------------
+# Rows for the diff / write paths
+# ---------------------------------------------------------------------------
+def db_rows(records: List[Dict[str, Any]], seed: int = 4, changed: float = 0.1) -> Dict[str, Dict[str, Any]]:
+    """
+    Existing rows keyed by SKU, as fetch_existing_*_rows returns them: the same prices
+    for most products, a changed price or promotion for `changed` of them.
+    """
+    rng = random.Random(seed)
+    old = {}
+    for r in records:
+        sku = str(r["sku"])
+        row = {
+            "sku": sku,
+            "url": r.get("url"),
+            "regular_price": r.get("regular_price"),
+            "current_price": r.get("current_price"),
+            "valid_from": r.get("valid_from"),
+            "valid_to": r.get("valid_to"),
+            "availability": True,
+        }
+        roll = rng.random()
+        if roll < changed / 2:
+            cp = row["current_price"]
+            row["current_price"] = None if cp is None else round(float(cp) + 0.1, 2)
+        elif roll < changed:
+            row["valid_from"] = row["valid_to"] = None
+            row["availability"] = rng.random() < 0.5
+        old[sku] = row
+    return old
+
+
+def insert_rows(records: List[Dict[str, Any]], seed: int = 5) -> List[Dict[str, Any]]:
+    """Full insert rows with the value types sanitize_rows has to clean up."""
+    rng = random.Random(seed)
+    rows = []
+    for r in records:
+        row = dict(r)
+        row["availability"] = True
+        row["product_name_en"] = None
+        roll = rng.random()
+        if roll < 0.1:
+            row["unit_qty"] = float("nan")
+        elif roll < 0.2:
+            row["unit_qty"] = np.float64(row.get("unit_qty") or 1.0)
+        elif roll < 0.25:
+            row["regular_price"] = np.int64(3)
+        rows.append(row)
+    return rows
+
+
+def product_names(n: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    return [f"{rng.choice(BRANDS)} {_name(rng)}".strip() for _ in range(n)]
+
+
+FIXTURES = {
+    "ah": ah_products,
+    "dirk": dirk_products,
+    "hoogvliet": hoogvliet_items,
+    "units": lambda n: [{"unit": u} for u in unit_strings(n)],
+    "names": lambda n: [{"text": t} for t in product_names(n)],
+}
+
+
+def _iter_jsonl(rows) -> Iterator[str]:
+    for r in rows:
+        yield json.dumps(r, ensure_ascii=False, default=str) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic catalog fixture as JSONL.")
+    parser.add_argument("--kind", choices=sorted(FIXTURES), default="ah")
+    parser.add_argument("--rows", default="10k", help="10k / 100k / 1m or a number")
+    parser.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    rows = FIXTURES[args.kind](parse_size(args.rows))
+    with open(args.out, "w", encoding="utf-8") as f:
+        f.writelines(_iter_jsonl(rows))
+    print(f"[fixtures] {len(rows)} {args.kind} rows -> {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,129 @@
-from fastapi import FastAPI
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+import asyncio
+import os
+import threading
+import time
+
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List
 import numpy as np
-from sentence_transformers import SentenceTransformer
 
-app = FastAPI()
+from batcher import MicroBatcher
+from bulk import NDJSON_TYPE, BulkFormatError, encode_window, ndjson_rows, read_texts
+from onnx_encoder import load_encoder
+from query_cache import QueryCache, normalize_text
+
+# ------------------------------
+# Config
+# ------------------------------
+# EMBED_MAX_BATCH     texts encoded together at most (default 64)
+# EMBED_MAX_WAIT_MS   how long a batch waits for more requests (default 5 ms)
+# EMBED_CACHE_SIZE    texts kept in the query LRU cache (default 10000, 0 = off)
+# EMBED_BACKEND       torch (default) | onnx: int8-quantized ONNX Runtime (onnx_encoder.py)
+# MODEL_CACHE_DIR     local safetensors copy of the model (default /data/model-cache with
+#                     persistent storage, else model-cache); the ONNX export goes there too
+# EMBED_READY_TIMEOUT_S  how long /embed waits for the model while starting (default 60)
+# EMBED_BULK_BATCH_SIZE  texts per model call in /embed/bulk, sized for throughput (default 128)
+# EMBED_BULK_WINDOW      texts encoded and streamed back at a time by /embed/bulk (default 2048)
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+MAX_BATCH = int(os.environ.get("EMBED_MAX_BATCH", "64"))
+MAX_WAIT_MS = float(os.environ.get("EMBED_MAX_WAIT_MS", "5"))
+CACHE_SIZE = int(os.environ.get("EMBED_CACHE_SIZE", "10000"))
+READY_TIMEOUT_S = float(os.environ.get("EMBED_READY_TIMEOUT_S", "60"))
+BULK_BATCH_SIZE = int(os.environ.get("EMBED_BULK_BATCH_SIZE", "128"))
+BULK_WINDOW = int(os.environ.get("EMBED_BULK_WINDOW", "2048"))
 
-print("[HF SPACE] loading MiniLM model ...")
-model = SentenceTransformer("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
-print("[HF SPACE] model loaded.")
+CACHE_ROOT = os.environ.setdefault(
+    "MODEL_CACHE_DIR", "/data/model-cache" if os.path.isdir("/data") else "model-cache"
+)
+os.environ.setdefault("ONNX_MODEL_DIR", os.path.join(CACHE_ROOT, "onnx-minilm"))
+
+# Accept: application/octet-stream returns the raw little-endian matrix instead of
+# JSON; "application/octet-stream; dtype=float16" halves it again.
+BINARY_TYPE = "application/octet-stream"
+BINARY_DTYPES = {"float32": "<f4", "float16": "<f2"}
+
+# ------------------------------
+# Model: loaded and warmed up in the background
+# ------------------------------
+# The app answers / right away (liveness); /ready and /embed wait for the model.
+model = None
+startup = {"stage": "starting", "load_s": None, "warmup_s": None, "error": None}
+started = asyncio.Event()      # set when startup is over, whether the model loaded or not
+
+# Representative shapes: a one-word query, a typical product text, a batch of them,
+# and a full batch of long texts, so the first real request finds its kernels ready.
+WARMUP_TEXT = "AH Biologisch halfvolle melk 1 liter"
+WARMUP_SHAPES = [
+    ["melk"],
+    [WARMUP_TEXT],
+    [WARMUP_TEXT] * 8,
+    [" ".join([WARMUP_TEXT] * 12)] * MAX_BATCH,
+]
+
+
+def load_and_warm_up(loop: asyncio.AbstractEventLoop, started: asyncio.Event):
+    global model
+    try:
+        startup["stage"] = "loading"
+        print("[HF SPACE] loading MiniLM model ...")
+        t0 = time.perf_counter()
+        model = load_encoder(MODEL_NAME)
+        startup["load_s"] = round(time.perf_counter() - t0, 2)
+        print(f"[HF SPACE] model loaded in {startup['load_s']} s.")
+
+        startup["stage"] = "warming_up"
+        t0 = time.perf_counter()
+        for texts in WARMUP_SHAPES:
+            encode(texts)
+        startup["warmup_s"] = round(time.perf_counter() - t0, 2)
+        print(f"[HF SPACE] warm-up done in {startup['warmup_s']} s.")
+
+        startup["stage"] = "ready"
+    except Exception as e:
+        startup["stage"] = "failed"
+        startup["error"] = repr(e)
+        print(f"[HF SPACE] ❌ model load failed: {e!r}")
+    finally:
+        loop.call_soon_threadsafe(started.set)
+
+
+def is_ready() -> bool:
+    return startup["stage"] == "ready"
+
+
+def encode(texts: List[str], batch_size: int = MAX_BATCH) -> np.ndarray:
+    return model.encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    ).astype("float32")
+
+
+batcher = MicroBatcher(encode, max_batch=MAX_BATCH, max_wait_ms=MAX_WAIT_MS)
+cache = QueryCache(CACHE_SIZE)
+
+# one bulk window encodes at a time, next to the interactive batches
+bulk_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bulk")
+bulk_stats = {"requests": 0, "texts": 0, "encode_s": 0.0}
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    batcher.start()
+    print(f"[HF SPACE] micro-batching: max {MAX_BATCH} texts, max wait {MAX_WAIT_MS} ms")
+    threading.Thread(
+        target=load_and_warm_up, args=(asyncio.get_running_loop(), started), daemon=True
+    ).start()
+    yield
+    await batcher.stop()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 # ------------------------------
@@ -29,23 +144,133 @@ class EmbedResponse(BaseModel):
 
 @app.get("/")
 def health_check():
-    return {"status": "ok", "detail": "embedding API is running"}
+    # liveness: the process is up; "ready" says whether the model can serve yet
+    return {
+        "status": "ok",
+        "ready": is_ready(),
+        "stage": startup["stage"],
+        "detail": "embedding API is running",
+    }
+
+
+@app.get("/ready")
+def readiness(response: Response):
+    if not is_ready():
+        response.status_code = 503
+    return {"ready": is_ready(), **startup}
+
+
+@app.get("/stats")
+def stats():
+    return {
+        "startup": startup,
+        "batching": batcher.stats(),
+        "cache": cache.stats(),
+        "bulk": {**bulk_stats, "encode_s": round(bulk_stats["encode_s"], 3)},
+    }
+
+
+async def wait_until_ready():
+    if not started.is_set():
+        try:
+            await asyncio.wait_for(started.wait(), READY_TIMEOUT_S)
+        except asyncio.TimeoutError:
+            raise HTTPException(503, f"model not ready ({startup['stage']})")
+    if not is_ready():
+        raise HTTPException(503, f"model failed to load: {startup['error']}")
+
+
+def binary_dtype(accept: str) -> str | None:
+    """float32 / float16 if the client accepts the binary format, else None."""
+    for part in accept.split(","):
+        media, *params = [p.strip() for p in part.split(";")]
+        if media != BINARY_TYPE:
+            continue
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "dtype" and value.strip() in BINARY_DTYPES:
+                return value.strip()
+        return "float32"
+    return None
+
+
+async def embed_texts(texts: List[str]) -> np.ndarray:
+    """Embeddings of `texts` in order: cached ones from the LRU, the rest through the batcher."""
+    normalized = [normalize_text(t) for t in texts]
+    found = cache.get_many(normalized)
+    todo = [t for t in dict.fromkeys(normalized) if t not in found]
+    if todo:
+        # Encoded together with the other requests in flight (batcher.py)
+        fresh = dict(zip(todo, await batcher.embed(todo)))
+        cache.put_many(fresh)
+        found.update(fresh)
+    return np.stack([found[t] for t in normalized])
 
 
 @app.post("/embed", response_model=EmbedResponse)
-def embed(req: EmbedRequest):
+async def embed(req: EmbedRequest, request: Request):
+    dtype = binary_dtype(request.headers.get("accept", ""))
+    await wait_until_ready()
     if not req.texts:
+        if dtype is not None:
+            return Response(b"", media_type=BINARY_TYPE, headers={"X-Embedding-Shape": "0,0", "X-Embedding-Dtype": dtype})
         return {"embeddings": []}
 
-    # Compute embeddings
-    emb = model.encode(
-        req.texts,
-        batch_size=16,
-        convert_to_numpy=True,
-        normalize_embeddings=True,
-    )
+    emb = await embed_texts(req.texts)
+
+    if dtype is not None:
+        return Response(
+            emb.astype(BINARY_DTYPES[dtype]).tobytes(),
+            media_type=BINARY_TYPE,
+            headers={"X-Embedding-Shape": f"{emb.shape[0]},{emb.shape[1]}", "X-Embedding-Dtype": dtype},
+        )
 
     # Convert to python lists
-    emb_list = emb.astype("float32").tolist()
+    emb_list = emb.tolist()
 
     return {"embeddings": emb_list}
+
+
+def _encode_window_timed(texts: List[str]) -> np.ndarray:
+    t0 = time.perf_counter()
+    emb = encode_window(encode, texts, BULK_BATCH_SIZE)
+    bulk_stats["encode_s"] += time.perf_counter() - t0
+    return emb
+
+
+@app.post("/embed/bulk")
+async def embed_bulk(request: Request):
+    """Many texts in one NDJSON / length-prefixed stream, embeddings streamed back in order (bulk.py)."""
+    dtype = binary_dtype(request.headers.get("accept", ""))
+    await wait_until_ready()
+    try:
+        texts = await read_texts(request.headers.get("content-type", ""), request.stream())
+    except BulkFormatError as e:
+        raise HTTPException(400, str(e))
+    bulk_stats["requests"] += 1
+    bulk_stats["texts"] += len(texts)
+
+    loop = asyncio.get_running_loop()
+    windows = range(0, len(texts), BULK_WINDOW)
+
+    def serialize(emb: np.ndarray, start: int) -> bytes:
+        if dtype is not None:
+            return emb.astype(BINARY_DTYPES[dtype]).tobytes()
+        return ndjson_rows(emb, start)
+
+    async def stream():
+        # the next window encodes while the current one is serialized and sent
+        pending = None
+        for start in windows:
+            fut = loop.run_in_executor(bulk_executor, _encode_window_timed, texts[start:start + BULK_WINDOW])
+            if pending is not None:
+                yield serialize(await pending[0], pending[1])
+            pending = (fut, start)
+        if pending is not None:
+            yield serialize(await pending[0], pending[1])
+
+    headers = {"X-Embedding-Count": str(len(texts))}
+    if dtype is not None:
+        headers["X-Embedding-Dtype"] = dtype
+        return StreamingResponse(stream(), media_type=BINARY_TYPE, headers=headers)
+    return StreamingResponse(stream(), media_type=NDJSON_TYPE, headers=headers)
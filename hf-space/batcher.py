@@ -0,0 +1,159 @@
+"""
+Dynamic micro-batching for /embed.
+
+Every search request embeds one query. Encoded one request at a time, concurrent
+requests each pay a full model call for a batch of one. MicroBatcher puts the
+requests on an asyncio queue; a single collector task takes what is waiting (up to
+max_batch texts, waiting at most max_wait_ms for more to arrive), encodes it as one
+batch in a worker thread and hands every request its own slice of the result.
+
+While a batch is encoding, new requests queue up and form the next batch, so the
+batches grow with the load on their own.
+"""
+from __future__ import annotations
+
+import asyncio
+import time
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+
+class Histogram:
+    """Counts per power-of-two bucket (bucket b holds values <= b)."""
+
+    def __init__(self, max_value: int):
+        self.buckets = [1]
+        while self.buckets[-1] < max_value:
+            self.buckets.append(self.buckets[-1] * 2)
+        self.counts = [0] * (len(self.buckets) + 1)   # last one: > max_value
+        self.total = 0
+        self.n = 0
+
+    def add(self, value: int):
+        for i, b in enumerate(self.buckets):
+            if value <= b:
+                self.counts[i] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.n += 1
+
+    def snapshot(self) -> Dict:
+        labels = [f"<={b}" for b in self.buckets] + [f">{self.buckets[-1]}"]
+        return {
+            "count": self.n,
+            "mean": round(self.total / self.n, 2) if self.n else None,
+            "buckets": {label: c for label, c in zip(labels, self.counts) if c},
+        }
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        encode_fn: Callable[[List[str]], np.ndarray],
+        max_batch: int = 64,
+        max_wait_ms: float = 5.0,
+    ):
+        self.encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._carry: Tuple[List[str], asyncio.Future] | None = None   # did not fit the last batch
+
+        self.batch_sizes = Histogram(max_batch)        # texts per model call
+        self.queue_depths = Histogram(1024)            # requests waiting when a batch is cut
+        self.batches = 0
+        self.texts = 0
+        self.encode_s = 0.0
+
+    # ----- lifecycle (app lifespan) -----
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    # ----- requests -----
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Embeddings of `texts` (one row per text), encoded together with whatever else is queued."""
+        if not texts:
+            return np.zeros((0, 0), dtype="float32")
+        fut = asyncio.get_running_loop().create_future()
+        await self._queue.put((texts, fut))
+        return await fut
+
+    # ----- collector -----
+    async def _next_batch(self) -> List[Tuple[List[str], asyncio.Future]]:
+        if self._carry is not None:
+            first, self._carry = self._carry, None
+        else:
+            first = await self._queue.get()
+        batch, size = [first], len(first[0])
+        deadline = time.monotonic() + self.max_wait
+
+        while size < self.max_batch:
+            try:
+                item = self._queue.get_nowait()
+            except asyncio.QueueEmpty:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            if size + len(item[0]) > self.max_batch:
+                self._carry = item      # opens the next batch
+                break
+            batch.append(item)
+            size += len(item[0])
+        return batch
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            self.queue_depths.add(len(batch) + self._queue.qsize())
+
+            texts = [t for item_texts, _ in batch for t in item_texts]
+            self.batch_sizes.add(len(texts))
+            t0 = time.perf_counter()
+            try:
+                emb = await loop.run_in_executor(None, self.encode_fn, texts)
+            except Exception as e:
+                for _, fut in batch:
+                    if not fut.done():
+                        fut.set_exception(e)
+                continue
+            finally:
+                self.encode_s += time.perf_counter() - t0
+            self.batches += 1
+            self.texts += len(texts)
+
+            start = 0
+            for item_texts, fut in batch:
+                if not fut.done():      # the client may have gone away
+                    fut.set_result(emb[start:start + len(item_texts)])
+                start += len(item_texts)
+
+    def stats(self) -> Dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000.0,
+            "queue_depth_now": self._queue.qsize() if self._queue is not None else 0,
+            "batches": self.batches,
+            "texts": self.texts,
+            "encode_s": round(self.encode_s, 3),
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_depth": self.queue_depths.snapshot(),
+        }
@@ -0,0 +1,118 @@
+"""
+Bulk embedding for backfills: POST /embed/bulk.
+
+Request body, one of (Content-Type):
+    application/x-ndjson             one text per line, as a JSON string or {"text": ...}
+    application/x-length-prefixed    repeated [uint32 big-endian byte length][utf-8 text]
+
+The texts are encoded in windows of `window` texts. Inside a window they are sorted
+by length and cut into batches of `batch_size`, so every batch pads to about the same
+length. A window is written out, in input order, as soon as it is encoded, while the
+next one starts:
+    Accept: application/octet-stream[; dtype=float16]   raw little-endian rows
+    otherwise                                           NDJSON {"i": n, "embedding": [...]}
+
+Bulk requests skip the micro-batcher and the query cache: they bring their own big
+batches, and product texts would only push the popular queries out of the LRU.
+"""
+from __future__ import annotations
+
+import json
+import struct
+from typing import AsyncIterator, Callable, List
+
+import numpy as np
+
+NDJSON_TYPE = "application/x-ndjson"
+LENGTH_PREFIXED_TYPE = "application/x-length-prefixed"
+
+
+class BulkFormatError(ValueError):
+    pass
+
+
+# ------------------------------
+# Request parsing (incremental, as the body arrives)
+# ------------------------------
+async def read_ndjson(chunks: AsyncIterator[bytes]) -> List[str]:
+    texts: List[str] = []
+    buf = b""
+
+    def parse(line: bytes):
+        line = line.strip()
+        if not line:
+            return
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            raise BulkFormatError(f"line {len(texts) + 1}: {e}")
+        text = item.get("text") if isinstance(item, dict) else item
+        if not isinstance(text, str):
+            raise BulkFormatError(f"line {len(texts) + 1}: expected a string or {{\"text\": ...}}")
+        texts.append(text)
+
+    async for chunk in chunks:
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            parse(line)
+    parse(buf)
+    return texts
+
+
+async def read_length_prefixed(chunks: AsyncIterator[bytes]) -> List[str]:
+    texts: List[str] = []
+    buf = bytearray()
+    pos = 0
+    async for chunk in chunks:
+        buf += chunk
+        while len(buf) - pos >= 4:
+            (n,) = struct.unpack_from(">I", buf, pos)
+            if len(buf) - pos - 4 < n:
+                break
+            try:
+                texts.append(bytes(buf[pos + 4:pos + 4 + n]).decode("utf-8"))
+            except UnicodeDecodeError as e:
+                raise BulkFormatError(f"text {len(texts) + 1}: {e}")
+            pos += 4 + n
+        if pos > 1 << 20:           # drop what is parsed, keep the buffer small
+            del buf[:pos]
+            pos = 0
+    if pos != len(buf):
+        raise BulkFormatError(f"{len(buf) - pos} trailing bytes after text {len(texts)}")
+    return texts
+
+
+async def read_texts(content_type: str, chunks: AsyncIterator[bytes]) -> List[str]:
+    media = content_type.split(";")[0].strip()
+    if media == NDJSON_TYPE:
+        return await read_ndjson(chunks)
+    if media == LENGTH_PREFIXED_TYPE:
+        return await read_length_prefixed(chunks)
+    raise BulkFormatError(f"Content-Type must be {NDJSON_TYPE} or {LENGTH_PREFIXED_TYPE}, not {media!r}")
+
+
+# ------------------------------
+# Encoding
+# ------------------------------
+def encode_window(
+    encode_fn: Callable[[List[str], int], np.ndarray],
+    texts: List[str],
+    batch_size: int,
+) -> np.ndarray:
+    """Embeddings of `texts` in input order, encoded in length buckets of batch_size."""
+    order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+    out = None
+    for start in range(0, len(order), batch_size):
+        idx = order[start:start + batch_size]
+        emb = encode_fn([texts[i] for i in idx], batch_size)
+        if out is None:
+            out = np.empty((len(texts), emb.shape[1]), dtype="float32")
+        out[idx] = emb
+    return out
+
+
+def ndjson_rows(emb: np.ndarray, first: int) -> bytes:
+    return "".join(
+        json.dumps({"i": first + k, "embedding": row}) + "\n" for k, row in enumerate(emb.tolist())
+    ).encode("utf-8")
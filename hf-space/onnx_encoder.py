@@ -0,0 +1,214 @@
+"""
+ONNX Runtime backend for the MiniLM embedder, int8-quantized for CPU.
+
+The sentence-transformers model (paraphrase-multilingual-MiniLM-L12-v2) is exported
+once to ONNX, its weights are dynamically quantized to int8 (onnxruntime.quantization),
+and OnnxEncoder runs it with onnxruntime + the fast Rust tokenizer. Mean pooling and
+normalization are done in numpy, the same as the sentence-transformers pipeline, so
+the vectors stay comparable with the float32 ones already in the database
+(benchmarks/bench_embeddings.py measures how close they are).
+
+    python scrapers/onnx_encoder.py export --out onnx-minilm      # needs torch once
+    EMBED_BACKEND=onnx ONNX_MODEL_DIR=onnx-minilm python ...       # torch not needed
+
+load_encoder() is what the model users call (backend/embed_existing_products.py,
+embedder.LocalEmbedder, hf-space/app.py). It returns an object with the
+SentenceTransformer.encode() signature for either backend:
+
+    EMBED_BACKEND    torch (default) | onnx
+    MODEL_CACHE_DIR  torch: keep a local safetensors copy of the model here and load
+                     from it (memory-mapped, no hub round trips) on the next start
+    ONNX_MODEL_DIR   exported model directory (default onnx-minilm); exported on first
+                     use if it does not exist yet
+    ONNX_QUANTIZED   1 (default) runs model_int8.onnx, 0 the float32 export
+
+Copy of scrapers/onnx_encoder.py (the space is deployed on its own); keep them in sync.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+from typing import List
+
+import numpy as np
+
+
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+DEFAULT_DIR = "onnx-minilm"
+FP32_FILE = "model.onnx"
+INT8_FILE = "model_int8.onnx"
+
+
+# ---------------------------------------------------------------------------
+# Export (torch + sentence-transformers, once)
+# ---------------------------------------------------------------------------
+def export(model_name: str = MODEL_NAME, out_dir: str = DEFAULT_DIR, quantize: bool = True) -> str:
+    """Export the transformer of `model_name` to out_dir (+ int8 copy); returns out_dir."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    os.makedirs(out_dir, exist_ok=True)
+    st = SentenceTransformer(model_name, device="cpu")
+    transformer = st[0].auto_model.eval()
+    tokenizer = st.tokenizer
+
+    print(f"[onnx] exporting {model_name} -> {out_dir}")
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    fp32_path = os.path.join(out_dir, FP32_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            transformer,
+            (sample["input_ids"], sample["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["last_hidden_state"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "seq"},
+                "attention_mask": {0: "batch", 1: "seq"},
+                "last_hidden_state": {0: "batch", 1: "seq"},
+            },
+            opset_version=14,
+        )
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        print("[onnx] quantizing weights to int8")
+        quantize_dynamic(fp32_path, os.path.join(out_dir, INT8_FILE), weight_type=QuantType.QInt8)
+
+    tokenizer.save_pretrained(out_dir)
+    with open(os.path.join(out_dir, "encoder.json"), "w") as f:
+        json.dump({
+            "model_name": model_name,
+            "max_seq_length": st.max_seq_length,
+            "pad_token": tokenizer.pad_token,
+            "pad_token_id": tokenizer.pad_token_id,
+            "quantized": quantize,
+        }, f, indent=2)
+    print(f"[onnx] done: {sorted(os.listdir(out_dir))}")
+    return out_dir
+
+
+# ---------------------------------------------------------------------------
+# Inference (onnxruntime + tokenizers, no torch)
+# ---------------------------------------------------------------------------
+class OnnxEncoder:
+    def __init__(self, model_dir: str = DEFAULT_DIR, quantized: bool = True, threads: int | None = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, "encoder.json")) as f:
+            meta = json.load(f)
+        self.model_name = meta["model_name"]
+        self.max_seq_length = meta["max_seq_length"]
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.max_seq_length)
+        self.tokenizer.enable_padding(pad_id=meta["pad_token_id"], pad_token=meta["pad_token"])
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            opts.intra_op_num_threads = threads
+        path = os.path.join(model_dir, INT8_FILE if quantized else FP32_FILE)
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.path = path
+
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encoded = self.tokenizer.encode_batch(texts)
+        ids = np.asarray([e.ids for e in encoded], dtype="int64")
+        mask = np.asarray([e.attention_mask for e in encoded], dtype="int64")
+        hidden = self.session.run(None, {"input_ids": ids, "attention_mask": mask})[0]
+        # mean pooling over the real tokens, as the sentence-transformers Pooling module
+        m = mask[:, :, None].astype("float32")
+        return (hidden * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+
+    def encode(
+        self,
+        texts: List[str],
+        batch_size: int = 32,
+        normalize_embeddings: bool = False,
+        **_kwargs,
+    ) -> np.ndarray:
+        """SentenceTransformer.encode() for lists: a float32 matrix in input order."""
+        if not texts:
+            return np.zeros((0, 0), dtype="float32")
+        # length-sorted batches pad less
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        out = None
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            emb = self._encode_batch([texts[i] for i in idx])
+            if out is None:
+                out = np.empty((len(texts), emb.shape[1]), dtype="float32")
+            out[idx] = emb
+        if normalize_embeddings:
+            out /= np.clip(np.linalg.norm(out, axis=1, keepdims=True), 1e-12, None)
+        return out
+
+
+def ensure_export(model_name: str = MODEL_NAME) -> str:
+    """ONNX_MODEL_DIR, exported first if it is not there yet."""
+    model_dir = os.environ.get("ONNX_MODEL_DIR", DEFAULT_DIR)
+    if not os.path.exists(os.path.join(model_dir, "encoder.json")):
+        export(model_name, model_dir, quantize=os.environ.get("ONNX_QUANTIZED", "1") != "0")
+    return model_dir
+
+
+def load_sentence_transformer(model_name: str = MODEL_NAME, cache_dir: str | None = None):
+    """
+    SentenceTransformer(model_name), through a local copy in cache_dir if given. The
+    copy is saved as safetensors, which load memory-mapped instead of unpickled.
+    """
+    from sentence_transformers import SentenceTransformer
+
+    if not cache_dir:
+        return SentenceTransformer(model_name)
+    local = os.path.join(cache_dir, model_name.replace("/", "__"))
+    if os.path.exists(os.path.join(local, "modules.json")):
+        return SentenceTransformer(local)
+
+    st = SentenceTransformer(model_name)
+    tmp = local + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    st.save(tmp, safe_serialization=True)
+    os.replace(tmp, local)
+    print(f"[model] saved {model_name} -> {local}")
+    return st
+
+
+def load_encoder(model_name: str = MODEL_NAME, backend: str | None = None, threads: int | None = None):
+    """SentenceTransformer (torch) or OnnxEncoder, picked by EMBED_BACKEND."""
+    backend = (backend or os.environ.get("EMBED_BACKEND") or "torch").lower()
+    if backend == "torch":
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        return load_sentence_transformer(model_name, os.environ.get("MODEL_CACHE_DIR"))
+    if backend == "onnx":
+        model_dir = ensure_export(model_name)
+        quantized = os.environ.get("ONNX_QUANTIZED", "1") != "0"
+        encoder = OnnxEncoder(model_dir, quantized=quantized, threads=threads)
+        if encoder.model_name != model_name:
+            raise ValueError(f"{model_dir} holds {encoder.model_name}, not {model_name}")
+        print(f"[onnx] {encoder.path}")
+        return encoder
+    raise ValueError(f"EMBED_BACKEND must be torch or onnx, not {backend!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the embedding model to (int8) ONNX.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("export")
+    p.add_argument("--model", default=MODEL_NAME)
+    p.add_argument("--out", default=os.environ.get("ONNX_MODEL_DIR", DEFAULT_DIR))
+    p.add_argument("--no-quantize", action="store_true")
+    args = parser.parse_args()
+
+    if args.cmd == "export":
+        export(args.model, args.out, quantize=not args.no_quantize)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Bounded LRU cache of text -> embedding inside the service.
+
+Search queries are short and repeat a lot ("melk", "kipfilet", "bananen"), so the
+popular ones are answered from memory without a model call. Keys are normalized the
+same way as scrapers/embedding_cache.py (NFKC, collapsed whitespace, case kept), and
+the model is given the normalized text, so a hit returns exactly what a miss would.
+"""
+from __future__ import annotations
+
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, List
+
+import numpy as np
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _SPACES.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+class QueryCache:
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        """text -> vector for the (normalized) texts in the cache; counts hits and misses."""
+        found: Dict[str, np.ndarray] = {}
+        with self._lock:
+            for t in texts:
+                vec = self._data.get(t)
+                if vec is None:
+                    self.misses += 1
+                    continue
+                self._data.move_to_end(t)
+                found[t] = vec
+                self.hits += 1
+        return found
+
+    def put_many(self, vectors: Dict[str, np.ndarray]):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            for t, vec in vectors.items():
+                # a row of the batch matrix is a view that would keep the whole batch alive
+                self._data[t] = vec.copy()
+                self._data.move_to_end(t)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def stats(self) -> Dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else None,
+        }
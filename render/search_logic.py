@@ -4,6 +4,7 @@ import numpy as np
 import json
 
 from supabase_utils import get_supabase
+from embedding_codec import unpack
 import os
 
 HF_SPACE_URL = os.getenv("HF_EMBEDDING_URL")
@@ -12,10 +13,21 @@ HF_SPACE_URL = os.getenv("HF_EMBEDDING_URL")
 # -----------------------------
 # Call HF Space for embedding
 # -----------------------------
+# Ask for the raw float32 matrix (hf-space /embed content negotiation);
+# a JSON answer (older deployment) is still understood.
+EMBED_ACCEPT = "application/octet-stream; dtype=float32, application/json;q=0.5"
+BINARY_DTYPES = {"float32": "<f4", "float16": "<f2"}
+
+_session = requests.Session()
+
+
 def get_embedding_from_hf(text: str) -> np.ndarray:
     payload = {"texts": [text]}
-    resp = requests.post(HF_SPACE_URL, json=payload, timeout=30)
+    resp = _session.post(HF_SPACE_URL, json=payload, headers={"Accept": EMBED_ACCEPT}, timeout=30)
     resp.raise_for_status()
+    if resp.headers.get("content-type", "").startswith("application/octet-stream"):
+        dtype = BINARY_DTYPES[resp.headers.get("x-embedding-dtype", "float32")]
+        return np.frombuffer(resp.content, dtype=dtype).astype("float32")
     data = resp.json()
     emb = data["embeddings"][0]
     return np.asarray(emb, dtype="float32")
@@ -76,8 +88,10 @@ def search_one_product(
 
     scored = []
     for r in rows:
-        emb = r.get("embedding_du")
-        v = parse_embedding(emb)
+        # embedding_packed is one base64 decode + np.frombuffer (embedding_codec.py);
+        # search_products_ts only sends embedding_du for rows not packed yet
+        packed = r.get("embedding_packed")
+        v = unpack(packed) if packed else parse_embedding(r.get("embedding_du"))
         if v is None:
             continue
         
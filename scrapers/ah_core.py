@@ -1,159 +1,42 @@
 from __future__ import annotations
 
 import re
+import threading
 import time
 from datetime import date
 
 import pandas as pd
 import requests
-from deep_translator import GoogleTranslator
 from datetime import date, datetime
 
-from supabase_utils import get_supabase, upsert_rows
+from chain_adapter import (
+    AH_UNIT_RULES,
+    ChainAdapter,
+    build_full_insert_row,
+    build_price_update_row,
+    normalize_date,
+    normalize_price,
+    translate_cached,
+)
+from supabase_utils import get_supabase, write_rows
+from pipeline import run_streaming_refresh
+from product_record import ProductRecord
+from snapshots import SNAPSHOTS
+from telemetry import TELEMETRY
 from typing import List, Dict, Any
 
 import time
 import requests
 import pandas as pd
 from datetime import datetime, date
-from typing import Dict, Any, List, Set
-
-# ---------------------------------------------------------------------------
-# Translation
-# ---------------------------------------------------------------------------
-
-translation_cache = {}
-
-def translate_cached(text):
-    """
-    Translate a Dutch product name to English using GoogleTranslator, with an in-memory cache.
-
-    Returns None if text is None or translation fails.
-    """
-    if not text:
-        return None
-    
-    if text in translation_cache:
-        return translation_cache[text]
-
-    try:
-        en = GoogleTranslator(source='nl', target='en').translate(text)
-        translation_cache[text] = en
-        return en
-    except Exception as e:
-        print(f"[translate_product_names] Translation failed for: {text} | Reason: {e}")
-        return None
-    
+from typing import Dict, Any, Iterator, List, Set
 
 # ---------------------------------------------------------------------------
 # Unit parsing
 # ---------------------------------------------------------------------------
-def handle_normalized(unit_text): 
-    """
-    Converts the normalized format of unit (e g. 205 g, 290kg) into (unit_qty, unit_type),
-    with unit_type ∈ {"kg", "l", "piece"}.
-    """
-    m = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]+)", unit_text)
-    if not m:
-        print("[WARN] cannot parse:", unit_text)
-        return None, None
-    
-    unit_qty = float(m.group(1))   
-    unit_type = m.group(2)
-
-    if unit_type in ("g","gram", "gr"): # "500 gr"," 154 gram"
-        return unit_qty / 1000.0, "kg"
-    if unit_type in ("kg", "kilo"):
-        return unit_qty, "kg"
-    if unit_type == "ml":
-        return unit_qty / 1000.0, "l"
-    if unit_type == "cl":
-        return unit_qty / 100.0, "l"
-    if unit_type == "l":
-        return unit_qty, "l"    
-    
-    return unit_qty, "piece"
-
-
 def parse_unit(unit_text: str):
-    """
-    Converts messy Dutch unit strings into (unit_qty, unit_type)
-        - Converts messy unit into normalized unit first, so the function "handle_normalized" can handle it.
-    unit_type ∈ {"kg", "l", "piece"} or (None, None) if unknown.
-    """
-    if pd.isna(unit_text):
-        return None, None
-
-    s = unit_text.strip().lower()
-    s = s.replace(",", ".")
-    s = s.replace("×", "x")
-    s = s.replace("stuks", "stuk")
-    s = s.replace("st.", "stuk")
-    s = s.replace("-"," ")           # "5-pack" -> "5 pack"
-    s = s.replace("ca. ", "")        # "ca. 115 g" -> "115 g"
-    s = s.replace("ca ", "")        # "ca 444 g" -> "444 g"
-    s = s.replace("los per ", "")    # "loose per 500 g" -> "500 g"
-
-    # "2-3 pers | 20 min" -> "2-3 pers"
-    if "|" in s:
-        s = s.split("|", 1)[0].strip()
-    if re.search(r"\bpers(?:oon|onen)?\b", s):
-        return 1, "piece"
-    
-    s = re.sub(r"^\s*per\s+", "", s) # "per 500 g" -> "g", "per stuk" -> "stuk"
-    s = s.split("(")[0].strip()      # Extract everything before the first left parenthese "1 kg (ca. 5 stuk)"
-
-    # "stuk" -> "1 stuk"
-    if not any(i.isdigit() for i in s): 
-        s = "1 " + s
-
-    # "6 x 250 g" -> "1500 g"
-    m = re.match(r"(\d+)\s*x\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]+)", s)
-    if m:
-        count = float(m.group(1))
-        size = float(m.group(2))
-        unit_type = m.group(3).split()[0] # eg. "6 x 250 g appel" -> drop "appel"
-        unit_qty = size * count
-        s = str(unit_qty) + unit_type
-
-    # "4 + 2 stuks" -> "6 stuks"
-    m = re.match(r"(\d+(?:\.\d+)?)\s*\+\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]+)", s)
-    if m:
-        unit_qty = float(m.group(1)) + float(m.group(2))
-        unit_type = m.group(3).split()[0]
-        s = str(unit_qty) + unit_type
-
-    # "2-3 pers|20 min" -> "1 stuck"
-    m = re.match(r"(\d+(?:\.\d+)?)\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]+)", s)
-    
-    return(handle_normalized(s))   
-
-
-# ---------------------------------------------------------------------------
-# Normalize the price and date for refresh
-# ---------------------------------------------------------------------------
-def normalize_price(v):
-    """
-    Normalize price to float or None for comparison.
-    - In scrapper: current_price = f"0.{price_large_tag.get_text(strip=True)}". This is a string.
-    - In supabse: current_price is stored as float8
-    - To compare them, we need to normalize into float. 
-    """
-    if v is None:
-        return None
-    return float(v) 
-
-
-def normalize_date(v):
-    """Convert date/datetime to ISO string for comparison; keep None as None.
-    - In scrapper: date(2025, 11, 4)
-    - In supabse: "2025-11-04"
-    """
-    if v is None:
-        return None
-    if isinstance(v, (date, datetime)):
-        return v.isoformat()
-    return str(v)
+    """Unit text -> (unit_qty, unit_type) with the AH rules (ADAPTER.unit_rules)."""
+    return ADAPTER.parse_unit(unit_text)
 
 
 # ---------------------------------------------------------------------------
@@ -185,6 +68,26 @@ def get_access_token() -> str:
     return data["access_token"]
 
 
+# The token expires (expires_in ~2 h), so work units never carry it: the fetch stage
+# takes it from this per-process cache and fetches a new one when AH answers 401.
+TOKEN_TTL_S = 3600
+_token_lock = threading.Lock()
+_token: Dict[str, Any] = {"value": None, "fetched_at": 0.0}
+
+
+def cached_access_token(stale: str | None = None) -> str:
+    """
+    The cached anonymous token, fetched again after TOKEN_TTL_S or when `stale` (a
+    token that just got a 401) is still the cached one.
+    """
+    with _token_lock:
+        expired = time.monotonic() - _token["fetched_at"] > TOKEN_TTL_S
+        if _token["value"] is None or expired or _token["value"] == stale:
+            _token["value"] = get_access_token()
+            _token["fetched_at"] = time.monotonic()
+        return _token["value"]
+
+
 def get_root_categories(access_token: str) -> List[Dict[str, Any]]:
     """
     Top-level categories, e.g. 'Aardappel, groente, fruit', 'Vlees', etc.
@@ -349,62 +252,91 @@ def search_products_by_taxonomy(
     resp.raise_for_status()
     return resp.json()
 
-def fetch_all_products_via_taxonomies(
+def iter_taxonomy_products(
+    access_token: str,
+    taxonomy_id: int,
+    page_size: int = 100,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the raw products of one taxonomyId, page by page.
+    """
+    page = 0
+
+    while True:
+        data = search_products_by_taxonomy(
+            access_token, taxonomy_id=taxonomy_id, page=page, size=page_size
+        )
+        if not data:
+            break
+
+        page_info = data.get("page") or {}
+        total_pages = page_info.get("totalPages", page + 1)
+
+        products = data.get("products") or []
+        if not products:
+            break
+
+        print(
+            f"  [AH taxonomy] tid={taxonomy_id} page {page+1}/{total_pages}, "
+            f"products on this page={len(products)}"
+        )
+        yield from products
+
+        page += 1
+        if page >= total_pages:
+            break
+
+        time.sleep(0.03)
+
+
+def iter_products_via_taxonomies(
     access_token: str,
     page_size: int = 100,
     max_taxonomies: int | None = None,
-) -> List[Dict[str, Any]]:
+) -> Iterator[Dict[str, Any]]:
     """
-    Enumerate *all* products by walking all taxonomyIds (categories + subcategories).
+    Walk all taxonomyIds and yield every product the first time its webshopId is seen.
+    Only the set of seen webshopIds is kept in memory.
     """
     taxonomy_ids = sorted(collect_all_taxonomy_ids(access_token))
     if max_taxonomies is not None:
         taxonomy_ids = taxonomy_ids[:max_taxonomies]
 
-    all_products_by_id: Dict[int, Dict[str, Any]] = {}
+    seen_ids: Set[int] = set()
 
     for idx, tid in enumerate(taxonomy_ids, start=1):
         print(f"\n[AH taxonomy] ({idx}/{len(taxonomy_ids)}) taxonomyId={tid}")
-        page = 0
 
-        while True:
-            data = search_products_by_taxonomy(
-                access_token, taxonomy_id=tid, page=page, size=page_size
-            )
-            if not data:
-                break
+        for p in iter_taxonomy_products(access_token, tid, page_size=page_size):
+            wid = p.get("webshopId")
+            if wid is None or wid in seen_ids:
+                continue
+            seen_ids.add(wid)
+            yield p
 
-            page_info = data.get("page") or {}
-            total_pages = page_info.get("totalPages", page + 1)
+    print(f"\n[AH] total unique products collected via taxonomy: {len(seen_ids)}")
 
-            products = data.get("products") or []
-            if not products:
-                break
 
-            for p in products:
-                wid = p.get("webshopId")
-                if wid is not None and wid not in all_products_by_id:
-                    all_products_by_id[wid] = p
-
-            collected = len(all_products_by_id)
-            print(
-                f"  [AH taxonomy] tid={tid} page {page+1}/{total_pages}, "
-                f"products on this page={len(products)}, unique collected={collected}"
-            )
-
-            page += 1
-            if page >= total_pages:
-                break
-
-            time.sleep(0.03)  
-
-    print(f"\n[AH] total unique products collected via taxonomy: {len(all_products_by_id)}")
-    return list(all_products_by_id.values())
+def fetch_all_products_via_taxonomies(
+    access_token: str,
+    page_size: int = 100,
+    max_taxonomies: int | None = None,
+) -> List[ProductRecord]:
+    """
+    Enumerate *all* products by walking all taxonomyIds (categories + subcategories).
+    Each raw product is mapped to a ProductRecord as soon as its page arrives.
+    """
+    return [
+        map_product_to_row(p)
+        for p in iter_products_via_taxonomies(
+            access_token, page_size=page_size, max_taxonomies=max_taxonomies
+        )
+    ]
 
 
-def map_product_to_row(p: Dict[str, Any]) -> Dict[str, Any]:
+def map_product_to_row(p: Dict[str, Any]) -> ProductRecord:
     """
-    Map raw AH product JSON -> one row in DataFrame.
+    Map raw AH product JSON -> one compact ProductRecord (one row in DataFrame).
     """
     wid = p.get("webshopId")
     url = f"https://www.ah.nl/producten/product/wi{wid}" if wid is not None else None
@@ -441,39 +373,123 @@ def map_product_to_row(p: Dict[str, Any]) -> Dict[str, Any]:
     
     
 
-    return {
-        "sku": wid,
-        "url": url,
-        "product_name_du": product_name_du,
-        "unit_du": unit_du,
-        "unit_type_en": unit_type_en,
-        "unit_qty": unit_qty,
-        "regular_price": regular_price,
-        "current_price": current_price,
-        "valid_from": valid_from,
-        "valid_to": valid_to,
-        "brand": brand,
-    }
+    return ProductRecord(
+        sku=wid,
+        url=url,
+        product_name_du=product_name_du,
+        unit_du=unit_du,
+        unit_type_en=unit_type_en,
+        unit_qty=unit_qty,
+        regular_price=regular_price,
+        current_price=current_price,
+        valid_from=valid_from,
+        valid_to=valid_to,
+        brand=brand,
+    )
+
+
+def iter_ah_products(
+    page_size: int = 100,
+    max_taxonomies: int | None = None,
+) -> Iterator[ProductRecord]:
+    """
+    Stream mapped AH rows as the taxonomy pages come in.
+    """
+    token = get_access_token()
+    for p in iter_products_via_taxonomies(
+        token,
+        page_size=page_size,
+        max_taxonomies=max_taxonomies,
+    ):
+        yield map_product_to_row(p)
 
 
 def fetch_all_ah_products(
     page_size: int = 100,
     max_taxonomies: int | None = None,
-):
+) -> List[ProductRecord]:
     token = get_access_token()
-    products = fetch_all_products_via_taxonomies(
+    return fetch_all_products_via_taxonomies(
         token,
         page_size=page_size,
         max_taxonomies=max_taxonomies,
     )
-    rows = [map_product_to_row(p) for p in products]
-    return rows
 
 
 # ---------------------------------------------------------------------------
 # Daily refresh for AH
 # ---------------------------------------------------------------------------
-def refresh_ah_daily():
+# joint_skus: price / promo diff shared by the chains (chain_adapter.py)
+build_update_row = build_price_update_row
+
+
+def build_insert_row(
+    sku: str,
+    new: Dict[str, Any],
+    translate: bool = True,
+) -> Dict[str, Any] | None:
+    """
+    add_skus: brand-new product with full info (url, names, unit, brand, prices, etc.)
+    translate=False leaves product_name_en empty for the engine's translate stage.
+    """
+    return build_full_insert_row(sku, new, translate=translate)
+
+
+def fetch_existing_ah_rows() -> Dict[str, Dict[str, Any]]:
+    supabase = get_supabase()
+    resp = supabase.table("ah").select(
+        "sku, url, product_name_du, product_name_en, unit_du, unit_qty, unit_type_en, "
+        "regular_price, current_price, valid_from, valid_to, brand, availability"
+    ).execute()
+    old_rows = resp.data or []
+    return {str(r["sku"]): r for r in old_rows if r.get("sku") is not None}
+
+
+# ---------------------------------------------------------------------------
+# Chain adapter (chain_adapter.py) for orchestrator.py / crawl_worker.py
+# ---------------------------------------------------------------------------
+def fetch_unit(tid: int) -> List[Dict[str, Any]]:
+    """fetch stage: all raw products of one taxonomyId (token from cached_access_token)."""
+    token = cached_access_token()
+    try:
+        return list(iter_taxonomy_products(token, tid))
+    except requests.HTTPError as e:
+        if e.response is None or e.response.status_code != 401:
+            raise
+        print(f"[AH] 401 for taxonomyId={tid}, fetching a new token")
+        return list(iter_taxonomy_products(cached_access_token(stale=token), tid))
+
+
+def map_unit(raw_products: List[Dict[str, Any]]) -> List[ProductRecord]:
+    """map stage (runs in the CPU process pool): raw JSON -> ProductRecords."""
+    return [map_product_to_row(p) for p in raw_products if p.get("webshopId") is not None]
+
+
+class AHAdapter(ChainAdapter):
+    """Work unit: a taxonomyId; fetch_unit brings the (cached) token itself."""
+
+    name = table = "ah"
+    fetch_host = "api.ah.nl"
+    unit_rules = AH_UNIT_RULES
+
+    fetch = staticmethod(fetch_unit)
+    map = staticmethod(map_unit)
+
+    def discover(self) -> List[Any]:
+        return sorted(collect_all_taxonomy_ids(cached_access_token()))
+
+    def fetch_existing(self) -> Dict[str, Dict[str, Any]]:
+        return fetch_existing_ah_rows()
+
+    def unit_cost(self, n_products: int, page_size: int = 100) -> int:
+        """Search requests one taxonomyId takes."""
+        return max(1, -(-n_products // page_size))
+
+
+ADAPTER = AHAdapter()
+
+
+def refresh_ah_daily(streaming: bool = False):
     """
     1. Fetch all existing AH products from Supabase -> old_by_sku
     2. Fetch all fresh AH products via API -> new_by_sku
@@ -483,29 +499,39 @@ def refresh_ah_daily():
          -> if price/promo changed -> update
     5. add_skus     = new_skus - old_skus
          -> insert new products with full info (url, names, unit, brand, prices, etc.)
+
+    streaming=True runs steps 2-5 as a pipeline (see pipeline.py): products are
+    diffed while the crawl is still running and written by a background upserter.
     """
     # -------------------------------------------------------------------
     # 1. Fetch existing from Supabase
     # -------------------------------------------------------------------
-    supabase = get_supabase()
-    resp = supabase.table("ah").select(
-        "sku, url, product_name_du, product_name_en, unit_du, unit_qty, unit_type_en, "
-        "regular_price, current_price, valid_from, valid_to, brand, availability"
-    ).execute()
-    old_rows = resp.data or []
-    old_by_sku: Dict[str, Dict[str, Any]] = {
-        str(r["sku"]): r for r in old_rows if r.get("sku") is not None
-    }
+    with TELEMETRY.stage("ah", "existing"):
+        old_by_sku = fetch_existing_ah_rows()
     old_skus = set(old_by_sku.keys())
     print(f"[AH daily] Found {len(old_skus)} existing AH products in DB.")
 
+    if streaming:
+        return run_streaming_refresh(
+            "ah",
+            old_by_sku,
+            iter_ah_products(),
+            build_update_row=build_update_row,
+            build_insert_row=build_insert_row,
+            label="AH daily",
+        )
+
     # -------------------------------------------------------------------
     # 2. Fetch fresh AH products via API
     # -------------------------------------------------------------------
-    fresh_products = fetch_all_ah_products()
+    with TELEMETRY.stage("ah", "fetch"):
+        fresh_products = fetch_all_ah_products()
     new_by_sku: Dict[str, Dict[str, Any]] = {
         str(p["sku"]): p for p in fresh_products if p.get("sku") is not None
     }
+    # SNAPSHOT_DIR -> today's Parquet snapshot of the catalog (see snapshots.py)
+    SNAPSHOTS.add("ah", new_by_sku.values())
+    SNAPSHOTS.finish("ah")
     new_skus = set(new_by_sku.keys())
     print(f"[AH daily] Fetched {len(new_skus)} fresh AH products from API.")
 
@@ -519,6 +545,7 @@ def refresh_ah_daily():
     print(f"[AH daily] missing_skus: {len(missing_skus)}")
     print(f"[AH daily] joint_skus:   {len(joint_skus)}")
     print(f"[AH daily] add_skus:     {len(add_skus)}")
+    TELEMETRY.count("rows_diffed", len(new_skus), table="ah")
 
     rows_to_upsert: List[Dict[str, Any]] = []
 
@@ -537,70 +564,247 @@ def refresh_ah_daily():
     # 4.2) joint_skus: compare price / promo, update if changed
     # -------------------------------------------------------------------
     for sku in joint_skus:
-        old = old_by_sku[sku]
-        new = new_by_sku[sku]
-
-        old_cp = normalize_price(old.get("current_price"))
-        old_rp = normalize_price(old.get("regular_price"))
-        old_vf = normalize_date(old.get("valid_from"))
-        old_vt = normalize_date(old.get("valid_to"))
-
-        new_cp = normalize_price(new.get("current_price"))
-        new_rp = normalize_price(new.get("regular_price"))
-        new_vf = normalize_date(new.get("valid_from"))
-        new_vt = normalize_date(new.get("valid_to"))
-
-        if (
-            new_cp == old_cp
-            and new_rp == old_rp
-            and new_vf == old_vf
-            and new_vt == old_vt
-            and old.get("availability") is True
-        ):
-            continue
-
-        row = {
-            "sku": sku,
-            "regular_price": new.get("regular_price"),
-            "current_price": new.get("current_price"),
-            "valid_from": new.get("valid_from"),
-            "valid_to": new.get("valid_to"),
-            "availability": True,
-        }
-        rows_to_upsert.append(row)
+        row = build_update_row(sku, old_by_sku[sku], new_by_sku[sku])
+        if row is not None:
+            rows_to_upsert.append(row)
 
     # -------------------------------------------------------------------
     # 4.3) add_skus: insert brand-new products
     # -------------------------------------------------------------------
     for sku in add_skus:
-        new = new_by_sku[sku]
-
-        product_name_du = new.get("product_name_du")
-        product_name_en = translate_cached(product_name_du) if product_name_du else None
-
-        rows_to_upsert.append(
-            {
-                "sku": sku,
-                "url": new.get("url"),
-                "product_name_du": product_name_du,
-                "product_name_en": product_name_en,
-                "brand": new.get("brand"),
-                "unit_du": new.get("unit_du"),
-                "unit_qty": new.get("unit_qty"),
-                "unit_type_en": new.get("unit_type_en"),
-                "regular_price": new.get("regular_price"),
-                "current_price": new.get("current_price"),
-                "valid_from": new.get("valid_from"),
-                "valid_to": new.get("valid_to"),
-                "availability": True,
-            }
-        )
+        rows_to_upsert.append(build_insert_row(sku, new_by_sku[sku]))
 
     if not rows_to_upsert:
         print("[AH daily] nothing to upsert.")
         return
 
-    print(f"[AH daily] upserting {len(rows_to_upsert)} rows to Supabase...")
+    print(f"[AH daily] writing {len(rows_to_upsert)} rows...")
 
-    upsert_rows("ah", rows_to_upsert, conflict_col="sku")
+    with TELEMETRY.stage("ah", "write"):
+        write_rows("ah", rows_to_upsert, conflict_col="sku", old_by_sku=old_by_sku)
     print("[AH daily] Done.")
+
+
+# ---------------------------------------------------------------------------
+# Bonus-only refresh (intra-day promotions)
+# ---------------------------------------------------------------------------
+def get_bonus_periods(access_token: str) -> List[Dict[str, Any]]:
+    """
+    Bonus periods from the bonus page metadata, e.g.
+        {"periods": [{"bonusStartDate": "2025-11-03", "bonusEndDate": "2025-11-09", ...}, ...]}
+    """
+    url = f"{BASE_URL}/mobile-services/bonuspage/v1/metadata"
+    resp = requests.get(url, headers=auth_headers(access_token), timeout=10)
+    resp.raise_for_status()
+    data = resp.json()
+    if isinstance(data, dict):
+        return data.get("periods") or []
+    return data or []
+
+
+def get_bonus_section(
+    access_token: str,
+    period_date: str,
+    promotion_type: str = "NATIONAL",
+) -> Dict[str, Any]:
+    """
+    All bonus groups / products of the period that contains `period_date`.
+    """
+    url = f"{BASE_URL}/mobile-services/bonuspage/v2/section"
+    params = {
+        "application": "AHWEBSHOP",
+        "date": period_date,
+        "promotionType": promotion_type,
+    }
+    resp = requests.get(url, headers=auth_headers(access_token), params=params, timeout=15)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def _iter_product_dicts(obj: Any) -> Iterator[Dict[str, Any]]:
+    """
+    The bonus section nests products in bonus groups in sections, with keys that change
+    between app versions ("bonusGroupOrProducts", "products", "product", ...).
+    Walk the JSON and yield every dict that looks like a search-API product.
+    """
+    if isinstance(obj, dict):
+        if "webshopId" in obj and ("currentPrice" in obj or "priceBeforeBonus" in obj):
+            yield obj
+            return
+        for v in obj.values():
+            yield from _iter_product_dicts(v)
+    elif isinstance(obj, list):
+        for v in obj:
+            yield from _iter_product_dicts(v)
+
+
+def iter_bonus_products(access_token: str, today: date | None = None) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the raw products on bonus today (national + online-only promotions),
+    each webshopId once. Products without a bonus price are skipped.
+    """
+    today_iso = (today or date.today()).isoformat()
+
+    periods = get_bonus_periods(access_token)
+    current = [
+        p for p in periods
+        if str(p.get("bonusStartDate", ""))[:10] <= today_iso <= str(p.get("bonusEndDate", "9999"))[:10]
+    ]
+    # no matching period in the metadata -> ask for today's section directly
+    dates = sorted({str(p["bonusStartDate"])[:10] for p in current if p.get("bonusStartDate")}) or [today_iso]
+
+    seen_ids: Set[int] = set()
+    for period_date in dates:
+        for promotion_type in ("NATIONAL", "WEB"):
+            try:
+                section = get_bonus_section(access_token, period_date, promotion_type)
+            except requests.RequestException as e:
+                print(f"[AH bonus] section {period_date}/{promotion_type} failed: {e}")
+                continue
+
+            for p in _iter_product_dicts(section):
+                wid = p.get("webshopId")
+                if wid is None or wid in seen_ids or p.get("currentPrice") is None:
+                    continue
+                end = p.get("bonusEndDate")
+                if end and str(end)[:10] < today_iso:
+                    continue
+                seen_ids.add(wid)
+                yield p
+
+    print(f"[AH bonus] products on bonus: {len(seen_ids)}")
+
+
+def fetch_promo_rows(
+    skus: List[str],
+    batch_size: int = 500,
+    page_size: int = 1000,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Only the rows the bonus refresh touches: the bonus SKUs plus every row that still
+    has a promotion (valid_to set), instead of the whole table.
+    The promotion rows are paged by sku (keyset): PostgREST cuts a single response
+    off at its max-rows setting without an error.
+    """
+    supabase = get_supabase()
+    cols = "sku, regular_price, current_price, valid_from, valid_to, availability"
+    rows: Dict[str, Dict[str, Any]] = {}
+
+    last = None
+    while True:
+        query = supabase.table("ah").select(cols).not_.is_("valid_to", "null")
+        if last is not None:
+            query = query.gt("sku", last)
+        page = query.order("sku").limit(page_size).execute().data or []
+        # stop on an empty page, not a short one: max-rows may be below page_size
+        if not page:
+            break
+        for r in page:
+            rows[str(r["sku"])] = r
+        last = page[-1]["sku"]
+
+    for start in range(0, len(skus), batch_size):
+        chunk = skus[start:start + batch_size]
+        resp = supabase.table("ah").select(cols).in_("sku", chunk).execute()
+        for r in resp.data or []:
+            rows[str(r["sku"])] = r
+
+    return rows
+
+
+def build_bonus_row(sku: str, old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any] | None:
+    """
+    Bonus product already in the DB: new current_price / promotion period, or None
+    if nothing changed.
+    """
+    if (
+        normalize_price(old.get("current_price")) == normalize_price(new.get("current_price"))
+        and normalize_date(old.get("valid_from")) == normalize_date(new.get("valid_from"))
+        and normalize_date(old.get("valid_to")) == normalize_date(new.get("valid_to"))
+    ):
+        return None
+
+    return {
+        "sku": sku,
+        "current_price": new.get("current_price"),
+        "valid_from": new.get("valid_from"),
+        "valid_to": new.get("valid_to"),
+    }
+
+
+def build_expired_row(sku: str, old: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Promotion whose valid_to has passed: back to the regular price, no period.
+    """
+    regular = old.get("regular_price")
+    return {
+        "sku": sku,
+        "current_price": regular if regular is not None else old.get("current_price"),
+        "valid_from": None,
+        "valid_to": None,
+    }
+
+
+def refresh_ah_bonus(today: date | None = None) -> Dict[str, int]:
+    """
+    Cheap intra-day refresh of the AH promotions (no taxonomy crawl):
+    1. Bonus page -> products on bonus today -> ProductRecords
+    2. Supabase -> the bonus SKUs + all rows that still carry a promotion
+    3. bonus SKUs in the DB  -> update current_price / valid_from / valid_to if changed
+       bonus SKUs not in DB  -> skipped, refresh_ah_daily inserts them with full info
+       valid_to < today      -> promotion expired, reset to the regular price
+    """
+    today = today or date.today()
+    today_iso = today.isoformat()
+
+    # -------------------------------------------------------------------
+    # 1. Bonus products from the API
+    # -------------------------------------------------------------------
+    token = get_access_token()
+    with TELEMETRY.stage("ah", "bonus_fetch"):
+        bonus = {
+            str(r["sku"]): r
+            for r in map(map_product_to_row, iter_bonus_products(token, today=today))
+        }
+
+    # -------------------------------------------------------------------
+    # 2. Rows in the DB that can change
+    # -------------------------------------------------------------------
+    with TELEMETRY.stage("ah", "existing"):
+        old_by_sku = fetch_promo_rows(list(bonus.keys()))
+
+    # -------------------------------------------------------------------
+    # 3. Updates + expired promotions
+    # -------------------------------------------------------------------
+    rows_to_upsert: List[Dict[str, Any]] = []
+    counts = {"bonus": len(bonus), "updated": 0, "not_in_db": 0, "expired": 0}
+
+    for sku, new in bonus.items():
+        old = old_by_sku.get(sku)
+        if old is None:
+            counts["not_in_db"] += 1
+            continue
+        row = build_bonus_row(sku, old, new)
+        if row is not None:
+            counts["updated"] += 1
+            rows_to_upsert.append(row)
+
+    for sku, old in old_by_sku.items():
+        if sku in bonus:
+            continue
+        valid_to = normalize_date(old.get("valid_to"))
+        if valid_to and valid_to[:10] < today_iso:
+            counts["expired"] += 1
+            rows_to_upsert.append(build_expired_row(sku, old))
+
+    TELEMETRY.count("rows_diffed", len(bonus), table="ah")
+    print(f"[AH bonus] {counts}")
+
+    if rows_to_upsert:
+        with TELEMETRY.stage("ah", "write"):
+            write_rows("ah", rows_to_upsert, conflict_col="sku", old_by_sku=old_by_sku)
+    else:
+        print("[AH bonus] nothing to upsert.")
+
+    print("[AH bonus] Done.")
+    return counts
@@ -1,4 +1,3 @@
-import numpy as np
 import pandas as pd
 
 from ah_core import (
@@ -8,12 +7,14 @@ from ah_core import (
 
 )
 
-from supabase_utils import upsert_rows 
+from product_record import records_to_frame
+from snapshots import SNAPSHOTS
+from supabase_utils import write_frame
 
 if __name__ == "__main__":
 
     # 1. Fetch all the products
-    df = pd.DataFrame(fetch_all_ah_products(page_size=60, max_taxonomies=None)) 
+    df = records_to_frame(fetch_all_ah_products(page_size=60, max_taxonomies=None))
     print("rows:", len(df))
 
     # 2. Translate product_name_du → product_name_en
@@ -24,13 +25,11 @@ if __name__ == "__main__":
         lambda x: pd.Series(parse_unit(x))
     )
 
-    # 3. Replace ±inf with NaN at DataFrame level (just in case)
-    df = df.replace([np.inf, -np.inf], np.nan)
-
-    # 4. Convert to list-of-dicts
-    rows = df.to_dict(orient="records")
-
-    # 5. Upsert
-    print(f"[ah_full_crawl] Uploading {len(rows)} rows to Supabase...")
-    upsert_rows("ah",rows)
+    # 4. Sanitize per column (±inf/NaN -> null, dates -> ISO) and upsert the frame
+    #    directly, without converting to a list of dicts first
+    print(f"[ah_full_crawl] Uploading {len(df)} rows...")
+    write_frame("ah", df)
 
+    # 7. SNAPSHOT_DIR -> today's Parquet snapshot of the catalog (see snapshots.py)
+    SNAPSHOTS.add_frame("ah", df)
+    SNAPSHOTS.finish("ah")
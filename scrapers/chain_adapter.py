@@ -0,0 +1,316 @@
+"""
+Chain adapters: what a supermarket provides to be refreshed by the shared engine.
+
+    discover()        -> work units of this run (AH taxonomyIds, Dirk webGroupIds, ...)
+    fetch(unit)       -> raw API data of one unit                       (I/O pool)
+    map(raw)          -> ProductRecords                                 (CPU process pool)
+    fetch_existing()  -> {sku: row} currently in the DB
+    build_update_row / build_insert_row -> diff against the DB rows
+    needs_enrich / enrich -> slow per-row work for changed rows (translation by default)
+
+The engines do concurrency, host limits, diffing, translation and batched writes:
+orchestrator.py for the daily refresh, crawl_coordinator.py + crawl_worker.py for
+sharded crawls. A new chain is one <chain>_core.py with a ChainAdapter subclass in
+ADAPTER; load_adapter("<chain>") finds it.
+
+The helpers every core needs (translation, unit parsing, price / date normalization,
+the price diff and the full insert row) live here as well.
+"""
+from __future__ import annotations
+
+import importlib
+import re
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List
+
+import pandas as pd
+from deep_translator import GoogleTranslator
+
+from telemetry import TELEMETRY
+
+
+# ---------------------------------------------------------------------------
+# Translation
+# ---------------------------------------------------------------------------
+translation_cache = {}
+
+def translate_cached(text):
+    """
+    Translate a Dutch product name to English using GoogleTranslator, with an in-memory cache.
+
+    Returns None if text is None or translation fails.
+    """
+    if not text:
+        return None
+
+    if text in translation_cache:
+        return translation_cache[text]
+
+    try:
+        en = GoogleTranslator(source='nl', target='en').translate(text)
+        translation_cache[text] = en
+        return en
+    except Exception as e:
+        print(f"[translate_product_names] Translation failed for: {text} | Reason: {e}")
+        TELEMETRY.count("errors", kind="translate")
+        return None
+
+
+# ---------------------------------------------------------------------------
+# Unit parsing
+# ---------------------------------------------------------------------------
+# The chains parsed their unit texts slightly differently before they shared this
+# code; the stored unit_qty / unit_type_en must not change, so each adapter keeps its
+# own rules (ChainAdapter.unit_rules):
+#   approx      leading "ca." / "ca " is dropped        "ca. 115 g"        -> 115 g
+#   loose       "los per " is dropped                   "los per 500 g"    -> 500 g
+#   recipe      cut at "|", "pers" / "personen" = 1 piece  "2-3 pers | 20 min" -> 1 piece
+#   plus        "4 + 2 stuks" -> 6 stuks
+#   milliliter  "milliliter" is a volume (else a piece count)
+AH_UNIT_RULES = {"approx": True, "loose": True, "recipe": True, "plus": True, "milliliter": False}
+DIRK_UNIT_RULES = {"approx": False, "loose": False, "recipe": False, "plus": False, "milliliter": False}
+HOOGVLIET_UNIT_RULES = {"approx": False, "loose": False, "recipe": False, "plus": False, "milliliter": True}
+
+_APPROX = re.compile(r"^ca\.?\s+")
+
+
+def handle_normalized(unit_text, milliliter: bool = True):
+    """
+    Converts the normalized format of unit (e g. 205 g, 290kg) into (unit_qty, unit_type),
+    with unit_type ∈ {"kg", "l", "piece"}.
+    """
+    m = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]+)", unit_text)
+    if not m:
+        print("[WARN] cannot parse:", unit_text)
+        return None, None
+
+    unit_qty = float(m.group(1))
+    unit_type = m.group(2)
+
+    if unit_type in ("g","gram", "gr"): # "500 gr"," 154 gram"
+        return unit_qty / 1000.0, "kg"
+    if unit_type in ("kg", "kilo"):
+        return unit_qty, "kg"
+    if unit_type == "ml" or (milliliter and unit_type == "milliliter"):
+        return unit_qty / 1000.0, "l"
+    if unit_type == "cl":
+        return unit_qty / 100.0, "l"
+    if unit_type == "l":
+        return unit_qty, "l"
+
+    return unit_qty, "piece"
+
+
+def parse_unit(unit_text: str, rules: Dict[str, bool] | None = None):
+    """
+    Converts messy Dutch unit strings into (unit_qty, unit_type)
+        - Converts messy unit into normalized unit first, so the function "handle_normalized" can handle it.
+    unit_type ∈ {"kg", "l", "piece"} or (None, None) if unknown.
+    rules: the chain's quirks (AH_UNIT_RULES by default), see above.
+    """
+    if pd.isna(unit_text):
+        return None, None
+    rules = AH_UNIT_RULES if rules is None else rules
+
+    s = unit_text.strip().lower()
+    s = s.replace(",", ".")
+    s = s.replace("×", "x")
+    s = s.replace("stuks", "stuk")
+    s = s.replace("st.", "stuk")
+    s = s.replace("-"," ")           # "5-pack" -> "5 pack"
+    if rules["approx"]:
+        s = _APPROX.sub("", s)       # "ca. 115 g" -> "115 g", "mocca" stays
+    if rules["loose"]:
+        s = s.replace("los per ", "")    # "loose per 500 g" -> "500 g"
+
+    if rules["recipe"]:
+        # "2-3 pers | 20 min" -> "2-3 pers"
+        if "|" in s:
+            s = s.split("|", 1)[0].strip()
+        if re.search(r"\bpers(?:oon|onen)?\b", s):
+            return 1, "piece"
+
+    s = re.sub(r"^\s*per\s+", "", s) # "per 500 g" -> "g", "per stuk" -> "stuk"
+    s = s.split("(")[0].strip()      # Extract everything before the first left parenthese "1 kg (ca. 5 stuk)"
+
+    # "stuk" -> "1 stuk"
+    if not any(i.isdigit() for i in s):
+        s = "1 " + s
+
+    # "6 x 250 g" -> "1500 g"
+    m = re.match(r"(\d+)\s*x\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]+)", s)
+    if m:
+        count = float(m.group(1))
+        size = float(m.group(2))
+        unit_type = m.group(3).split()[0] # eg. "6 x 250 g appel" -> drop "appel"
+        unit_qty = size * count
+        s = str(unit_qty) + unit_type
+
+    if rules["plus"]:
+        # "4 + 2 stuks" -> "6 stuks"
+        m = re.match(r"(\d+(?:\.\d+)?)\s*\+\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]+)", s)
+        if m:
+            unit_qty = float(m.group(1)) + float(m.group(2))
+            unit_type = m.group(3).split()[0]
+            s = str(unit_qty) + unit_type
+
+    return(handle_normalized(s, milliliter=rules["milliliter"]))
+
+
+# ---------------------------------------------------------------------------
+# Normalize the price and date for refresh
+# ---------------------------------------------------------------------------
+def normalize_price(v):
+    """
+    Normalize price to float or None for comparison.
+    - In scrapper: current_price = f"0.{price_large_tag.get_text(strip=True)}". This is a string.
+    - In supabse: current_price is stored as float8
+    - To compare them, we need to normalize into float.
+    """
+    if v is None:
+        return None
+    return float(v)
+
+
+def normalize_date(v):
+    """Convert date/datetime to ISO string for comparison; keep None as None.
+    - In scrapper: date(2025, 11, 4)
+    - In supabse: "2025-11-04"
+    """
+    if v is None:
+        return None
+    if isinstance(v, (date, datetime)):
+        return v.isoformat()
+    return str(v)
+
+
+# ---------------------------------------------------------------------------
+# Rows for the diff
+# ---------------------------------------------------------------------------
+INSERT_COLS = (
+    "url", "product_name_du", "brand", "unit_du", "unit_qty", "unit_type_en",
+    "regular_price", "current_price", "valid_from", "valid_to",
+)
+
+
+def build_price_update_row(sku: str, old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any] | None:
+    """
+    joint_skus: compare price / promo, return the update row or None if nothing changed.
+    """
+    if (
+        normalize_price(new.get("current_price")) == normalize_price(old.get("current_price"))
+        and normalize_price(new.get("regular_price")) == normalize_price(old.get("regular_price"))
+        and normalize_date(new.get("valid_from")) == normalize_date(old.get("valid_from"))
+        and normalize_date(new.get("valid_to")) == normalize_date(old.get("valid_to"))
+        and old.get("availability") is True
+    ):
+        return None
+
+    return {
+        "sku": sku,
+        "regular_price": new.get("regular_price"),
+        "current_price": new.get("current_price"),
+        "valid_from": new.get("valid_from"),
+        "valid_to": new.get("valid_to"),
+        "availability": True,
+    }
+
+
+def build_full_insert_row(sku: str, new: Dict[str, Any], translate: bool = True, **overrides) -> Dict[str, Any]:
+    """
+    add_skus: brand-new product with full info (url, names, unit, brand, prices, etc.)
+    translate=False leaves product_name_en empty for enrich (the engines translate).
+    """
+    row = {"sku": sku}
+    row.update((col, new.get(col)) for col in INSERT_COLS)
+    row.update(overrides)
+
+    product_name_du = row.get("product_name_du")
+    row["product_name_en"] = translate_cached(product_name_du) if translate and product_name_du else None
+    row["availability"] = True
+    return row
+
+
+def needs_translation(row: Dict[str, Any]) -> bool:
+    return bool(row.get("product_name_du")) and "product_name_en" in row and row["product_name_en"] is None
+
+
+# ---------------------------------------------------------------------------
+# Adapter interface
+# ---------------------------------------------------------------------------
+class ChainAdapter:
+    """
+    Base class of the per-chain adapters. Subclasses set name / table / fetch_host and
+    implement discover, fetch_existing, fetch and map; the rest has defaults.
+
+    fetch and map are static: map runs in a process pool and fetch in crawl workers on
+    other machines, so they get no adapter state. Work units must be JSON-serialisable
+    (crawl_worker.py stores them in the work queue). discover() may keep run state on
+    the adapter for the diff (e.g. Dirk's sitemap url map).
+    """
+
+    name: str = ""
+    table: str = ""
+    fetch_host: str | None = None
+    enrich_host: str | None = "translate.google.com"
+    # parse_unit quirks of this chain (AH_UNIT_RULES etc.)
+    unit_rules: Dict[str, bool] = AH_UNIT_RULES
+
+    # ----- required -----
+    def discover(self) -> List[Any]:
+        """Work units of this run."""
+        raise NotImplementedError
+
+    def fetch_existing(self) -> Dict[str, Dict[str, Any]]:
+        """sku -> DB row (at least the columns build_update_row compares)."""
+        raise NotImplementedError
+
+    @staticmethod
+    def fetch(unit) -> Any:
+        raise NotImplementedError
+
+    @staticmethod
+    def map(raw) -> List[Any]:
+        raise NotImplementedError
+
+    # ----- optional -----
+    def unit_key(self, unit) -> Any:
+        """Scheduler segment of a unit (refresh_scheduler.py)."""
+        return unit
+
+    def parse_unit(self, unit_text: str):
+        """Unit text -> (unit_qty, unit_type) with this chain's unit_rules."""
+        return parse_unit(unit_text, self.unit_rules)
+
+    def unit_cost(self, n_products: int) -> float:
+        """Requests one crawl of a unit with n_products takes."""
+        return 1
+
+    def build_update_row(self, sku: str, old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any] | None:
+        return build_price_update_row(sku, old, new)
+
+    def build_insert_row(self, sku: str, new: Dict[str, Any]) -> Dict[str, Any] | None:
+        return build_full_insert_row(sku, new, translate=False)
+
+    def needs_enrich(self, row: Dict[str, Any]) -> bool:
+        return needs_translation(row)
+
+    def enrich(self, row: Dict[str, Any]) -> Dict[str, Any]:
+        """translate stage: fill product_name_en for a new product."""
+        row["product_name_en"] = translate_cached(row["product_name_du"])
+        return row
+
+    # ----- synchronous engines (pipeline.run_streaming_refresh) -----
+    def enriched(self, build_row: Callable) -> Callable:
+        """Wrap a row builder so the returned row is enriched inline."""
+        def build(sku, *args):
+            row = build_row(sku, *args)
+            if row is not None and self.needs_enrich(row):
+                row = self.enrich(row)
+            return row
+        return build
+
+
+def load_adapter(chain: str) -> ChainAdapter:
+    """"ah" -> ah_core.ADAPTER"""
+    return importlib.import_module(f"{chain}_core").ADAPTER
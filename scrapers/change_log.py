@@ -0,0 +1,397 @@
+"""
+Change log of the refreshes: what a run added, removed or repriced, for downstream
+consumers (search caches, the embedding backfill, alerts) that only want the deltas.
+
+The refreshes offer every diff row they write to CHANGES, together with the DB row it
+was diffed against (old_by_sku). At the end of the run CHANGES.flush() writes the
+events of that run as one version:
+
+    <CHANGE_LOG_DIR>/HEAD                        {"version": 42, ...}
+    <CHANGE_LOG_DIR>/v0000000042.jsonl           (or .arrow with CHANGE_LOG_FORMAT=arrow)
+    <CHANGE_LOG_DIR>/consumers/<name>.json       checkpoint of a consumer
+
+Versions increase by one per run that changed something. Within a version the events
+are ordered by (chain, sku) and numbered by seq:
+
+    {"version": 42, "seq": 0, "chain": "ah", "sku": "123", "op": "changed",
+     "old": {"current_price": 2.49}, "new": {"current_price": 1.99}}
+
+op is "added" (new product), "removed" (availability -> False) or "changed" (only the
+columns that really changed, see EVENT_COLUMNS). A SKU written twice in one run keeps
+the first old value and the last new value of every column.
+
+With STORAGE_BUCKET set (object_store.py), the bucket under change_log/ is the shared
+log and CHANGE_LOG_DIR a working copy: flush() numbers a version after the last one in
+the bucket and creates its file there only if that key does not exist yet, so two
+runs never publish the same version (the loser takes the next number). Version files
+are uploaded whole, so a version in the bucket is complete. The consumer checkpoints
+are kept there as well.
+
+Consumers keep their own checkpoint and only see the versions after it:
+
+    consumer = ChangeConsumer("search-cache")
+    for version, events in consumer.batches():
+        handle(events)
+        consumer.commit(version)
+
+    python scrapers/change_log.py head
+    python scrapers/change_log.py show 42 --chain ah --op changed
+    python scrapers/change_log.py pending search-cache
+
+Disabled (record / flush do nothing) unless CHANGE_LOG_DIR is set.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import threading
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Tuple
+
+import pyarrow as pa
+import pyarrow.ipc as ipc
+
+from chain_adapter import normalize_date, normalize_price
+from object_store import ObjectStore
+
+
+CHANGE_TABLES = ("ah", "dirk", "hoogvliet")
+FORMATS = ("jsonl", "arrow")
+STORE_PREFIX = "change_log"
+
+# column -> Arrow type of old_<col> / new_<col>
+EVENT_COLUMNS = {
+    "product_name_du": pa.string(),
+    "brand": pa.string(),
+    "regular_price": pa.float64(),
+    "current_price": pa.float64(),
+    "valid_from": pa.string(),
+    "valid_to": pa.string(),
+    "availability": pa.bool_(),
+}
+# what "added" events carry; "changed" / "removed" only carry the price columns
+ADDED_COLUMNS = tuple(EVENT_COLUMNS)
+PRICE_COLUMNS = ("regular_price", "current_price", "valid_from", "valid_to", "availability")
+
+ARROW_SCHEMA = pa.schema(
+    [("version", pa.int64()), ("seq", pa.int64()), ("chain", pa.string()),
+     ("sku", pa.string()), ("op", pa.string()),
+     ("old_columns", pa.list_(pa.string())), ("new_columns", pa.list_(pa.string()))]
+    + [(f"{side}_{col}", t) for col, t in EVENT_COLUMNS.items() for side in ("old", "new")]
+)
+
+_VERSION_FILE = re.compile(r"^v(\d{10})\.(jsonl|arrow)$")
+
+
+def _value(col: str, v: Any) -> Any:
+    if v is None:
+        return None
+    if col in ("regular_price", "current_price"):
+        return normalize_price(v)
+    if col in ("valid_from", "valid_to"):
+        return normalize_date(v)[:10]
+    if col == "availability":
+        return bool(v)
+    return str(v)
+
+
+def build_event(row: Dict[str, Any], old: Dict[str, Any] | None) -> Dict[str, Any] | None:
+    """Diff row + the DB row it was diffed against -> event (without version / seq), or None."""
+    if old is None:
+        new = {c: _value(c, row.get(c)) for c in ADDED_COLUMNS if c in row}
+        return {"op": "added", "old": {}, "new": new}
+
+    if row.get("availability") is False and set(row) <= {"sku", "availability"}:
+        if old.get("availability") is False:
+            return None
+        old_values = {c: _value(c, old.get(c)) for c in PRICE_COLUMNS if c in old}
+        return {"op": "removed", "old": old_values, "new": {"availability": False}}
+
+    old_values, new_values = {}, {}
+    for col in PRICE_COLUMNS:
+        if col not in row:
+            continue
+        before, after = _value(col, old.get(col)), _value(col, row[col])
+        if before != after:
+            old_values[col], new_values[col] = before, after
+    if not new_values:
+        return None
+    return {"op": "changed", "old": old_values, "new": new_values}
+
+
+# ---------------------------------------------------------------------------
+# Files
+# ---------------------------------------------------------------------------
+def _version_path(root: str, version: int, fmt: str) -> str:
+    return os.path.join(root, f"v{version:010d}.{fmt}")
+
+
+def versions(root: str) -> Dict[int, str]:
+    """version -> file of every published version."""
+    if not os.path.isdir(root):
+        return {}
+    out = {}
+    for name in os.listdir(root):
+        m = _VERSION_FILE.match(name)
+        if m:
+            out[int(m.group(1))] = os.path.join(root, name)
+    return dict(sorted(out.items()))
+
+
+def store_versions(store: ObjectStore) -> Dict[int, str]:
+    """version -> key of every version published in the bucket."""
+    out = {}
+    for key in store.list(STORE_PREFIX):
+        m = _VERSION_FILE.match(key.rsplit("/", 1)[-1])
+        if m:
+            out[int(m.group(1))] = key
+    return dict(sorted(out.items()))
+
+
+def head(root: str) -> int:
+    path = os.path.join(root, "HEAD")
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return int(json.load(f)["version"])
+
+
+def _write_json(path: str, obj: Dict[str, Any]):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+def _write_jsonl(path: str, events: List[Dict[str, Any]]):
+    with open(path, "w", encoding="utf-8") as f:
+        for ev in events:
+            f.write(json.dumps(ev, ensure_ascii=False) + "\n")
+
+
+def _write_arrow(path: str, events: List[Dict[str, Any]]):
+    columns: Dict[str, List[Any]] = {name: [] for name in ARROW_SCHEMA.names}
+    for ev in events:
+        for key in ("version", "seq", "chain", "sku", "op"):
+            columns[key].append(ev[key])
+        columns["old_columns"].append(list(ev["old"]))
+        columns["new_columns"].append(list(ev["new"]))
+        for col in EVENT_COLUMNS:
+            columns[f"old_{col}"].append(ev["old"].get(col))
+            columns[f"new_{col}"].append(ev["new"].get(col))
+    table = pa.Table.from_pydict(columns, schema=ARROW_SCHEMA)
+    with ipc.new_file(path, ARROW_SCHEMA) as writer:
+        writer.write_table(table)
+
+
+def _read_arrow(path: str) -> List[Dict[str, Any]]:
+    with pa.memory_map(path, "r") as source:
+        table = ipc.open_file(source).read_all()
+    # old_columns / new_columns tell a None value apart from a column not in the event
+    events = []
+    for rec in table.to_pylist():
+        ev = {key: rec[key] for key in ("version", "seq", "chain", "sku", "op")}
+        for side in ("old", "new"):
+            ev[side] = {c: rec[f"{side}_{c}"] for c in rec[f"{side}_columns"]}
+        events.append(ev)
+    return events
+
+
+def read_version(root: str, version: int) -> List[Dict[str, Any]]:
+    path = versions(root).get(version)
+    if path is None:
+        raise KeyError(f"change log version {version} not found in {root}")
+    if path.endswith(".arrow"):
+        return _read_arrow(path)
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# ---------------------------------------------------------------------------
+# Producer
+# ---------------------------------------------------------------------------
+class ChangeLog:
+    def __init__(self, root: str | None = None, fmt: str | None = None, store: ObjectStore | None = None):
+        self.root = root if root is not None else os.environ.get("CHANGE_LOG_DIR") or None
+        self.fmt = (fmt or os.environ.get("CHANGE_LOG_FORMAT") or "jsonl").lower()
+        if self.fmt not in FORMATS:
+            raise ValueError(f"CHANGE_LOG_FORMAT must be one of {FORMATS}, not {self.fmt!r}")
+        self.store = store if store is not None else ObjectStore.from_env()
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.root is not None
+
+    def record(self, table: str, rows: Iterable[Dict[str, Any]], old_by_sku: Dict[str, Dict[str, Any]]):
+        """Remember the changes of the diff rows written to `table`."""
+        if not self.enabled or table not in CHANGE_TABLES:
+            return
+        with self._lock:
+            for row in rows:
+                if row.get("sku") is None:
+                    continue
+                sku = str(row["sku"])
+                event = build_event(row, old_by_sku.get(sku))
+                if event is None:
+                    continue
+                prev = self._pending.get((table, sku))
+                if prev is not None:
+                    # same SKU again in this run (e.g. translated later): keep the first old values
+                    for col, v in event["old"].items():
+                        prev["old"].setdefault(col, v)
+                    prev["new"].update(event["new"])
+                    continue
+                self._pending[(table, sku)] = {"chain": table, "sku": sku, **event}
+
+    def flush(self) -> int | None:
+        """Write the events of this run as the next version. Returns the version (None if nothing changed)."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            print("[change_log] no changes, no new version")
+            return None
+
+        os.makedirs(self.root, exist_ok=True)
+        version = head(self.root) + 1
+        if self.store is not None:
+            version = max([version] + [v + 1 for v in store_versions(self.store)])
+        while True:
+            events = []
+            for seq, key in enumerate(sorted(pending)):
+                ev = pending[key]
+                events.append({"version": version, "seq": seq, "chain": ev["chain"], "sku": ev["sku"],
+                               "op": ev["op"], "old": ev["old"], "new": ev["new"]})
+
+            path = _version_path(self.root, version, self.fmt)
+            tmp = path + ".tmp"
+            (_write_arrow if self.fmt == "arrow" else _write_jsonl)(tmp, events)
+            if self.store is None:
+                break
+            with open(tmp, "rb") as f:
+                if self.store.create(self._key(path), f.read()):
+                    break
+            # another run published this version since we listed the bucket
+            print(f"[change_log] version {version} already taken, trying {version + 1}")
+            version += 1
+        os.replace(tmp, path)
+
+        ops: Dict[str, int] = {}
+        for ev in events:
+            ops[ev["op"]] = ops.get(ev["op"], 0) + 1
+        # HEAD last: a version is only visible to consumers once its file is complete
+        _write_json(os.path.join(self.root, "HEAD"), {
+            "version": version,
+            "events": len(events),
+            "ops": ops,
+            "written_at": datetime.now(timezone.utc).isoformat(),
+        })
+        print(f"[change_log] version {version}: {len(events)} events {json.dumps(ops)} -> {path}")
+        return version
+
+    def _key(self, path: str) -> str:
+        return STORE_PREFIX + "/" + os.path.relpath(path, self.root).replace(os.sep, "/")
+
+
+CHANGES = ChangeLog()
+
+
+# ---------------------------------------------------------------------------
+# Consumer
+# ---------------------------------------------------------------------------
+class ChangeConsumer:
+    """
+    Reads the versions after its checkpoint, oldest first. commit(version) moves the
+    checkpoint; a consumer that crashes before commit sees the same version again.
+    """
+
+    def __init__(self, name: str, root: str | None = None, store: ObjectStore | None = None):
+        self.name = name
+        self.root = root if root is not None else os.environ.get("CHANGE_LOG_DIR", "change_log")
+        self.checkpoint_path = os.path.join(self.root, "consumers", f"{name}.json")
+        # with a bucket, the versions and this checkpoint are read from / written to it
+        self.store = store if store is not None else ObjectStore.from_env()
+        self.checkpoint_key = f"{STORE_PREFIX}/consumers/{name}.json"
+
+    @property
+    def position(self) -> int:
+        """Last committed version (0 = nothing processed yet)."""
+        if self.store is not None:
+            data = self.store.get(self.checkpoint_key)
+            return int(json.loads(data)["version"]) if data is not None else 0
+        if not os.path.exists(self.checkpoint_path):
+            return 0
+        with open(self.checkpoint_path) as f:
+            return int(json.load(f)["version"])
+
+    def pending(self) -> List[int]:
+        position = self.position
+        if self.store is not None:
+            return [v for v in store_versions(self.store) if v > position]
+        last = head(self.root)
+        return [v for v in versions(self.root) if position < v <= last]
+
+    def batches(self, limit: int | None = None) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+        keys = store_versions(self.store) if self.store is not None else {}
+        for version in self.pending()[:limit]:
+            if version in keys and version not in versions(self.root):
+                self.store.download(keys[version], os.path.join(self.root, keys[version].rsplit("/", 1)[-1]))
+            yield version, read_version(self.root, version)
+
+    def commit(self, version: int):
+        if version < self.position:
+            raise ValueError(f"[change_log] {self.name}: cannot move back from {self.position} to {version}")
+        checkpoint = {"version": version, "committed_at": datetime.now(timezone.utc).isoformat()}
+        os.makedirs(os.path.dirname(self.checkpoint_path), exist_ok=True)
+        _write_json(self.checkpoint_path, checkpoint)
+        if self.store is not None:
+            self.store.put(self.checkpoint_key, json.dumps(checkpoint).encode(), "application/json")
+
+    def process(self, handle: Callable[[List[Dict[str, Any]]], Any], limit: int | None = None) -> int:
+        """handle(events) for every pending version, committing after each. Returns versions processed."""
+        done = 0
+        for version, events in self.batches(limit):
+            handle(events)
+            self.commit(version)
+            done += 1
+        return done
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect the refresh change log.")
+    parser.add_argument("--dir", default=os.environ.get("CHANGE_LOG_DIR", "change_log"))
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("head", help="latest version")
+    p = sub.add_parser("show", help="events of one version as JSON lines")
+    p.add_argument("version", type=int)
+    p.add_argument("--chain", default=None)
+    p.add_argument("--op", default=None, choices=("added", "removed", "changed"))
+    p = sub.add_parser("pending", help="versions a consumer has not committed yet")
+    p.add_argument("consumer")
+    args = parser.parse_args()
+
+    store = ObjectStore.from_env()
+    if args.cmd == "head" and store is not None:
+        print(json.dumps({"version": max(store_versions(store), default=0)}))
+    elif args.cmd == "head":
+        path = os.path.join(args.dir, "HEAD")
+        print(open(path).read() if os.path.exists(path) else json.dumps({"version": 0}))
+    elif args.cmd == "show":
+        key = store_versions(store).get(args.version) if store is not None else None
+        if key is not None and args.version not in versions(args.dir):
+            store.download(key, os.path.join(args.dir, key.rsplit("/", 1)[-1]))
+        for ev in read_version(args.dir, args.version):
+            if (args.chain is None or ev["chain"] == args.chain) and (args.op is None or ev["op"] == args.op):
+                print(json.dumps(ev, ensure_ascii=False))
+    elif args.cmd == "pending":
+        consumer = ChangeConsumer(args.consumer, args.dir, store)
+        print(json.dumps({"position": consumer.position, "pending": consumer.pending()}))
+
+
+if __name__ == "__main__":
+    main()
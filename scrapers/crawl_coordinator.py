@@ -0,0 +1,229 @@
+"""
+Coordinator for sharded crawls.
+
+    discover -> publish the work units of every chain to the work queue (work_queue.py)
+    crawl    -> crawl_worker.py processes, on this and/or other machines, lease the units,
+                fetch + map them and store the mapped rows with the task
+    merge    -> the coordinator reads the results, diffs them against the DB rows and
+                writes the changes (pipeline.run_streaming_refresh)
+
+If a unit still fails after its retries, the chain is written without marking
+missing SKUs unavailable, like a partial run of orchestrator.py.
+
+Single machine, 4 local worker processes:
+
+    python scrapers/crawl_coordinator.py --queue sqlite:///crawl_queue.db --local-workers 4
+
+Several machines: run crawl_worker.py against the same Redis on every host and
+start the coordinator with --local-workers 0.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from typing import Any, Dict, Iterator, List
+
+import hoogvliet_core
+from chain_adapter import load_adapter
+from crawl_worker import UNIT_KIND_PREFIX, run_worker
+from pipeline import run_streaming_refresh
+from change_log import CHANGES
+from price_history import HISTORY
+from snapshots import SNAPSHOTS
+from telemetry import TELEMETRY, start_run
+from work_queue import get_queue, new_run_id
+
+
+UNIT_BATCH = {"dirk": 4}     # adapter work units per task (default 1)
+HOOGVLIET_SKU_BATCH = 80    # Intershop prices per request
+
+# Task kinds per chain, the last one carries the mapped rows. Chains not listed
+# publish their adapter work units as "unit:<chain>" tasks.
+CHAIN_KINDS = {
+    "hoogvliet": ["hoogvliet_category_page", "hoogvliet_sku_batch"],
+}
+
+
+def chain_kinds(chain: str) -> List[str]:
+    return CHAIN_KINDS.get(chain, [UNIT_KIND_PREFIX + chain])
+
+
+def _chunks(items: List[Any], n: int) -> Iterator[List[Any]]:
+    for i in range(0, len(items), n):
+        yield items[i:i + n]
+
+
+# ---------------------------------------------------------------------------
+# discover: publish work units
+# ---------------------------------------------------------------------------
+def publish_units(queue, run_id: str, chain: str) -> int:
+    """Any chain: the work units of its adapter, UNIT_BATCH per task."""
+    units = load_adapter(chain).discover()
+    return queue.publish(
+        run_id,
+        UNIT_KIND_PREFIX + chain,
+        [{"units": batch} for batch in _chunks(units, UNIT_BATCH.get(chain, 1))],
+    )
+
+
+def publish_hoogvliet(queue, run_id: str, chain: str = "hoogvliet") -> int:
+    # Phase 1 only: the pages per category are only known after page 1 (see crawl_worker.py),
+    # the SKU batches only after all pages (publish_hoogvliet_prices).
+    return queue.publish(
+        run_id,
+        "hoogvliet_category_page",
+        [{"cid": cid, "page": 1} for cid in hoogvliet_core.TOP_CATEGORY_CIDS],
+    )
+
+
+def publish_hoogvliet_prices(queue, run_id: str) -> int:
+    items_by_sku = {}
+    for result in queue.results(run_id, "hoogvliet_category_page"):
+        for it in result["items"]:
+            items_by_sku.setdefault(it["sku"], it)
+    items = list(items_by_sku.values())
+    return queue.publish(
+        run_id,
+        "hoogvliet_sku_batch",
+        [{"items": batch} for batch in _chunks(items, HOOGVLIET_SKU_BATCH)],
+    )
+
+
+PUBLISHERS = {
+    "hoogvliet": publish_hoogvliet,
+}
+
+
+# ---------------------------------------------------------------------------
+# crawl: wait for the workers
+# ---------------------------------------------------------------------------
+def wait_for(queue, run_id: str, kinds: List[str], poll_s: float = 5.0) -> Dict[str, Dict[str, int]]:
+    """Block until no task of `kinds` is pending or leased; return the final counts per kind."""
+    last = None
+    while True:
+        progress = {kind: queue.progress(run_id, kind) for kind in kinds}
+        open_tasks = sum(p["pending"] + p["leased"] for p in progress.values())
+        if progress != last:
+            print(f"[coordinator] {json.dumps(progress)}")
+            last = progress
+        if open_tasks == 0:
+            return progress
+        time.sleep(poll_s)
+
+
+# ---------------------------------------------------------------------------
+# merge: diff + write per chain
+# ---------------------------------------------------------------------------
+def iter_result_rows(queue, run_id: str, kind: str) -> Iterator[Dict[str, Any]]:
+    for result in queue.results(run_id, kind):
+        yield from result["rows"]
+
+
+def merge_chain(queue, run_id: str, chain: str, complete: bool) -> Dict[str, int]:
+    """Diff the mapped rows against the DB; enrichment (translation etc.) runs inline."""
+    adapter = load_adapter(chain)
+    return run_streaming_refresh(
+        adapter.table,
+        adapter.fetch_existing(),
+        iter_result_rows(queue, run_id, chain_kinds(chain)[-1]),
+        build_update_row=adapter.enriched(adapter.build_update_row),
+        build_insert_row=adapter.enriched(adapter.build_insert_row),
+        label=f"{chain} sharded",
+        mark_missing=complete,
+    )
+
+
+# ---------------------------------------------------------------------------
+# Run
+# ---------------------------------------------------------------------------
+def run_sharded_refresh(
+    queue_url: str,
+    chains: List[str],
+    local_workers: int = 0,
+    lease_s: float = 300,
+    poll_s: float = 5.0,
+    keep_tasks: bool = False,
+) -> Dict[str, Any]:
+    queue = get_queue(queue_url)
+    run_id = new_run_id()
+    summary: Dict[str, Any] = {"run_id": run_id, "chains": {}}
+    print(f"[coordinator] run {run_id}: {', '.join(chains)}")
+
+    for chain in chains:
+        n = PUBLISHERS.get(chain, publish_units)(queue, run_id, chain)
+        print(f"[coordinator] {chain}: published {n} tasks")
+
+    # Local workers exit once the queue has been empty for a while; remote workers keep going.
+    procs = [
+        multiprocessing.Process(
+            target=run_worker,
+            args=(queue_url,),
+            kwargs={"lease_s": lease_s, "idle_exit_s": max(30.0, 3 * poll_s)},
+            name=f"crawl-worker-{i}",
+        )
+        for i in range(local_workers)
+    ]
+    for p in procs:
+        p.start()
+
+    try:
+        first_kinds = [chain_kinds(c)[0] for c in chains]
+        progress = wait_for(queue, run_id, first_kinds, poll_s=poll_s)
+
+        if "hoogvliet" in chains:
+            n = publish_hoogvliet_prices(queue, run_id)
+            print(f"[coordinator] hoogvliet: published {n} price batches")
+            progress.update(wait_for(queue, run_id, ["hoogvliet_sku_batch"], poll_s=poll_s))
+
+        for chain in chains:
+            failed = sum(progress[kind]["failed"] for kind in chain_kinds(chain))
+            try:
+                counts = merge_chain(queue, run_id, chain, complete=failed == 0)
+                status = "partial" if failed else "ok"
+                summary["chains"][chain] = {"status": status, "failed_tasks": failed, "counts": counts}
+            except Exception as e:
+                print(f"[coordinator] ❌ {chain} merge failed: {e}")
+                summary["chains"][chain] = {"status": "error", "error": str(e)}
+    finally:
+        for p in procs:
+            p.join()
+        if not keep_tasks:
+            queue.purge(run_id)
+
+    print(json.dumps(summary, indent=2, default=str))
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sharded crawl + daily refresh.")
+    parser.add_argument("--queue", default=os.environ.get("CRAWL_QUEUE_URL", "sqlite:///crawl_queue.db"))
+    parser.add_argument("--chains", default="ah,dirk,hoogvliet")
+    parser.add_argument("--local-workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--lease", type=float, default=300, help="lease length in seconds")
+    parser.add_argument("--poll", type=float, default=5.0)
+    parser.add_argument("--keep-tasks", action="store_true", help="do not purge the run from the queue")
+    args = parser.parse_args()
+
+    chains = [c.strip() for c in args.chains.split(",") if c.strip()]
+    start_run()
+    try:
+        run_sharded_refresh(
+            args.queue,
+            chains,
+            local_workers=args.local_workers,
+            lease_s=args.lease,
+            poll_s=args.poll,
+            keep_tasks=args.keep_tasks,
+        )
+    finally:
+        HISTORY.flush()
+        CHANGES.flush()
+        SNAPSHOTS.close()
+        TELEMETRY.write_outputs()
+
+
+if __name__ == "__main__":
+    main()
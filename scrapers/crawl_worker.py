@@ -0,0 +1,189 @@
+"""
+Crawl worker for sharded crawls: leases tasks from the work queue (work_queue.py),
+fetches + maps them and stores the mapped rows as the task result.
+crawl_coordinator.py publishes the tasks and merges the results for the diff.
+
+Start as many workers as you like, on one or several machines:
+
+    python scrapers/crawl_worker.py --queue sqlite:///crawl_queue.db --processes 4
+    python scrapers/crawl_worker.py --queue redis://queue-host:6379/0 --processes 8
+
+A worker that dies mid-task simply stops renewing its lease; the task is retried
+by another worker once the lease expires.
+"""
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from typing import Any, Callable, Dict
+
+import hoogvliet_core
+from chain_adapter import load_adapter
+from work_queue import Task, get_queue
+
+
+UNIT_KIND_PREFIX = "unit:"     # "unit:ah" -> ChainAdapter work units of that chain
+
+
+# ---------------------------------------------------------------------------
+# Task handlers: payload -> JSON-serialisable result
+# ---------------------------------------------------------------------------
+def handle_chain_units(payload: Dict[str, Any], queue, task: Task) -> Dict[str, Any]:
+    """{"units": [...]} of kind "unit:<chain>" -> mapped rows of a batch of adapter work units."""
+    adapter = load_adapter(task.kind[len(UNIT_KIND_PREFIX):])
+    rows = []
+    for unit in payload["units"]:
+        rows.extend(r.to_row() for r in adapter.map(adapter.fetch(unit)))
+    return {"rows": rows}
+
+
+def handle_hoogvliet_category_page(payload: Dict[str, Any], queue, task: Task) -> Dict[str, Any]:
+    """
+    {"cid", "page"} -> Tweakwise items of one category page.
+    Page 1 also tells how many pages there are, so it publishes pages 2..n.
+    (If page 1 is retried after publishing, the pages are crawled twice; the
+    coordinator dedups by SKU, so that only costs requests.)
+    """
+    cid, page = payload["cid"], payload.get("page", 1)
+    items, nrof_pages = hoogvliet_core.fetch_category_page(cid, page=page)
+
+    if page == 1 and nrof_pages > 1:
+        queue.publish(
+            task.run_id,
+            task.kind,
+            [{"cid": cid, "page": p} for p in range(2, nrof_pages + 1)],
+        )
+    return {"items": items}
+
+
+def handle_hoogvliet_sku_batch(payload: Dict[str, Any], queue, task: Task) -> Dict[str, Any]:
+    """{"items": [...]} -> Tweakwise items + Intershop prices -> mapped rows."""
+    items = payload["items"]
+    products = hoogvliet_core.fetch_products_by_skus([it["sku"] for it in items])
+    if products is None:
+        raise RuntimeError(f"Intershop batch failed for first SKUs: {[it['sku'] for it in items[:5]]}")
+
+    price_map = hoogvliet_core.prices_from_products(products)
+    rows = [hoogvliet_core.merge_product(it, price_map.get(it["sku"], {})).to_row() for it in items]
+    return {"rows": rows}
+
+
+# Hoogvliet is split finer than its adapter units (pages, then price batches).
+TASK_HANDLERS: Dict[str, Callable[[Dict[str, Any], Any, Task], Dict[str, Any]]] = {
+    "hoogvliet_category_page": handle_hoogvliet_category_page,
+    "hoogvliet_sku_batch": handle_hoogvliet_sku_batch,
+}
+
+
+def get_handler(kind: str):
+    if kind.startswith(UNIT_KIND_PREFIX):
+        return handle_chain_units
+    return TASK_HANDLERS.get(kind)
+
+
+# ---------------------------------------------------------------------------
+# Worker loop
+# ---------------------------------------------------------------------------
+class _Heartbeat:
+    """Renew the lease of the running task every lease_s / 3 seconds."""
+
+    def __init__(self, queue, task: Task, lease_s: float):
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, args=(queue, task, lease_s), name="lease-heartbeat", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self, queue, task: Task, lease_s: float):
+        while not self._stop.wait(lease_s / 3):
+            try:
+                queue.renew(task, lease_s)
+            except Exception as e:
+                print(f"[crawl_worker] lease renew failed for {task}: {e}")
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def run_worker(
+    queue_url: str,
+    worker_id: str | None = None,
+    lease_s: float = 300,
+    idle_exit_s: float | None = 60,
+    poll_s: float = 1.0,
+) -> int:
+    """
+    Lease -> handle -> complete/fail until the queue has been empty for idle_exit_s
+    (None = run forever). Returns the number of tasks completed.
+    """
+    queue = get_queue(queue_url)
+    worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+    done = 0
+    idle_since = time.monotonic()
+
+    while True:
+        task = queue.lease(worker_id, lease_s=lease_s)
+        if task is None:
+            if idle_exit_s is not None and time.monotonic() - idle_since >= idle_exit_s:
+                break
+            time.sleep(poll_s)
+            continue
+
+        handler = get_handler(task.kind)
+        heartbeat = _Heartbeat(queue, task, lease_s)
+        try:
+            if handler is None:
+                raise ValueError(f"unknown task kind: {task.kind}")
+            result = handler(task.payload, queue, task)
+        except Exception as e:
+            heartbeat.stop()
+            print(f"[crawl_worker] ❌ {worker_id} {task} failed: {e}")
+            if not queue.fail(task, str(e)):
+                print(f"[crawl_worker] {worker_id} lost the lease of {task}, failure not recorded")
+        else:
+            heartbeat.stop()
+            if queue.complete(task, result):
+                done += 1
+            else:
+                print(f"[crawl_worker] {worker_id} lost the lease of {task}, result dropped")
+
+        idle_since = time.monotonic()
+
+    print(f"[crawl_worker] {worker_id} idle, exiting after {done} tasks")
+    return done
+
+
+def run_processes(queue_url: str, processes: int, **kwargs):
+    """Start `processes` worker processes on this machine and wait for them."""
+    procs = [
+        multiprocessing.Process(target=run_worker, args=(queue_url,), kwargs=kwargs, name=f"crawl-worker-{i}")
+        for i in range(processes)
+    ]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl worker for the sharded crawl queue.")
+    parser.add_argument("--queue", default=os.environ.get("CRAWL_QUEUE_URL", "sqlite:///crawl_queue.db"))
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--lease", type=float, default=300, help="lease length in seconds")
+    parser.add_argument(
+        "--idle-exit", type=float, default=60,
+        help="exit after the queue was empty this many seconds (<= 0: never)",
+    )
+    args = parser.parse_args()
+
+    idle_exit_s = args.idle_exit if args.idle_exit > 0 else None
+    run_processes(args.queue, args.processes, lease_s=args.lease, idle_exit_s=idle_exit_s)
+
+
+if __name__ == "__main__":
+    main()
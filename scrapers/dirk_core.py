@@ -7,130 +7,32 @@ from datetime import date
 import pandas as pd
 import requests
 from bs4 import BeautifulSoup
-from deep_translator import GoogleTranslator
 from urllib.parse import urlparse
 from datetime import date, datetime
 import xml.etree.ElementTree as ET
 
-from supabase_utils import get_supabase, upsert_rows
-from typing import List, Dict, Any
-
-# ---------------------------------------------------------------------------
-# Translation
-# ---------------------------------------------------------------------------
-
-translation_cache = {}
-
-def translate_cached(text):
-    """
-    Translate a Dutch product name to English using GoogleTranslator, with an in-memory cache.
-
-    Returns None if text is None or translation fails.
-    """
-    if not text:
-        return None
-    
-    if text in translation_cache:
-        return translation_cache[text]
-
-    try:
-        en = GoogleTranslator(source='nl', target='en').translate(text)
-        translation_cache[text] = en
-        return en
-    except Exception as e:
-        print(f"[translate_product_names] Translation failed for: {text} | Reason: {e}")
-        return None
-    
+from chain_adapter import (
+    DIRK_UNIT_RULES,
+    ChainAdapter,
+    build_full_insert_row,
+    build_price_update_row,
+    normalize_date,
+    normalize_price,
+    translate_cached,
+)
+from supabase_utils import get_supabase, write_rows
+from pipeline import run_streaming_refresh
+from product_record import ProductRecord
+from snapshots import SNAPSHOTS
+from telemetry import TELEMETRY
+from typing import List, Dict, Any, Iterator
 
 # ---------------------------------------------------------------------------
 # Unit parsing
 # ---------------------------------------------------------------------------
-def handle_normalized(unit_text): 
-    """
-    Converts the normalized format of unit (e g. 205 g, 290kg) into (unit_qty, unit_type),
-    with unit_type ∈ {"kg", "l", "piece"}.
-    """
-    m = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]+)", unit_text)
-    if not m:
-        print("[WARN] cannot parse:", unit_text)
-        return None, None
-    
-    unit_qty = float(m.group(1))   
-    unit_type = m.group(2)
-
-    if unit_type in ("g","gram", "gr"): # "500 gr"," 154 gram"
-        return unit_qty / 1000.0, "kg"
-    if unit_type in ("kg", "kilo"):
-        return unit_qty, "kg"
-    if unit_type == "ml":
-        return unit_qty / 1000.0, "l"
-    if unit_type == "cl":
-        return unit_qty / 100.0, "l"
-    if unit_type == "l":
-        return unit_qty, "l"    
-    
-    return unit_qty, "piece"
-
-
 def parse_unit(unit_text: str):
-    """
-    Converts messy Dutch unit strings into (unit_qty, unit_type)
-        - Converts messy unit into normalized unit first, so the function "handle_normalized" can handle it.
-    unit_type ∈ {"kg", "l", "piece"} or (None, None) if unknown.
-    """
-    if pd.isna(unit_text):
-        return None, None
-
-    s = unit_text.strip().lower()
-    s = s.replace(",", ".")
-    s = s.replace("×", "x")
-    s = s.replace("stuks", "stuk")
-    s = s.replace("st.", "stuk")
-    s = s.replace("-"," ")           # "5-pack" -> "5 pack"
-    s = re.sub(r"^\s*per\s+", "", s) # "per 500 g" -> "g", "per stuk" -> "stuk"
-    s = s.split("(")[0].strip()      # Extract everything before the first left parenthese "1 kg (ca. 5 stuk)"
-
-    # "stuk" -> "1 stuk"
-    if not any(i.isdigit() for i in s): 
-        s = "1 " + s
-
-    # "6 x 250 g" -> "1500 g"
-    m = re.match(r"(\d+)\s*x\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]+)", s)
-    if m:
-        count = float(m.group(1))
-        size = float(m.group(2))
-        unit_type = m.group(3).split()[0] # eg. "6 x 250 g appel" -> drop "appel"
-        unit_qty = size * count
-        s = str(unit_qty) + unit_type
-    
-    return(handle_normalized(s))   
-
-
-# ---------------------------------------------------------------------------
-# Normalize the price and date for refresh
-# ---------------------------------------------------------------------------
-def normalize_price(v):
-    """
-    Normalize price to float or None for comparison.
-    - In scrapper: current_price = f"0.{price_large_tag.get_text(strip=True)}". This is a string.
-    - In supabse: current_price is stored as float8
-    - To compare them, we need to normalize into float. 
-    """
-    if v is None:
-        return None
-    return float(v) 
-
-
-def normalize_date(v):
-    """Convert date/datetime to ISO string for comparison; keep None as None.
-    - In scrapper: date(2025, 11, 4)
-    - In supabse: "2025-11-04"
-    """
-    if v is None:
-        return None
-    if isinstance(v, (date, datetime)):
-        return v.isoformat()
-    return str(v)
+    """Unit text -> (unit_qty, unit_type) with the Dirk rules (ADAPTER.unit_rules)."""
+    return ADAPTER.parse_unit(unit_text)
 
 
 # ---------------------------------------------------------------------------
@@ -202,6 +104,37 @@ def fetch_webgroup_raw(web_group_id: int, store_id: int = DEFAULT_STORE_ID) -> l
     }}
     """.strip()
 
+    return _post_assortment(query)
+
+
+def fetch_webgroup_prices(web_group_id: int, store_id: int) -> list[dict]:
+    """
+    Prices only (no productInformation) of one webGroupId in one store, for the
+    multi-store crawl (dirk_stores.py). Product info is the same in every store,
+    so it is only fetched for the reference store.
+    """
+    query = f"""
+    query {{
+      listWebGroupProducts(webGroupId: {web_group_id}) {{
+        productAssortment(storeId: {store_id}) {{
+          productId
+          normalPrice
+          offerPrice
+          startDate
+          endDate
+          productOffer {{
+            endDate
+            startDate
+          }}
+        }}
+      }}
+    }}
+    """.strip()
+
+    return _post_assortment(query)
+
+
+def _post_assortment(query: str) -> list[dict]:
     payload = {"query": query, "variables": {}}
 
     resp = requests.post(DIRK_GRAPHQL_URL, headers=HEADERS, json=payload, timeout=15)
@@ -219,79 +152,93 @@ def fetch_webgroup_raw(web_group_id: int, store_id: int = DEFAULT_STORE_ID) -> l
     return items
 
 
-def fetch_all_dirk_products(
+def map_dirk_product(raw: dict) -> ProductRecord:
+    """
+    Map one raw Dirk productAssortment item -> one compact ProductRecord.
+    """
+    info = raw.get("productInformation") or {}
+    product_name_du = info.get("headerText")
+    offer = raw.get("productOffer") or {}
+
+    normal_price = raw.get("normalPrice")
+    offer_price = raw.get("offerPrice")
+    # Dirk GraphQL: offerPrice = 0 → means NO OFFER
+    if offer_price in (0, 0.0, None):
+        offer_price = normal_price
+    unit_du=  info.get("packaging")
+
+    promo_start = offer.get("startDate") or raw.get("startDate")
+    promo_end = offer.get("endDate") or raw.get("endDate")
+
+
+    unit_qty = None
+    unit_type_en = None
+    if unit_du:
+        unit_qty, unit_type_en = parse_unit(unit_du)
+
+
+    return ProductRecord(
+        sku=raw.get("productId"),
+        product_name_du=product_name_du,
+        brand=info.get("brand"),
+        unit_du=unit_du,
+        unit_qty=unit_qty,
+        unit_type_en=unit_type_en,
+        regular_price=normal_price,
+        current_price=offer_price,
+        valid_from=promo_start,
+        valid_to=promo_end,
+        # department=info.get("department"),
+        # webgroup=info.get("webgroup"),
+        # image_path=info.get("image"),
+    )
+
+
+def iter_dirk_products(
     webgroup_ids: list[int] = DIRK_WEBGROUP_IDS,
     store_id: int = DEFAULT_STORE_ID,
     sleep_sec: float = 0.2,
-) -> list[dict]:
+) -> Iterator[ProductRecord]:
     """
-    Scan all the webGroupId, remove deplicates based on productId.
+    Scan the webGroupIds and yield mapped products group by group.
+    A product can appear in several groups; callers dedupe on "sku".
     """
-    all_by_id: dict[int, dict] = {}
-
     for gid in webgroup_ids:
         print(f"\n=== Fetching webGroupId {gid} ===")
         try:
             items = fetch_webgroup_raw(gid, store_id=store_id)
         except Exception as e:
             print(f"  !! error on gid={gid}: {e}")
+            TELEMETRY.count("errors", kind="webgroup", chain="dirk")
             continue
 
         print(f"  {len(items)} products in this group")
 
         for it in items:
-            pid = it.get("productId")
-            if pid is None:
+            if it.get("productId") is None:
                 continue
-            all_by_id[pid] = it  
-
-        time.sleep(sleep_sec)  
-
-    print(f"\n[INFO] Dirk new products collected: {len(all_by_id)}")
+            yield map_dirk_product(it)
 
+        time.sleep(sleep_sec)
 
-    products: list[dict] = []
-    for pid, raw in all_by_id.items():
-        info = raw.get("productInformation") or {}
-        product_name_du = info.get("headerText")
-        offer = raw.get("productOffer") or {}
 
-        normal_price = raw.get("normalPrice")
-        offer_price = raw.get("offerPrice")
-        # Dirk GraphQL: offerPrice = 0 → means NO OFFER
-        if offer_price in (0, 0.0, None):
-            offer_price = normal_price
-        unit_du=  info.get("packaging")
+def fetch_all_dirk_products(
+    webgroup_ids: list[int] = DIRK_WEBGROUP_IDS,
+    store_id: int = DEFAULT_STORE_ID,
+    sleep_sec: float = 0.2,
+) -> list[ProductRecord]:
+    """
+    Scan all the webGroupId, remove deplicates based on productId.
+    Raw GraphQL items are mapped right away; only the ProductRecords are kept.
+    """
+    all_by_id: dict[int, ProductRecord] = {}
 
-        promo_start = offer.get("startDate") or raw.get("startDate")
-        promo_end = offer.get("endDate") or raw.get("endDate")
+    for p in iter_dirk_products(webgroup_ids, store_id=store_id, sleep_sec=sleep_sec):
+        all_by_id[p["sku"]] = p
 
-        
-        unit_qty = None
-        unit_type_en = None
-        if unit_du:
-            unit_qty, unit_type_en = parse_unit(unit_du)
-    
-
-        products.append(
-            {
-                "sku": pid,
-                "product_name_du": product_name_du,
-                "brand": info.get("brand"),
-                "unit_du": unit_du,
-                "unit_qty": unit_qty,
-                "unit_type_en": unit_type_en,
-                "regular_price": normal_price,
-                "current_price": offer_price,
-                "valid_from": promo_start,
-                "valid_to": promo_end,
-                # "department": info.get("department"),
-                # "webgroup": info.get("webgroup"),
-                # "image_path": info.get("image"),
-            }
-        )
+    print(f"\n[INFO] Dirk new products collected: {len(all_by_id)}")
 
-    return products
+    return list(all_by_id.values())
 
 
 # ---------------------------------------------------------------------------
@@ -407,7 +354,75 @@ def build_dirk_url_map() -> Dict[str, str]:
     return sku_to_url
 
 
-def refresh_dirk_daily():
+# joint_skus: price / promo diff shared by the chains (chain_adapter.py)
+build_update_row = build_price_update_row
+
+
+def make_insert_row_builder(sku_to_url: Dict[str, str], translate: bool = True):
+    """
+    add_skus: build the full insert row. Products without a sitemap url are skipped (None).
+    translate=False leaves product_name_en empty for the engine's translate stage.
+    """
+    def build_insert_row(sku: str, new: Dict[str, Any]) -> Dict[str, Any] | None:
+        url = sku_to_url.get(sku)
+        if not url:
+            return None
+        return build_full_insert_row(sku, new, translate=translate, url=url)
+
+    return build_insert_row
+
+
+def fetch_existing_dirk_rows() -> Dict[str, Dict[str, Any]]:
+    supabase = get_supabase()
+    resp = supabase.table("dirk").select(
+        "url, sku, regular_price, current_price, valid_from, valid_to, availability"
+    ).execute()
+    old_rows = resp.data or []
+    return {str(r["sku"]): r for r in old_rows if r.get("sku")}
+
+
+# ---------------------------------------------------------------------------
+# Chain adapter (chain_adapter.py) for orchestrator.py / crawl_worker.py
+# ---------------------------------------------------------------------------
+def fetch_unit(gid: int) -> list[dict]:
+    """fetch stage: raw productAssortment of one webGroupId."""
+    return fetch_webgroup_raw(gid, store_id=DEFAULT_STORE_ID)
+
+
+def map_unit(raw_items: list[dict]) -> list[ProductRecord]:
+    """map stage (runs in the CPU process pool): GraphQL items -> ProductRecords."""
+    return [map_dirk_product(it) for it in raw_items if it.get("productId") is not None]
+
+
+class DirkAdapter(ChainAdapter):
+    """Work unit: one webGroupId of the reference store (DEFAULT_STORE_ID)."""
+
+    name = table = "dirk"
+    fetch_host = "web-dirk-gateway.detailresult.nl"
+    unit_rules = DIRK_UNIT_RULES
+
+    fetch = staticmethod(fetch_unit)
+    map = staticmethod(map_unit)
+
+    def __init__(self):
+        self._build_insert_row = None
+
+    def discover(self) -> List[Any]:
+        # New products need their url from the sitemap, so it is parsed once per run here.
+        self._build_insert_row = make_insert_row_builder(build_dirk_url_map(), translate=False)
+        return list(DIRK_WEBGROUP_IDS)
+
+    def fetch_existing(self) -> Dict[str, Dict[str, Any]]:
+        return fetch_existing_dirk_rows()
+
+    def build_insert_row(self, sku: str, new: Dict[str, Any]) -> Dict[str, Any] | None:
+        return self._build_insert_row(sku, new)
+
+
+ADAPTER = DirkAdapter()
+
+
+def refresh_dirk_daily(streaming: bool = False):
     """
     1. Use GraphQL to parse all products → new_by_sku
     2. Supabase DB → old_by_sku
@@ -417,27 +432,41 @@ def refresh_dirk_daily():
         -> same as daily refresh
     5. add_skus = new_skus - old_skus 
         -> upsert
+
+    streaming=True diffs products while the GraphQL crawl is running (see pipeline.py).
     """
     # -------------------------------------------------------------------
     # 1. Fetch data from supabase
     # -------------------------------------------------------------------
-    supabase = get_supabase()
-    resp = supabase.table("dirk").select(
-        "url, sku, regular_price, current_price, valid_from, valid_to, availability"
-    ).execute()
-    old_rows = resp.data or []
-    old_by_sku = {str(r["sku"]): r for r in old_rows if r.get("sku")}
+    with TELEMETRY.stage("dirk", "existing"):
+        old_by_sku = fetch_existing_dirk_rows()
     old_skus = set(old_by_sku.keys())
     print(f"[Dirk daily] Found {len(old_skus)} existing dirk products in DB.")
 
+    if streaming:
+        # The sitemap is needed for new products, so it is parsed before the crawl starts.
+        sku_to_url = build_dirk_url_map()
+        return run_streaming_refresh(
+            "dirk",
+            old_by_sku,
+            iter_dirk_products(),
+            build_update_row=build_update_row,
+            build_insert_row=make_insert_row_builder(sku_to_url),
+            label="Dirk daily",
+        )
+
 
     # -------------------------------------------------------------------
     # 2. Fetch new dirk products via GraphQL
     # -------------------------------------------------------------------
-    fresh_products = fetch_all_dirk_products()
+    with TELEMETRY.stage("dirk", "fetch"):
+        fresh_products = fetch_all_dirk_products()
     new_by_sku: Dict[str, Dict[str, Any]] = {
         str(p["sku"]): p for p in fresh_products if p.get("sku") is not None
     }
+    # SNAPSHOT_DIR -> today's Parquet snapshot of the catalog (see snapshots.py)
+    SNAPSHOTS.add("dirk", new_by_sku.values())
+    SNAPSHOTS.finish("dirk")
     new_skus = set(new_by_sku.keys())
 
 
@@ -449,6 +478,7 @@ def refresh_dirk_daily():
     # "222": "abc.com/222"
     # }
     sku_to_url = build_dirk_url_map()
+    build_insert_row = make_insert_row_builder(sku_to_url)
     
     # -------------------------------------------------------------------
     # 4. Set the comparision and make the updates
@@ -460,6 +490,7 @@ def refresh_dirk_daily():
     print(f"[Dirk daily] missing_skus: {len(missing_skus)}")
     print(f"[Dirk daily] joint_skus:   {len(joint_skus)}")
     print(f"[Dirk daily] add_skus:     {len(add_skus)}")
+    TELEMETRY.count("rows_diffed", len(new_skus), table="dirk")
 
 
     rows_to_upsert = []
@@ -479,73 +510,24 @@ def refresh_dirk_daily():
     # 4.2) joint_skus:  
     # ----------------------------------------------------------------------
     for sku in joint_skus:
-        old = old_by_sku[sku]
-        new = new_by_sku[sku]
-
-        old_cp = normalize_price(old.get("current_price"))
-        old_rp = normalize_price(old.get("regular_price"))
-        old_vf = normalize_date(old.get("valid_from"))
-        old_vt = normalize_date(old.get("valid_to"))
-
-        new_cp = normalize_price(new.get("current_price"))
-        new_rp = normalize_price(new.get("regular_price"))
-        new_vf = normalize_date(new.get("valid_from"))
-        new_vt = normalize_date(new.get("valid_to"))
-
-        if (
-            new_cp == old_cp
-            and new_rp == old_rp
-            and new_vf == old_vf
-            and new_vt == old_vt
-            and old.get("availability") is True
-        ):
-            continue
-
-        row = {
-            "sku": sku,
-            "regular_price": new.get("regular_price"),
-            "current_price": new.get("current_price"),
-            "valid_from": new.get("valid_from"),
-            "valid_to": new.get("valid_to"),
-            "availability": True,
-        }
-        rows_to_upsert.append(row)
+        row = build_update_row(sku, old_by_sku[sku], new_by_sku[sku])
+        if row is not None:
+            rows_to_upsert.append(row)
 
     # ----------------------------------------------------------------------
     # 4.3) add_skus: insert
     # ----------------------------------------------------------------------
     for sku in add_skus:
-        new = new_by_sku[sku]
-        url = sku_to_url.get(sku)
-        if not url:
-            continue
-        
-        product_name_du = new.get("product_name_du")
-        product_name_en = translate_cached(product_name_du) if product_name_du else None
-
-        rows_to_upsert.append(
-            {
-                "sku": sku,
-                "url": url,
-                "product_name_du": product_name_du,
-                "product_name_en": product_name_en,
-                "brand": new.get("brand"),
-                "unit_du": new.get("unit_du"),
-                "unit_qty": new.get("unit_qty"),
-                "unit_type_en": new.get("unit_type_en"),
-                "regular_price": new.get("regular_price"),
-                "current_price": new.get("current_price"),
-                "valid_from": new.get("valid_from"),
-                "valid_to": new.get("valid_to"),
-                "availability": True,
-            }
-        )
+        row = build_insert_row(sku, new_by_sku[sku])
+        if row is not None:
+            rows_to_upsert.append(row)
 
     if not rows_to_upsert:
         print("[Dirk daily] nothing to upsert.")
         return
 
-    print(f"[Dirk daily] upserting {len(rows_to_upsert)} rows to Supabase...")
+    print(f"[Dirk daily] writing {len(rows_to_upsert)} rows...")
 
-    upsert_rows("dirk", rows_to_upsert, conflict_col="sku")
+    with TELEMETRY.stage("dirk", "write"):
+        write_rows("dirk", rows_to_upsert, conflict_col="sku", old_by_sku=old_by_sku)
     print("[Dirk daily] Done.")
@@ -6,17 +6,17 @@ Full pipeline for dirk_full_crawl.py:
 3. Add the supermarket column
 4. Translate product names to English
 5. Parse unit strings into (unit_qty, unit_type)
-6. Replace ±inf with NaN at DataFrame level
-7. Sanitize data so it's JSON-safe
-8. Upsert
+6. Sanitize per column (±inf/NaN -> null, dates -> ISO) so it's JSON-safe
+7. Upsert the DataFrame in batches
 
 Run this as a one-off or manual script:
     python backend/dirk_full_crawl.py
 """
 
-import numpy as np
 import pandas as pd
-from supabase_utils import upsert_rows
+from snapshots import SNAPSHOTS
+from supabase_utils import write_frame
+from product_record import records_to_frame
 
 # When import, Python will load & execute the entire file dirk_core.py first.
 from dirk_core import (
@@ -49,7 +49,8 @@ if __name__ == "__main__":
 
     # 3. Get product information by GraphQL
     details = fetch_all_dirk_products()
-    df_details = pd.DataFrame(details)
+    # The GraphQL records have no url; it comes from the sitemap (df_url)
+    df_details = records_to_frame(details).drop(columns=["url"])
     print(f"[dirk_full_crawl] df_details: {len(df_details)} rows")
 
     # 4. Combine
@@ -62,13 +63,11 @@ if __name__ == "__main__":
     # 5. Translate product_name_du → product_name_en
     df["product_name_en"] = df["product_name_du"].apply(translate_cached)
 
-    # 6. Replace ±inf with NaN at DataFrame level (just in case)
-    df = df.replace([np.inf, -np.inf], np.nan)
-
-    # 7. Convert to list-of-dicts
-    rows = df.to_dict(orient="records")
-
-    # 8. Upsert
-    print(f"[dirk_full_crawl] Uploading {len(rows)} rows to Supabase...")
-    upsert_rows("dirk",rows)
+    # 6. Sanitize per column (±inf/NaN -> null, dates -> ISO) and upsert the frame
+    #    directly, without converting to a list of dicts first
+    print(f"[dirk_full_crawl] Uploading {len(df)} rows...")
+    write_frame("dirk", df)
 
+    # 7. SNAPSHOT_DIR -> today's Parquet snapshot of the catalog (see snapshots.py)
+    SNAPSHOTS.add_frame("dirk", df)
+    SNAPSHOTS.finish("dirk")
@@ -0,0 +1,323 @@
+"""
+Multi-store Dirk prices.
+
+The daily refresh crawls one reference store (dirk_core.DEFAULT_STORE_ID) with the
+full productAssortment query and keeps product info + reference prices in "dirk".
+This module crawls the other stores in DIRK_STORE_IDS with a prices-only query
+(dirk_core.fetch_webgroup_prices) and stores only the prices that differ from the
+reference store:
+
+    dirk_store_prices (store_id, sku) -> regular_price, current_price, valid_from, valid_to
+
+A store whose prices match the reference has no rows there; the stores themselves are
+listed in dirk_stores, written after every complete crawl of a store. The price of a
+SKU in a store is its dirk_store_prices row if there is one, the "dirk" row otherwise
+(see DIRK_STORE_PRICES_DDL for the tables and a view that resolves it).
+
+Stores and webGroupIds are crawled concurrently (DIRK_STORE_WORKERS threads). With
+DIRK_STORE_BUDGET set, every store only recrawls the webGroupIds whose deltas changed
+most often (refresh_scheduler.py), so groups that always match the reference are
+only checked on the full sweep.
+
+    DIRK_STORE_IDS=66,12,140 python scrapers/dirk_stores.py
+"""
+from __future__ import annotations
+
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Tuple
+
+import dirk_core
+from chain_adapter import normalize_date, normalize_price
+from refresh_scheduler import RefreshScheduler
+from supabase_utils import get_supabase, write_rows
+from telemetry import TELEMETRY, start_run
+
+
+TABLE = "dirk_store_prices"
+STORES_TABLE = "dirk_stores"
+REFERENCE_STORE_ID = dirk_core.DEFAULT_STORE_ID
+DELETE_BATCH = 500
+PAGE_SIZE = 1000
+
+DIRK_STORE_PRICES_DDL = """
+create table if not exists dirk_store_prices (
+    store_id      int4 not null,
+    sku           text not null,
+    regular_price float8,
+    current_price float8,
+    valid_from    text,
+    valid_to      text,
+    primary key (store_id, sku)
+);
+
+-- every crawled store, also the ones without a single delta
+create table if not exists dirk_stores (
+    store_id        int4 primary key,
+    last_crawled_at timestamptz
+);
+
+create or replace view dirk_store_price_view as
+select s.store_id, d.sku,
+       coalesce(p.regular_price, d.regular_price) as regular_price,
+       coalesce(p.current_price, d.current_price) as current_price,
+       case when p.sku is null then d.valid_from else p.valid_from end as valid_from,
+       case when p.sku is null then d.valid_to else p.valid_to end as valid_to
+from dirk d
+cross join dirk_stores s
+left join dirk_store_prices p on p.store_id = s.store_id and p.sku = d.sku;
+"""
+
+
+def store_ids_from_env() -> List[int]:
+    """DIRK_STORE_IDS="66,12,140" -> [12, 140] (the reference store is left out)."""
+    ids = []
+    for part in os.environ.get("DIRK_STORE_IDS", "").split(","):
+        part = part.strip()
+        if part and int(part) != REFERENCE_STORE_ID and int(part) not in ids:
+            ids.append(int(part))
+    return ids
+
+
+# ---------------------------------------------------------------------------
+# Price rows + deltas
+# ---------------------------------------------------------------------------
+def map_store_price(raw: dict) -> Dict[str, Any]:
+    """Prices-only productAssortment item -> the price columns map_dirk_product would give."""
+    offer = raw.get("productOffer") or {}
+    normal_price = raw.get("normalPrice")
+    offer_price = raw.get("offerPrice")
+    # Dirk GraphQL: offerPrice = 0 → means NO OFFER
+    if offer_price in (0, 0.0, None):
+        offer_price = normal_price
+    return {
+        "sku": str(raw.get("productId")),
+        "regular_price": normal_price,
+        "current_price": offer_price,
+        "valid_from": offer.get("startDate") or raw.get("startDate"),
+        "valid_to": offer.get("endDate") or raw.get("endDate"),
+    }
+
+
+def _price_key(row: Dict[str, Any] | None) -> Tuple | None:
+    if row is None:
+        return None
+    return (
+        normalize_price(row.get("regular_price")),
+        normalize_price(row.get("current_price")),
+        # the API sends "2025-11-04T00:00:00", the DB may hold "2025-11-04"
+        (normalize_date(row.get("valid_from")) or "")[:10] or None,
+        (normalize_date(row.get("valid_to")) or "")[:10] or None,
+    )
+
+
+def diff_store_prices(
+    store_id: int,
+    prices: Dict[str, Dict[str, Any]],
+    reference: Dict[str, Dict[str, Any]],
+    stored: Dict[str, Dict[str, Any]],
+) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """
+    prices:    sku -> crawled price row of this store
+    reference: sku -> "dirk" row (reference store)
+    stored:    sku -> current dirk_store_prices row of this store
+
+    Returns (upserts, deletes): delta rows that are new or changed, and SKUs whose
+    stored delta is no longer needed because the store matches the reference again.
+    """
+    upserts, deletes = [], []
+    for sku, row in prices.items():
+        key = _price_key(row)
+        if key == _price_key(reference.get(sku)):
+            if sku in stored:
+                deletes.append(sku)
+        elif key != _price_key(stored.get(sku)):
+            upserts.append({"store_id": store_id, **row})
+    return upserts, deletes
+
+
+# ---------------------------------------------------------------------------
+# DB
+# ---------------------------------------------------------------------------
+def _select_all(build, page_size: int = PAGE_SIZE) -> List[Dict[str, Any]]:
+    """
+    Every row of build() (a fresh query per call), paged by sku (keyset): PostgREST
+    cuts a single response off at its max-rows setting without an error.
+    """
+    rows: List[Dict[str, Any]] = []
+    last = None
+    while True:
+        query = build()
+        if last is not None:
+            query = query.gt("sku", last)
+        page = query.order("sku").limit(page_size).execute().data or []
+        # stop on an empty page, not a short one: max-rows may be below page_size
+        if not page:
+            return rows
+        rows.extend(page)
+        last = page[-1]["sku"]
+
+
+def fetch_reference_prices() -> Dict[str, Dict[str, Any]]:
+    supabase = get_supabase()
+    rows = _select_all(lambda: supabase.table("dirk").select(
+        "sku, regular_price, current_price, valid_from, valid_to"
+    ))
+    return {str(r["sku"]): r for r in rows if r.get("sku")}
+
+
+def fetch_stored_deltas(store_ids: List[int]) -> Dict[int, Dict[str, Dict[str, Any]]]:
+    supabase = get_supabase()
+    stored: Dict[int, Dict[str, Dict[str, Any]]] = {sid: {} for sid in store_ids}
+    # one store at a time: the sku keyset is only unique within a store
+    for sid in store_ids:
+        rows = _select_all(lambda: supabase.table(TABLE).select(
+            "store_id, sku, regular_price, current_price, valid_from, valid_to"
+        ).eq("store_id", sid))
+        for r in rows:
+            stored[sid][str(r["sku"])] = r
+    return stored
+
+
+def delete_deltas(store_id: int, skus: List[str]):
+    supabase = get_supabase()
+    for start in range(0, len(skus), DELETE_BATCH):
+        chunk = skus[start:start + DELETE_BATCH]
+        with TELEMETRY.timed_call(f"DELETE supabase/rest/v1/{TABLE}"):
+            supabase.table(TABLE).delete().eq("store_id", store_id).in_("sku", chunk).execute()
+
+
+# ---------------------------------------------------------------------------
+# Crawl
+# ---------------------------------------------------------------------------
+def fetch_store_group(store_id: int, gid: int) -> Dict[str, Dict[str, Any]]:
+    items = dirk_core.fetch_webgroup_prices(gid, store_id)
+    rows = (map_store_price(it) for it in items if it.get("productId") is not None)
+    return {r["sku"]: r for r in rows}
+
+
+def _select_groups(
+    scheduler: RefreshScheduler | None, store_id: int
+) -> Tuple[List[int], bool]:
+    if scheduler is None:
+        return list(dirk_core.DIRK_WEBGROUP_IDS), True
+    return scheduler.select(f"dirk_store_{store_id}", dirk_core.DIRK_WEBGROUP_IDS)
+
+
+def scheduler_from_env(store_ids: List[int]) -> RefreshScheduler | None:
+    """
+    DIRK_STORE_BUDGET             webGroupId requests per store and run (unset -> all)
+    DIRK_STORE_SCHEDULER_STATE    JSON state file (default dirk_store_scheduler_state.json)
+    REFRESH_FULL_SWEEP_HOURS      every store is fully recrawled at least this often
+    """
+    budget = os.environ.get("DIRK_STORE_BUDGET")
+    if not budget:
+        return None
+    return RefreshScheduler(
+        os.environ.get("DIRK_STORE_SCHEDULER_STATE", "dirk_store_scheduler_state.json"),
+        {f"dirk_store_{sid}": int(budget) for sid in store_ids},
+        full_sweep_hours=float(os.environ.get("REFRESH_FULL_SWEEP_HOURS", 72)),
+    )
+
+
+def refresh_dirk_store_prices(
+    store_ids: List[int] | None = None,
+    workers: int | None = None,
+    scheduler: RefreshScheduler | None = None,
+) -> Dict[str, Any]:
+    """
+    Crawl the prices of every store in store_ids and write their deltas against the
+    reference store. Run after the Dirk daily refresh, so "dirk" holds today's
+    reference prices.
+    """
+    store_ids = store_ids if store_ids is not None else store_ids_from_env()
+    if not store_ids:
+        print("[Dirk stores] no stores besides the reference store, nothing to do")
+        return {}
+    workers = workers or int(os.environ.get("DIRK_STORE_WORKERS", "8"))
+
+    with TELEMETRY.stage(TABLE, "existing"):
+        reference = fetch_reference_prices()
+        stored = fetch_stored_deltas(store_ids)
+    print(f"[Dirk stores] {len(reference)} reference prices, "
+          f"{sum(len(v) for v in stored.values())} stored deltas for {len(store_ids)} stores")
+
+    plan = {sid: _select_groups(scheduler, sid) for sid in store_ids}
+    summary: Dict[str, Any] = {}
+    upserts: List[Dict[str, Any]] = []
+    crawled: List[Dict[str, Any]] = []
+    crawled_at = datetime.now(timezone.utc).isoformat()
+
+    with TELEMETRY.stage(TABLE, "fetch"):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(fetch_store_group, sid, gid): (sid, gid)
+                for sid, (gids, _) in plan.items()
+                for gid in gids
+            }
+            results: Dict[int, Dict[int, Dict[str, Dict[str, Any]]]] = {sid: {} for sid in store_ids}
+            for future in as_completed(futures):
+                sid, gid = futures[future]
+                try:
+                    results[sid][gid] = future.result()
+                except Exception as e:
+                    print(f"[Dirk stores] !! store {sid} gid={gid}: {e}")
+                    TELEMETRY.count("errors", kind="webgroup", chain="dirk_stores")
+
+    with TELEMETRY.stage(TABLE, "write"):
+        for sid in store_ids:
+            gids, full_sweep = plan[sid]
+            prices: Dict[str, Dict[str, Any]] = {}
+            for gid, group in results[sid].items():
+                prices.update(group)
+                if scheduler is not None:
+                    # a group "changes" when one of its deltas appears, changes or goes away
+                    changed, gone = diff_store_prices(sid, group, reference, stored[sid])
+                    scheduler.observe(f"dirk_store_{sid}", gid, len(group), len(changed) + len(gone), 1)
+
+            store_upserts, deletes = diff_store_prices(sid, prices, reference, stored[sid])
+            upserts.extend(store_upserts)
+            if deletes:
+                delete_deltas(sid, deletes)
+
+            failed = len(gids) - len(results[sid])
+            if scheduler is not None:
+                scheduler.finish(f"dirk_store_{sid}", full_sweep and failed == 0)
+            if failed == 0:
+                crawled.append({"store_id": sid, "last_crawled_at": crawled_at})
+
+            deltas = sum(1 for sku, row in prices.items()
+                         if _price_key(row) != _price_key(reference.get(sku)))
+            summary[str(sid)] = {
+                "groups": len(results[sid]),
+                "failed_groups": failed,
+                "products": len(prices),
+                "deltas": deltas,
+                "upserted": len(store_upserts),
+                "deleted": len(deletes),
+            }
+            print(f"[Dirk stores] store {sid}: {len(prices)} products, {deltas} differ from "
+                  f"store {REFERENCE_STORE_ID} ({len(store_upserts)} upserts, {len(deletes)} deletes)")
+
+        write_rows(TABLE, upserts, conflict_col="store_id,sku")
+        # after the deltas, so the view never shows a new store with reference prices only
+        write_rows(STORES_TABLE, crawled, conflict_col="store_id")
+
+    if scheduler is not None:
+        scheduler.save()
+    return summary
+
+
+def main():
+    start_run()
+    try:
+        summary = refresh_dirk_store_prices(scheduler=scheduler_from_env(store_ids_from_env()))
+        print(json.dumps({"dirk_stores": summary}, indent=2))
+    finally:
+        TELEMETRY.write_outputs()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""
+Embeddings for new products, computed during the daily refresh.
+
+write_rows (supabase_utils.py) calls embed_new_rows() on every batch it writes. Rows
+that carry a product_name_du (inserts from build_insert_row / the enrich stage) get
+embedding_du + embedding_text_hash filled in before the upsert, so a new SKU is
+searchable by similarity right after the refresh, without a second write pass or a
+manual run of backend/embed_existing_products.py.
+
+    EMBEDDER=local   the model in this process (torch, or ONNX with EMBED_BACKEND=onnx)
+    EMBEDDER=http    POST {"texts": [...]} to EMBEDDER_URL (default HF_EMBEDDING_URL),
+                     the hf-space /embed endpoint
+    unset / "off"    nothing is embedded, the backfill does it later
+
+With EMBEDDING_PACKED_FORMAT=f16|i8 the rows also get embedding_packed (embedding_codec.py).
+embedding_text_hash and embedding_packed are only written to tables that have them
+(EMBEDDING_TEXT_HASH_DDL / EMBEDDING_PACKED_DDL, supabase_utils.has_column).
+
+Texts go through the embedding cache first (embedding_cache.py, EMBEDDING_CACHE_PATH),
+so only texts never seen before reach the model. A failed embedding call leaves the
+rows without embedding; they are written anyway and the backfill picks them up. After
+MAX_FAILURES failed calls in a row the embedder stops trying for the rest of the run.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+import requests
+
+from embedding_cache import EmbeddingCache, embed_text, text_hash
+from embedding_codec import FORMATS, pack
+from onnx_encoder import load_encoder
+from telemetry import TELEMETRY
+
+
+MODEL_NAME = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+EMBED_TABLES = ("ah", "dirk", "hoogvliet")
+BATCH_SIZE = 64
+MAX_FAILURES = 3            # consecutive failed calls before the embedder gives up for the run
+
+
+class Embedder:
+    """Base class: _encode(texts) -> one vector per text, in order."""
+
+    name = "base"
+
+    def __init__(
+        self,
+        model_name: str = MODEL_NAME,
+        batch_size: int = BATCH_SIZE,
+        cache: EmbeddingCache | None = None,
+        packed: str | None = None,
+    ):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache = cache
+        self.packed = packed
+        self.failures = 0
+
+    def _encode(self, texts: List[str]) -> Sequence[Sequence[float]]:
+        raise NotImplementedError
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        out: List[List[float]] = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            if self.cache is not None:
+                out.extend(self.cache.encode(self.model_name, batch, self._encode))
+            else:
+                out.extend([float(x) for x in vec] for vec in self._encode(batch))
+        return out
+
+    def embed_rows(self, table: str, rows: List[Dict[str, Any]]) -> int:
+        """Fill embedding_du / embedding_text_hash of the rows with a name; returns rows embedded."""
+        targets, texts = [], []
+        for row in rows:
+            if "product_name_du" not in row or row.get("embedding_du") is not None:
+                continue
+            text = embed_text(row)
+            if text is not None:
+                targets.append(row)
+                texts.append(text)
+        if not targets or self.failures >= MAX_FAILURES:
+            return 0
+
+        try:
+            with TELEMETRY.stage(table, "embed"):
+                vectors = self.encode(texts)
+            self.failures = 0
+        except Exception as e:
+            self.failures += 1
+            print(f"[embedder] ❌ {table}: embedding {len(texts)} rows failed ({e}), "
+                  f"writing them without embedding")
+            if self.failures >= MAX_FAILURES:
+                print(f"[embedder] {MAX_FAILURES} failures in a row, no more embedding in this run")
+            TELEMETRY.count("errors", kind="embed", chain=table)
+            return 0
+
+        # imported here: supabase_utils imports this module
+        from supabase_utils import has_column
+        with_hash = has_column(table, "embedding_text_hash")
+        packed = self.packed if self.packed and has_column(table, "embedding_packed") else None
+        for row, text, vec in zip(targets, texts, vectors):
+            row["embedding_du"] = vec
+            if with_hash:
+                row["embedding_text_hash"] = text_hash(text)
+            if packed:
+                row["embedding_packed"] = pack(vec, packed)
+        TELEMETRY.count("rows_embedded", len(targets), table=table, embedder=self.name)
+        return len(targets)
+
+
+class LocalEmbedder(Embedder):
+    name = "local"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _encode(self, texts: List[str]) -> Sequence[Sequence[float]]:
+        # the write batches of several chains can embed at the same time; one model, one at a time
+        with self._lock:
+            if self._model is None:
+                print(f"[embedder] loading {self.model_name} ...")
+                self._model = load_encoder(self.model_name)
+            return self._model.encode(
+                texts,
+                normalize_embeddings=True,
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+                convert_to_numpy=True,
+            ).astype("float32")
+
+
+class HttpEmbedder(Embedder):
+    name = "http"
+
+    def __init__(self, url: str, *args, timeout: float = 60, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.url = url
+        self.timeout = timeout
+        self._session = requests.Session()
+
+    def _encode(self, texts: List[str]) -> Sequence[Sequence[float]]:
+        # raw float32 matrix if the service supports it (hf-space /embed), JSON otherwise
+        resp = self._session.post(
+            self.url,
+            json={"texts": texts},
+            headers={"Accept": "application/octet-stream, application/json;q=0.5"},
+            timeout=self.timeout,
+        )
+        resp.raise_for_status()
+        if resp.headers.get("content-type", "").startswith("application/octet-stream"):
+            embeddings = np.frombuffer(resp.content, dtype="<f4").reshape(len(texts), -1)
+        else:
+            embeddings = resp.json()["embeddings"]
+        if len(embeddings) != len(texts):
+            raise ValueError(f"{len(texts)} texts sent, {len(embeddings)} embeddings returned")
+        return embeddings
+
+
+def from_env() -> Embedder | None:
+    """
+    EMBEDDER               local | http | off (default off)
+    EMBEDDER_URL           /embed endpoint for http (default HF_EMBEDDING_URL)
+    EMBEDDER_BATCH_SIZE    texts per model call / request (default 64)
+    EMBEDDING_CACHE_PATH   embedding cache file; EMBEDDING_CACHE=off disables it
+    EMBEDDING_PACKED_FORMAT  f16 | i8: also write embedding_packed (default off)
+    """
+    kind = (os.environ.get("EMBEDDER") or "off").lower()
+    if kind in ("", "off", "none"):
+        return None
+
+    batch_size = int(os.environ.get("EMBEDDER_BATCH_SIZE", BATCH_SIZE))
+    cache = None if os.environ.get("EMBEDDING_CACHE", "").lower() == "off" else EmbeddingCache()
+    packed = os.environ.get("EMBEDDING_PACKED_FORMAT") or None
+    if packed and packed not in FORMATS:
+        raise ValueError(f"EMBEDDING_PACKED_FORMAT must be one of {FORMATS}, not {packed!r}")
+
+    if kind == "local":
+        embedder = LocalEmbedder(batch_size=batch_size, cache=cache, packed=packed)
+    elif kind == "http":
+        url = os.environ.get("EMBEDDER_URL") or os.environ.get("HF_EMBEDDING_URL")
+        if not url:
+            print("[embedder] EMBEDDER=http but no EMBEDDER_URL / HF_EMBEDDING_URL, not embedding")
+            return None
+        embedder = HttpEmbedder(url, batch_size=batch_size, cache=cache, packed=packed)
+    else:
+        raise ValueError(f"EMBEDDER must be local, http or off, not {kind!r}")
+
+    print(f"[embedder] {embedder.name} embedder, batch size {batch_size}"
+          + (f", cache {cache.path}" if cache is not None else "")
+          + (f", packed {packed}" if packed else ""))
+    return embedder
+
+
+_embedder: Embedder | None = None
+_embedder_loaded = False
+_embedder_lock = threading.Lock()
+
+
+def get_embedder() -> Embedder | None:
+    global _embedder, _embedder_loaded
+    with _embedder_lock:
+        if not _embedder_loaded:
+            _embedder = from_env()
+            _embedder_loaded = True
+    return _embedder
+
+
+def embed_new_rows(table: str, rows: List[Dict[str, Any]]) -> int:
+    """Embed the new products among `rows` in place (no-op without EMBEDDER)."""
+    if table not in EMBED_TABLES:
+        return 0
+    embedder = get_embedder()
+    if embedder is None:
+        return 0
+    return embedder.embed_rows(table, rows)
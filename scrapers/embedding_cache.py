@@ -0,0 +1,143 @@
+"""
+Content-addressed cache of product text embeddings.
+
+The backfill (backend/embed_existing_products.py) and the daily refresh embed
+brand + " " + product_name_du. The same text recurs across chains, private-label
+variants and re-listed SKUs, so embeddings are stored by content instead of by row:
+
+    key = sha256(model name + "\\0" + normalized text)  ->  float32 vector
+
+in one SQLite file (EMBEDDING_CACHE_PATH, default embedding_cache.sqlite). encode()
+looks every text up first and only hands the true misses to the model; identical
+texts in one call are encoded once.
+
+Every embedded row also stores text_hash(text) in embedding_text_hash (see
+EMBEDDING_TEXT_HASH_DDL). A row whose hash no longer matches its current brand / name
+has a stale embedding; the backfill re-embeds those with --stale.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from typing import Callable, Dict, Iterable, List, Sequence
+
+import numpy as np
+
+
+EMBEDDING_TEXT_HASH_DDL = """
+alter table ah        add column if not exists embedding_text_hash text;
+alter table dirk      add column if not exists embedding_text_hash text;
+alter table hoogvliet add column if not exists embedding_text_hash text;
+"""
+
+_SPACES = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """NFKC + collapsed whitespace. Case is kept: the model is cased."""
+    return _SPACES.sub(" ", unicodedata.normalize("NFKC", text)).strip()
+
+
+def embed_text(row) -> str | None:
+    """The text a product is embedded by: brand + " " + product_name_du (None without a name)."""
+    brand = (row.get("brand") or "").strip()
+    name = (row.get("product_name_du") or "").strip()
+    if not name:
+        return None
+    return (brand + " " + name).strip() or None
+
+
+def text_hash(text: str) -> str:
+    """Hash of the normalized text, stored per row in embedding_text_hash."""
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+def cache_key(model: str, text: str) -> bytes:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str | None = None):
+        self.path = path or os.environ.get("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript(
+            """
+            PRAGMA journal_mode = WAL;
+            CREATE TABLE IF NOT EXISTS embeddings (
+                key BLOB PRIMARY KEY,
+                dim INTEGER NOT NULL,
+                vec BLOB NOT NULL
+            ) WITHOUT ROWID;
+            """
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    # ----- lookups -----
+    def get_many(self, model: str, texts: Iterable[str]) -> Dict[str, np.ndarray]:
+        """text -> cached vector, for the texts that are in the cache."""
+        keys = {cache_key(model, t): t for t in texts}
+        found: Dict[str, np.ndarray] = {}
+        items = list(keys)
+        with self._lock:
+            for start in range(0, len(items), 500):
+                chunk = items[start:start + 500]
+                marks = ",".join("?" * len(chunk))
+                for key, dim, vec in self._conn.execute(
+                    f"SELECT key, dim, vec FROM embeddings WHERE key IN ({marks})", chunk
+                ):
+                    found[keys[key]] = np.frombuffer(vec, dtype="float32", count=dim)
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, Sequence[float]]):
+        rows = []
+        for text, vec in vectors.items():
+            arr = np.asarray(vec, dtype="float32")
+            rows.append((cache_key(model, text), int(arr.shape[0]), arr.tobytes()))
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, dim, vec) VALUES (?, ?, ?)", rows)
+
+    # ----- encode through the cache -----
+    def encode(
+        self,
+        model: str,
+        texts: List[str],
+        encode_fn: Callable[[List[str]], Sequence[Sequence[float]]],
+    ) -> List[List[float]]:
+        """
+        Embeddings of `texts` in input order. Only the distinct texts that are not
+        cached go to encode_fn (as normalized texts); its results are cached.
+        """
+        if not texts:
+            return []
+        normalized = [normalize_text(t) for t in texts]
+        cached = self.get_many(model, set(normalized))
+
+        todo = [t for t in dict.fromkeys(normalized) if t not in cached]
+        if todo:
+            fresh = dict(zip(todo, encode_fn(todo)))
+            self.put_many(model, fresh)
+            cached.update((t, np.asarray(v, dtype="float32")) for t, v in fresh.items())
+
+        with self._lock:
+            self.hits += len(texts) - len(todo)
+            self.misses += len(todo)
+        return [cached[t].tolist() for t in normalized]
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses,
+                "hit_rate": round(self.hits / total, 3) if total else None}
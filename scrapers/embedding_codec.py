@@ -0,0 +1,142 @@
+"""
+Compact text encoding of embedding vectors.
+
+embedding_du holds 384 floats. As JSON that is ~8 KB per row, and the search backend
+(render/search_logic.py) has to json.loads it for each of the ~100 candidates of a
+query. embedding_packed holds the same vector as one short ASCII string:
+
+    "f16:" + base64(float16 little endian)                      768 bytes raw, ~1 KB text
+    "i8:"  + base64(float32 scale + int8 values, v = q * scale)  388 bytes raw, ~520 B text
+
+unpack() decodes either form with one np.frombuffer. The embeddings are normalized,
+so the loss is far below what the similarity ranking can see (f16 ~1e-4, i8 ~1e-3
+absolute error per component).
+
+SEARCH_PRODUCTS_TS_SQL is the search RPC that render/search_logic.py calls. It returns
+embedding_packed, and embedding_du only for rows that are not packed yet, so the
+search decodes most candidates with unpack() and parses JSON only for the rest. Run
+EMBEDDING_PACKED_DDL, then SEARCH_PRODUCTS_TS_SQL (it replaces the deployed function),
+then `backend/embed_existing_products.py --packed f16 --pack-existing`.
+
+render/embedding_codec.py is a copy of this file (the backend is deployed on its own).
+"""
+from __future__ import annotations
+
+import base64
+from typing import Sequence
+
+import numpy as np
+
+
+EMBEDDING_PACKED_DDL = """
+alter table ah        add column if not exists embedding_packed text;
+alter table dirk      add column if not exists embedding_packed text;
+alter table hoogvliet add column if not exists embedding_packed text;
+"""
+
+SEARCH_PRODUCTS_TS_SQL = """
+drop function if exists search_products_ts(text, text, text[], text, integer);
+
+create function search_products_ts(
+    query_text   text,
+    search_lang  text,
+    supermarkets text[],
+    sort_by      text default 'unit_price',
+    max_results  integer default 100
+)
+returns table (
+    supermarket      text,
+    sku              text,
+    url              text,
+    product_name_du  text,
+    product_name_en  text,
+    brand            text,
+    unit_du          text,
+    unit_qty         float8,
+    unit_type_en     text,
+    regular_price    float8,
+    current_price    float8,
+    unit_price       float8,
+    valid_from       text,
+    valid_to         text,
+    text_rank        real,
+    embedding_packed text,
+    embedding_du     text
+)
+language sql stable
+as $fn$
+    with products as (
+        select 'ah'::text as supermarket, sku::text, url, product_name_du, product_name_en, brand,
+               unit_du, unit_qty::float8, unit_type_en, regular_price::float8, current_price::float8,
+               valid_from::text, valid_to::text, availability, embedding_packed, embedding_du
+        from ah where 'ah' = any(supermarkets)
+        union all
+        select 'dirk', sku::text, url, product_name_du, product_name_en, brand,
+               unit_du, unit_qty::float8, unit_type_en, regular_price::float8, current_price::float8,
+               valid_from::text, valid_to::text, availability, embedding_packed, embedding_du
+        from dirk where 'dirk' = any(supermarkets)
+        union all
+        select 'hoogvliet', sku::text, url, product_name_du, product_name_en, brand,
+               unit_du, unit_qty::float8, unit_type_en, regular_price::float8, current_price::float8,
+               valid_from::text, valid_to::text, availability, embedding_packed, embedding_du
+        from hoogvliet where 'hoogvliet' = any(supermarkets)
+    ),
+    matched as (
+        select p.*,
+               case when search_lang = 'en'
+                    then ts_rank(to_tsvector('english', coalesce(p.product_name_en, '')),
+                                 websearch_to_tsquery('english', query_text))
+                    else ts_rank(to_tsvector('dutch', coalesce(p.product_name_du, '')),
+                                 websearch_to_tsquery('dutch', query_text))
+               end as text_rank
+        from products p
+        where p.availability is not false
+          and case when search_lang = 'en'
+                   then to_tsvector('english', coalesce(p.product_name_en, ''))
+                        @@ websearch_to_tsquery('english', query_text)
+                   else to_tsvector('dutch', coalesce(p.product_name_du, ''))
+                        @@ websearch_to_tsquery('dutch', query_text)
+              end
+    )
+    select m.supermarket, m.sku, m.url, m.product_name_du, m.product_name_en, m.brand,
+           m.unit_du, m.unit_qty, m.unit_type_en, m.regular_price, m.current_price,
+           m.current_price / nullif(m.unit_qty, 0) as unit_price,
+           m.valid_from, m.valid_to, m.text_rank,
+           m.embedding_packed,
+           -- the ~8 KB JSON vector only where there is no packed one yet
+           case when m.embedding_packed is null then m.embedding_du::text end as embedding_du
+    from matched m
+    order by m.text_rank desc,
+             case when sort_by = 'current_price' then m.current_price
+                  else m.current_price / nullif(m.unit_qty, 0) end nulls last
+    limit max_results;
+$fn$;
+"""
+
+FORMATS = ("f16", "i8")
+
+
+def pack(vec: Sequence[float], fmt: str = "f16") -> str:
+    arr = np.asarray(vec, dtype="float32")
+    if fmt == "f16":
+        raw = arr.astype("<f2").tobytes()
+    elif fmt == "i8":
+        peak = float(np.abs(arr).max()) if arr.size else 0.0
+        scale = np.float32(peak / 127.0 if peak else 1.0)
+        q = np.clip(np.rint(arr / scale), -127, 127).astype("i1")
+        raw = np.asarray([scale], dtype="<f4").tobytes() + q.tobytes()
+    else:
+        raise ValueError(f"embedding format must be one of {FORMATS}, not {fmt!r}")
+    return fmt + ":" + base64.b64encode(raw).decode("ascii")
+
+
+def unpack(packed: str) -> np.ndarray:
+    """float32 vector of a pack() string."""
+    fmt, _, data = packed.partition(":")
+    raw = base64.b64decode(data)
+    if fmt == "f16":
+        return np.frombuffer(raw, dtype="<f2").astype("float32")
+    if fmt == "i8":
+        scale = np.frombuffer(raw, dtype="<f4", count=1)[0]
+        return np.frombuffer(raw, dtype="i1", offset=4).astype("float32") * scale
+    raise ValueError(f"unknown embedding format {fmt!r}")
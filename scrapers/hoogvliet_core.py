@@ -6,14 +6,34 @@ import pandas as pd
 import re
 import time
 from datetime import date
+from typing import Any, Dict, List
 
 import pandas as pd
 import requests
 from bs4 import BeautifulSoup
-from deep_translator import GoogleTranslator
 from datetime import date, datetime
 
-from supabase_utils import get_supabase, upsert_rows
+from chain_adapter import (
+    HOOGVLIET_UNIT_RULES,
+    ChainAdapter,
+    needs_translation,
+    normalize_date,
+    normalize_price,
+    translate_cached,
+)
+from supabase_utils import get_supabase, write_rows
+from pipeline import run_streaming_refresh
+from product_record import ProductRecord
+from snapshots import SNAPSHOTS
+from telemetry import TELEMETRY
+
+
+# ---------------------------------------------------------------------------
+# Unit parsing
+# ---------------------------------------------------------------------------
+def parse_unit(unit_text: str):
+    """Unit text -> (unit_qty, unit_type) with the Hoogvliet rules (ADAPTER.unit_rules)."""
+    return ADAPTER.parse_unit(unit_text)
 
 
 # ---------------------------------------------------------------------------
@@ -55,120 +75,6 @@ def format_unit(base_unit, ratio):
     return f"{ratio_str} {base_unit}"
 
 
-def normalize_price(v):
-    """
-    Normalize price to float or None for comparison.
-    - In scrapper: current_price = f"0.{price_large_tag.get_text(strip=True)}". This is a string.
-    - In supabse: current_price is stored as float8
-    - To compare them, we need to normalize into float. 
-    """
-    if v is None:
-        return None
-    return float(v) 
-
-
-def normalize_date(v):
-    """Convert date/datetime to ISO string for comparison; keep None as None.
-    - In scrapper: date(2025, 11, 4)
-    - In supabse: "2025-11-04"
-    """
-    if v is None:
-        return None
-    if isinstance(v, (date, datetime)):
-        return v.isoformat()
-    return str(v)
-
-
-# ---------------------------------------------------------------------------
-# Unit parsing
-# ---------------------------------------------------------------------------
-def handle_normalized(unit_text): 
-    """
-    Converts the normalized format of unit (e g. 205 g, 290kg) into (unit_qty, unit_type),
-    with unit_type ∈ {"kg", "l", "piece"}.
-    """
-    m = re.match(r"^\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]+)", unit_text)
-    if not m:
-        print("[WARN] cannot parse:", unit_text)
-        return None, None
-    
-    unit_qty = float(m.group(1))   
-    unit_type = m.group(2)
-
-    if unit_type in ("g","gram", "gr"): # "500 gr"," 154 gram"
-        return unit_qty / 1000.0, "kg"
-    if unit_type in ("kg", "kilo"):
-        return unit_qty, "kg"
-    if unit_type in ("ml","milliliter"):
-        return unit_qty / 1000.0, "l"
-    if unit_type == "cl":
-        return unit_qty / 100.0, "l"
-    if unit_type == "l":
-        return unit_qty, "l"    
-    
-    return unit_qty, "piece"
-
-
-def parse_unit(unit_text: str):
-    """
-    Converts messy Dutch unit strings into (unit_qty, unit_type)
-        - Converts messy unit into normalized unit first, so the function "handle_normalized" can handle it.
-    unit_type ∈ {"kg", "l", "piece"} or (None, None) if unknown.
-    """
-    if pd.isna(unit_text):
-        return None, None
-
-    s = unit_text.strip().lower()
-    s = s.replace(",", ".")
-    s = s.replace("×", "x")
-    s = s.replace("stuks", "stuk")
-    s = s.replace("st.", "stuk")
-    s = s.replace("-"," ")           # "5-pack" -> "5 pack"
-    s = re.sub(r"^\s*per\s+", "", s) # "per 500 g" -> "g", "per stuk" -> "stuk"
-    s = s.split("(")[0].strip()      # Extract everything before the first left parenthese "1 kg (ca. 5 stuk)"
-
-    # "stuk" -> "1 stuk"
-    if not any(i.isdigit() for i in s): 
-        s = "1 " + s
-
-    # "6 x 250 g" -> "1500 g"
-    m = re.match(r"(\d+)\s*x\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]+)", s)
-    if m:
-        count = float(m.group(1))
-        size = float(m.group(2))
-        unit_type = m.group(3).split()[0] # eg. "6 x 250 g appel" -> drop "appel"
-        unit_qty = size * count
-        s = str(unit_qty) + unit_type
-    
-    return(handle_normalized(s))     
-
-
-# ---------------------------------------------------------------------------
-# Translation
-# ---------------------------------------------------------------------------
-translation_cache = {}
-
-def translate_cached(text):
-    """
-    Translate a Dutch product name to English using GoogleTranslator, with an in-memory cache.
-
-    Returns None if text is None or translation fails.
-    """
-    if not text:
-        return None
-    
-    if text in translation_cache:
-        return translation_cache[text]
-
-    try:
-        en = GoogleTranslator(source='nl', target='en').translate(text)
-        translation_cache[text] = en
-        return en
-    except Exception as e:
-        print(f"[translate_product_names] Translation failed for: {text} | Reason: {e}")
-        return None
-    
-
 # ---------------------------------------------------------------------------
 # Tweakwise API: Fetch the sku of all the products
 # ---------------------------------------------------------------------------
@@ -228,78 +134,94 @@ def parse_unit_from_attributes(attributes):
     return base_unit, ratio
 
 
-def fetch_category_items(tn_cid: str, page_size: int = 16):
+def fetch_category_page(tn_cid: str, page: int = 1, page_size: int = 16):
     """
-    Start from page 1 of a given category (tn_cid).
-    Call the hidden API with those query parameters.
-    Returns all the products on a given category.
+    Call the hidden API for one page of a given category (tn_cid).
+    Returns (items, nrof_pages).
     """
-    all_items = []
-    page = 1
+    params = {
+        "tn_q": "",
+        "tn_p": page,           
+        "tn_ps": page_size,
+        "tn_sort": "Relevantie",
+        "tn_cid": tn_cid,
+        "t": "json",
+    }
 
-    while True:
-        params = {
-            "tn_q": "",
-            "tn_p": page,           
-            "tn_ps": page_size,
-            "tn_sort": "Relevantie",
-            "tn_cid": tn_cid,
-            "t": "json",
-        }
+    r = requests.get(SEARCH_URL, headers=HEADERS, params=params, timeout=30)
+    r.raise_for_status()
+
+    # "data:" {
+    #   "items": [...],
+    #   "properties": {...},
+    #   "facets": [...]
+    # }
+    data = r.json()  
+
+    items = data["items"]
+    props = data["properties"]
+    nrof_pages = props.get("nrofpages", 1)
+
+    print(f"page {page}: {len(items)} items, total pages = {nrof_pages}")
+
+    # "items": [
+    #     {
+    #         "itemno": "727444000",
+    #         "title": "AH Bolletjes wit 10 stuks",
+    #         "price": "1.85",
+    #         "url": "/product/727444000/bolletjes-wit-10-stuks",
+    #         "attributes": [
+    #             {"name": "BaseUnit", "values": ["stuk"]},
+    #             {"name": "RatioBasePackingUnit", "values": ["10"]}
+    #         ]
+    #     },
+    #     {...
+    #     },
+    # ]
+    page_items = []
+    for it in items:
+        base_unit, ratio = parse_unit_from_attributes(it.get("attributes", []))
+        page_items.append(
+            {
+                "sku": it["itemno"],
+                "brand": it.get("brand"),
+                "title": it["title"],
+                "price": it["price"],
+                "url": it["url"],
+                "base_unit": base_unit,
+                "ratio": ratio,
+            }
+        )
 
-        r = requests.get(SEARCH_URL, headers=HEADERS, params=params, timeout=30)
-        r.raise_for_status()
+    return page_items, nrof_pages
 
-        # "data:" {
-        #   "items": [...],
-        #   "properties": {...},
-        #   "facets": [...]
-        # }
-        data = r.json()  
 
-        items = data["items"]
-        props = data["properties"]
-        nrof_pages = props.get("nrofpages", 1)
+def iter_category_items(tn_cid: str, page_size: int = 16):
+    """
+    Start from page 1 of a given category (tn_cid).
+    Yields the products of a given category, page by page.
+    """
+    page = 1
 
-        print(f"page {page}: {len(items)} items, total pages = {nrof_pages}")
+    while True:
+        items, nrof_pages = fetch_category_page(tn_cid, page=page, page_size=page_size)
 
         if not items:
             break
 
-        # "items": [
-        #     {
-        #         "itemno": "727444000",
-        #         "title": "AH Bolletjes wit 10 stuks",
-        #         "price": "1.85",
-        #         "url": "/product/727444000/bolletjes-wit-10-stuks",
-        #         "attributes": [
-        #             {"name": "BaseUnit", "values": ["stuk"]},
-        #             {"name": "RatioBasePackingUnit", "values": ["10"]}
-        #         ]
-        #     },
-        #     {...
-        #     },
-        # ]
-        for it in items:
-            base_unit, ratio = parse_unit_from_attributes(it.get("attributes", []))
-            all_items.append(
-                {
-                    "sku": it["itemno"],
-                    "brand": it.get("brand"),
-                    "title": it["title"],
-                    "price": it["price"],
-                    "url": it["url"],
-                    "base_unit": base_unit,
-                    "ratio": ratio,
-                }
-            )
+        yield from items
 
         if page >= nrof_pages:
             break
 
         page += 1
 
-    return all_items
+
+def fetch_category_items(tn_cid: str, page_size: int = 16):
+    """
+    Returns all the products on a given category.
+    """
+    return list(iter_category_items(tn_cid, page_size=page_size))
 
 
 def fetch_all_skus():
@@ -367,11 +289,13 @@ def fetch_products_by_skus(skus):
         resp.raise_for_status()
     except requests.RequestException:
         print(f"[WARN] Intershop request failed (status={resp.status_code}, batch={len(skus)})")
+        TELEMETRY.count("errors", kind="intershop_status", chain="hoogvliet")
         return None
 
     # --- Empty body ---
     if not resp.text or not resp.text.strip():
         print(f"[WARN] Intershop returned empty body (batch={len(skus)})")
+        TELEMETRY.count("errors", kind="intershop_empty", chain="hoogvliet")
         return None
 
     # --- JSON decode failure ---
@@ -379,6 +303,7 @@ def fetch_products_by_skus(skus):
         data = resp.json()
     except ValueError:
         print(f"[WARN] Intershop JSON decode failed (status={resp.status_code}, batch={len(skus)})")
+        TELEMETRY.count("errors", kind="intershop_json", chain="hoogvliet")
         return None
 
     # Normal JSON structure
@@ -395,6 +320,28 @@ def chunked(iterable, n):
             yield iterable[i:i + n]
 
 
+def prices_from_products(products):
+    """
+    Intershop products -> {sku: {"regular_price": ..., "current_price": ...}}
+    """
+    price_map = {}
+    for p in products:
+        sku = p.get("sku") or p.get("itemno")
+        if not sku:
+            continue
+
+        list_price = p.get("listPrice")
+        discounted = p.get("discountedPrice")
+
+        current = discounted if discounted not in (None, "", 0, "0") else list_price
+
+        price_map[sku] = {
+            "regular_price": list_price,
+            "current_price": current,
+        }
+    return price_map
+
+
 def build_price_map(all_items, batch_size: int = 80):
     """
     Fetch the price via Intershop
@@ -410,20 +357,7 @@ def build_price_map(all_items, batch_size: int = 80):
             print(f"[WARN] Intershop batch failed for first SKUs: {chunk[:5]}")
             continue
 
-        for p in products:
-            sku = p.get("sku") or p.get("itemno")
-            if not sku:
-                continue
-
-            list_price = p.get("listPrice")
-            discounted = p.get("discountedPrice")
-
-            current = discounted if discounted not in (None, "", 0, "0") else list_price
-
-            price_map[sku] = {
-                "regular_price": list_price,
-                "current_price": current,
-            }
+        price_map.update(prices_from_products(products))
 
     # price_map = {
     #     "111": {"regular_price": ..., "current_price": ...},
@@ -435,40 +369,61 @@ def build_price_map(all_items, batch_size: int = 80):
 # ---------------------------------------------------------------------------
 # Fetch the details for all the skus
 # ---------------------------------------------------------------------------
-def fetch_all_products_with_prices():
-    # 1. Get all products with sku + title + unit info from Tweakwise
-    base_items = fetch_all_skus()
+def merge_product(it, price_info):
+    """
+    Merge one Tweakwise item with its Intershop price info into a compact ProductRecord.
+    """
+    unit_du = format_unit(it.get("base_unit"), it.get("ratio"))
+
+    unit_type_en = None
+    unit_qty = None
+    if unit_du:
+        unit_qty, unit_type_en = parse_unit(unit_du)
+
+    return ProductRecord(
+        url=it["url"],
+        sku=it["sku"],
+        brand=it["brand"],
+        product_name_du=it["title"],
+        unit_du=unit_du,
+        unit_type_en=unit_type_en,
+        unit_qty=unit_qty,
+        regular_price=price_info.get("regular_price"),
+        current_price=price_info.get("current_price"),
+    )
 
-    # 2. Get pricing info per sku from Intershop
-    price_map = build_price_map(base_items)
 
-    # 3. Merge into final structure
-    final_products = []
+def iter_hoogvliet_products(batch_size: int = 80):
+    """
+    Stream products with prices: Tweakwise items are collected until a batch of
+    `batch_size` SKUs is full, priced via Intershop, and yielded right away.
+    """
+    pending = []
 
-    for it in base_items:
-        sku = it["sku"]
-        price_info = price_map.get(sku, {})
+    def flush():
+        price_map = build_price_map(pending, batch_size=batch_size)
+        for it in pending:
+            yield merge_product(it, price_map.get(it["sku"], {}))
+        pending.clear()
 
-        unit_du = format_unit(it.get("base_unit"), it.get("ratio"))
+    for cid in TOP_CATEGORY_CIDS:
+        print(f"\n=== Fetching category {cid} ===")
+        for it in iter_category_items(cid):
+            pending.append(it)
+            if len(pending) >= batch_size:
+                yield from flush()
 
-        unit_type_en = None
-        unit_qty = None
-        if unit_du:
-            unit_qty, unit_type_en = parse_unit(unit_du)
+        time.sleep(0.2)
+
+    if pending:
+        yield from flush()
 
-        final_products.append(
-            {
-                "url": it["url"],
-                "sku": sku,
-                "brand": it["brand"],
-                "product_name_du": it["title"],
-                "unit_du": unit_du,
-                "unit_type_en": unit_type_en,
-                "unit_qty": unit_qty,
-                "regular_price": price_info.get("regular_price"),
-                "current_price": price_info.get("current_price"),
-            }
-        )
+
+def fetch_all_products_with_prices():
+    # 1. Get all products with sku + title + unit info from Tweakwise
+    # 2. Get pricing info per sku from Intershop
+    # 3. Merge into final structure
+    final_products = list(iter_hoogvliet_products())
 
     print(f"[Hoogvliet] Fetch {len(final_products)} products via API.")
     
@@ -547,7 +502,170 @@ def build_price_map_for_skus(all_skus, batch_size: int = 80):
     return build_price_map(dummy_items, batch_size=batch_size)
 
 
-def refresh_hoogvliet_daily():
+# Rows built with fetch_period=False carry the page to parse under this key until enrich
+PERIOD_URL_KEY = "_period_url"
+
+
+def fetch_promotion_period(url):
+    """
+    Promotion case: parse the product page for (valid_from, valid_to).
+    """
+    if url.startswith("/"):
+        url = BASE_URL.rstrip("/") + url
+
+    period = parse_product_page(url)
+    if period:
+        return period["valid_from"], period["valid_to"]
+    return None, None
+
+
+def build_update_row(sku, old, new, fetch_period=True):
+    """
+    joint_skus: compare prices, return the update row or None if nothing changed.
+    fetch_period=False defers the product page lookup to HoogvlietAdapter.enrich.
+    """
+    old_rp = normalize_price(old.get("regular_price"))
+    old_cp = normalize_price(old.get("current_price"))
+
+    new_rp = normalize_price(new.get("regular_price"))
+    new_cp = normalize_price(new.get("current_price"))
+
+    if (old_rp == new_rp 
+        and old_cp == new_cp 
+        and old.get("availability") is True
+    ):
+        return None  # No change, skip
+
+    row = {
+        "sku": sku,
+        "availability": True,
+        "regular_price": new.get("regular_price"),
+        "current_price": new.get("current_price"),
+        "valid_from": None,
+        "valid_to": None,
+    }
+
+    # Promotion case
+    if new_rp != new_cp:
+        if fetch_period:
+            row["valid_from"], row["valid_to"] = fetch_promotion_period(old["url"])
+        else:
+            row[PERIOD_URL_KEY] = old["url"]
+
+    return row
+
+
+def build_insert_row(sku, p, fetch_period=True, translate=True):
+    """
+    add_skus: full insert row, with the promotion period if the product is on sale.
+    fetch_period/translate=False defer the page lookup / translation to HoogvlietAdapter.enrich.
+    """
+    reg = p.get("regular_price")
+    cur = p.get("current_price")
+
+    product_name_du = p.get("product_name_du")
+
+    product_name_en = None
+    if translate and product_name_du:
+        product_name_en = translate_cached(product_name_du)
+
+    row = {
+        "sku": sku,
+        "url": p.get("url"),
+        "product_name_du": product_name_du,
+        "product_name_en": product_name_en,  
+        "unit_du": p.get("unit_du"),
+        "unit_qty": p.get("unit_qty"),                
+        "unit_type_en": p.get("unit_type_en"),        
+        "regular_price": reg,
+        "current_price": cur,
+        "valid_from": None,
+        "valid_to": None,
+        "availability": True,
+    }
+
+    if str(reg) != str(cur):
+        if fetch_period:
+            row["valid_from"], row["valid_to"] = fetch_promotion_period(p.get("url"))
+        else:
+            row[PERIOD_URL_KEY] = p.get("url")
+
+    return row
+
+
+def fetch_existing_hoogvliet_rows():
+    supabase = get_supabase()
+    resp = supabase.table("hoogvliet").select(
+        "url, sku, regular_price, current_price, availability, valid_from, valid_to"
+    ).execute()    
+    old_rows = resp.data or []
+    return {str(r["sku"]): r for r in old_rows if r.get("sku")}
+
+
+# ---------------------------------------------------------------------------
+# Chain adapter (chain_adapter.py) for orchestrator.py / crawl_worker.py
+# ---------------------------------------------------------------------------
+def fetch_unit(cid, batch_size: int = 80):
+    """fetch stage: Tweakwise items of one top category + their Intershop prices."""
+    items = fetch_category_items(cid)
+    price_map = build_price_map(items, batch_size=batch_size)
+    return items, price_map
+
+
+def map_unit(fetched):
+    """map stage (runs in the CPU process pool): items + prices -> ProductRecords."""
+    items, price_map = fetched
+    return [merge_product(it, price_map.get(it["sku"], {})) for it in items]
+
+
+class HoogvlietAdapter(ChainAdapter):
+    """
+    Work unit: one top category (Tweakwise items + Intershop prices). The enrich stage
+    also fetches the promotion period from the product page, so it runs against
+    www.hoogvliet.com instead of the translator.
+    """
+
+    name = table = "hoogvliet"
+    fetch_host = "navigator-group1.tweakwise.com"
+    enrich_host = "www.hoogvliet.com"
+    unit_rules = HOOGVLIET_UNIT_RULES
+
+    fetch = staticmethod(fetch_unit)
+    map = staticmethod(map_unit)
+
+    def discover(self) -> List[Any]:
+        return list(TOP_CATEGORY_CIDS)
+
+    def fetch_existing(self) -> Dict[str, Dict[str, Any]]:
+        return fetch_existing_hoogvliet_rows()
+
+    def unit_cost(self, n_products: int, page_size: int = 16, batch_size: int = 80) -> int:
+        """Tweakwise pages + Intershop price batches one top category takes."""
+        return max(1, -(-n_products // page_size) + -(-n_products // batch_size))
+
+    def build_update_row(self, sku, old, new):
+        return build_update_row(sku, old, new, fetch_period=False)
+
+    def build_insert_row(self, sku, new):
+        return build_insert_row(sku, new, fetch_period=False, translate=False)
+
+    def needs_enrich(self, row) -> bool:
+        return PERIOD_URL_KEY in row or needs_translation(row)
+
+    def enrich(self, row):
+        """product_name_en for new products + promotion period from the product page."""
+        url = row.pop(PERIOD_URL_KEY, None)
+        if url:
+            row["valid_from"], row["valid_to"] = fetch_promotion_period(url)
+        if row.get("product_name_du") and row.get("product_name_en") is None:
+            row["product_name_en"] = translate_cached(row["product_name_du"])
+        return row
+
+
+ADAPTER = HoogvlietAdapter()
+
+
+def refresh_hoogvliet_daily(streaming: bool = False):
     """
     - Fetch full snapshot from Tweakwise + Intershop APIs -> new_products[]
     - Load all existing rows from Supabase -> old_rows[]
@@ -555,25 +673,37 @@ def refresh_hoogvliet_daily():
            missing_skus = old_skus - new_skus   -> mark availability = false
            add_skus     = new_skus - old_skus   -> new products, full insert
            joint_skus   = old_skus ∩ new_skus   -> update price + promotion logic
+
+    streaming=True diffs each priced batch while the crawl is running (see pipeline.py).
     """
     # -------------------------------------------------------------------
     # 1. Fetch data from supabase 
     # -------------------------------------------------------------------    
-    supabase = get_supabase()
-    resp = supabase.table("hoogvliet").select(
-        "url, sku, regular_price, current_price, availability, valid_from, valid_to"
-    ).execute()    
-    old_rows = resp.data or []
-    old_by_sku = {str(r["sku"]): r for r in old_rows if r.get("sku")}
+    with TELEMETRY.stage("hoogvliet", "existing"):
+        old_by_sku = fetch_existing_hoogvliet_rows()
     old_skus = set(old_by_sku.keys())
     print(f"[hoogvliet daily] Found {len(old_skus)} existing Hoogvliet products in DB.")
 
+    if streaming:
+        return run_streaming_refresh(
+            "hoogvliet",
+            old_by_sku,
+            iter_hoogvliet_products(),
+            build_update_row=build_update_row,
+            build_insert_row=build_insert_row,
+            label="hoogvliet daily",
+        )
+
 
     # -------------------------------------------------------------------
     # 2. Fetch new hoogvliet products
     # -------------------------------------------------------------------
-    new_products = fetch_all_products_with_prices()
+    with TELEMETRY.stage("hoogvliet", "fetch"):
+        new_products = fetch_all_products_with_prices()
     new_by_sku = {str(p["sku"]): p for p in new_products}
+    # SNAPSHOT_DIR -> today's Parquet snapshot of the catalog (see snapshots.py)
+    SNAPSHOTS.add("hoogvliet", new_by_sku.values())
+    SNAPSHOTS.finish("hoogvliet")
     new_skus = set(new_by_sku.keys())
 
 
@@ -587,6 +717,7 @@ def refresh_hoogvliet_daily():
     print(f"[hoogvliet daily] missing_skus: {len(missing_skus)}")
     print(f"[hoogvliet daily] joint_skus:   {len(joint_skus)}")
     print(f"[hoogvliet daily] add_skus:     {len(add_skus)}")
+    TELEMETRY.count("rows_diffed", len(new_skus), table="hoogvliet")
 
     rows_to_upsert = []
 
@@ -594,7 +725,6 @@ def refresh_hoogvliet_daily():
     # 3.1) missing_skus
     # ----------------------------------------------------------------------
     for sku in missing_skus:
-        old = old_by_sku[sku]
         rows_to_upsert.append({
             "sku": sku,
             "availability": False,
@@ -604,87 +734,15 @@ def refresh_hoogvliet_daily():
     # 3.2) joint_skus
     # ----------------------------------------------------------------------
     for sku in joint_skus:
-        old = old_by_sku[sku]
-        new = new_by_sku[sku]
-
-        old_rp = normalize_price(old.get("regular_price"))
-        old_cp = normalize_price(old.get("current_price"))
-
-        new_rp = normalize_price(new.get("regular_price"))
-        new_cp = normalize_price(new.get("current_price"))
-
-        if (old_rp == new_rp 
-            and old_cp == new_cp 
-            and old.get("availability") is True
-        ):
-            continue  # No change, skip
-
-        valid_from = None
-        valid_to = None
-
-        # Promotion case
-        if new_rp != new_cp:
-            full_url = old["url"]
-            if full_url.startswith("/"):
-                full_url = BASE_URL.rstrip("/") + full_url
-
-            period = parse_product_page(full_url)
-            if period:
-                valid_from = period["valid_from"]
-                valid_to = period["valid_to"]
-
-        rows_to_upsert.append({
-            "sku": sku,
-            "availability": True,
-            "regular_price": new.get("regular_price"),
-            "current_price": new.get("current_price"),
-            "valid_from": valid_from,
-            "valid_to": valid_to,
-        })
+        row = build_update_row(sku, old_by_sku[sku], new_by_sku[sku])
+        if row is not None:
+            rows_to_upsert.append(row)
 
     # ----------------------------------------------------------------------
     # 3.3) add_skus: insert
     # ----------------------------------------------------------------------
     for sku in add_skus:
-        p = new_by_sku.get(sku)
-
-        reg = p.get("regular_price")
-        cur = p.get("current_price")
-
-        valid_from = None
-        valid_to = None
-
-        if str(reg) != str(cur):
-            full_url = p.get("url")
-            if full_url.startswith("/"):
-                full_url = BASE_URL.rstrip("/") + full_url
-
-            period = parse_product_page(full_url)
-            if period:
-                valid_from = period["valid_from"]
-                valid_to = period["valid_to"]
-        
-        product_name_du = p.get("product_name_du")
-
-        product_name_en = translate_cached(product_name_du) if product_name_du else None
-
-
-        rows_to_upsert.append(
-            {
-                "sku": sku,
-                "url": p.get("url"),
-                "product_name_du": product_name_du,
-                "product_name_en": product_name_en,  
-                "unit_du": p.get("unit_du"),
-                "unit_qty": p.get("unit_qty"),                
-                "unit_type_en": p.get("unit_type_en"),        
-                "regular_price": reg,
-                "current_price": cur,
-                "valid_from": valid_from,
-                "valid_to": valid_to,
-                "availability": True,
-            }
-        )
+        rows_to_upsert.append(build_insert_row(sku, new_by_sku[sku]))
 
 
     # ----------------------------------------------------------------------
@@ -694,8 +752,9 @@ def refresh_hoogvliet_daily():
         print("[hoogvliet daily] nothing to upsert.")
         return
 
-    print(f"[hoogvliet daily] upserting {len(rows_to_upsert)} rows to Supabase...")
+    print(f"[hoogvliet daily] writing {len(rows_to_upsert)} rows...")
     
-    upsert_rows("hoogvliet", rows_to_upsert, conflict_col="sku")
+    with TELEMETRY.stage("hoogvliet", "write"):
+        write_rows("hoogvliet", rows_to_upsert, conflict_col="sku", old_by_sku=old_by_sku)
 
     print("[hoogvliet daily] Done.")
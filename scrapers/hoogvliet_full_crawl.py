@@ -6,15 +6,13 @@ Full pipeline for dirk_full_crawl.py:
 3. Add the supermarket column
 4. Translate product names to English
 5. Parse unit strings into (unit_qty, unit_type)
-6. Replace ±inf with NaN at DataFrame level
-7. Sanitize data so it's JSON-safe
-8. Upsert
+6. Sanitize per column (±inf/NaN -> null, dates -> ISO) so it's JSON-safe
+7. Upsert the DataFrame in batches
 
 Run this as a one-off or manual script:
     python backend/dirk_full_crawl.py
 """
 
-import numpy as np
 import pandas as pd
 
 # When import, Python will load & execute the entire file dirk_core.py first.
@@ -26,13 +24,16 @@ from hoogvliet_core import (
 
 )
 
-from supabase_utils import upsert_rows 
+from product_record import records_to_frame
+from snapshots import SNAPSHOTS
+from supabase_utils import write_frame
 
 if __name__ == "__main__":
     # 1. Using API to fetch the details of all the products
     products = fetch_all_products_with_prices()
     print("\nTotal products with prices:", len(products)) 
-    df = pd.DataFrame(products)
+    # The promotion period comes from the product pages below
+    df = records_to_frame(products).drop(columns=["valid_from", "valid_to"])
 
     # 2. Parsing from HTML to get the promotion period. (Only for the products that are on sales)
     df_promoted = df[df["regular_price"] != df["current_price"]]
@@ -61,14 +62,11 @@ if __name__ == "__main__":
         lambda x: pd.Series(parse_unit(x))
     )
 
-    # 6. Replace ±inf with NaN at DataFrame level (just in case)
-    df = df.replace([np.inf, -np.inf], np.nan)
-
-    # 7. Convert to list-of-dicts
-    rows = df.to_dict(orient="records")
-
-    # 8. Upsert
-    print(f"[hoogvliet_full_crawl] Uploading {len(rows)} rows to Supabase...")
-    upsert_rows("hoogvliet",rows)
-
+    # 6. Sanitize per column (±inf/NaN -> null, dates -> ISO) and upsert the frame
+    #    directly, without converting to a list of dicts first
+    print(f"[hoogvliet_full_crawl] Uploading {len(df)} rows...")
+    write_frame("hoogvliet", df)
 
+    # 7. SNAPSHOT_DIR -> today's Parquet snapshot of the catalog (see snapshots.py)
+    SNAPSHOTS.add_frame("hoogvliet", df)
+    SNAPSHOTS.finish("hoogvliet")
@@ -0,0 +1,148 @@
+"""
+Durable storage for the files the refreshes keep between runs (price history, change
+log, catalog snapshots): a Supabase Storage bucket.
+
+The GitHub Actions cache is not a place for them: entries are evicted after a week
+without use, two workflows restoring and saving the same directory overwrite each
+other, and nothing outside the workflow can read them. With STORAGE_BUCKET set the
+modules above pull what they need from the bucket and push what they wrote:
+
+    <bucket>/price_history/<chain>/2026-10.bin
+    <bucket>/change_log/v0000000042.jsonl
+    <bucket>/snapshots/chain=ah/date=2026-10-19/part-0.parquet
+
+Keys mirror the local paths under the module's directory, so a local copy of a
+prefix is readable with the normal CLIs:
+
+    python scrapers/object_store.py pull price_history price_history
+
+Create the bucket once (private) in the Supabase dashboard or with
+`python scrapers/object_store.py create`.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+from typing import List
+
+
+LIST_PAGE = 1000
+
+
+class ObjectStore:
+    def __init__(self, bucket: str, supabase=None):
+        self.bucket = bucket
+        self._supabase = supabase
+
+    @classmethod
+    def from_env(cls) -> "ObjectStore | None":
+        """STORAGE_BUCKET set -> store, else None (the files only live on disk)."""
+        bucket = os.environ.get("STORAGE_BUCKET")
+        return cls(bucket) if bucket else None
+
+    def _files(self):
+        if self._supabase is None:
+            # imported here: supabase_utils imports the modules that use this one
+            from supabase_utils import get_supabase
+            self._supabase = get_supabase()
+        return self._supabase.storage.from_(self.bucket)
+
+    # ----- single objects -----
+    def get(self, key: str) -> bytes | None:
+        """Object bytes, or None if there is no such key."""
+        try:
+            return self._files().download(key)
+        except Exception as e:
+            if "not found" in str(e).lower() or "404" in str(e):
+                return None
+            raise
+
+    def put(self, key: str, data: bytes, content_type: str = "application/octet-stream"):
+        self._files().upload(key, data, file_options={"upsert": "true", "content-type": content_type})
+
+    def create(self, key: str, data: bytes, content_type: str = "application/octet-stream") -> bool:
+        """Put key only if it does not exist yet (atomic in Storage). False if it already exists."""
+        try:
+            self._files().upload(key, data, file_options={"upsert": "false", "content-type": content_type})
+        except Exception as e:
+            if "409" in str(e) or "already exists" in str(e).lower():
+                return False
+            raise
+        return True
+
+    def delete(self, keys: List[str]):
+        if keys:
+            self._files().remove(keys)
+
+    def list(self, prefix: str) -> List[str]:
+        """All keys under prefix (recursive), sorted."""
+        keys: List[str] = []
+        offset = 0
+        while True:
+            page = self._files().list(prefix, {"limit": LIST_PAGE, "offset": offset}) or []
+            for item in page:
+                key = f"{prefix.rstrip('/')}/{item['name']}" if prefix else item["name"]
+                if item.get("id") is None:          # a folder
+                    keys.extend(self.list(key))
+                else:
+                    keys.append(key)
+            if len(page) < LIST_PAGE:
+                break
+            offset += LIST_PAGE
+        return sorted(keys)
+
+    # ----- files -----
+    def download(self, key: str, path: str) -> bool:
+        """key -> path (written atomically). False if the key does not exist."""
+        data = self.get(key)
+        if data is None:
+            return False
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        return True
+
+    def upload(self, path: str, key: str):
+        with open(path, "rb") as f:
+            self.put(key, f.read())
+
+    def pull(self, prefix: str, local_dir: str) -> int:
+        """Every object under prefix -> local_dir/<rest of the key>. Returns the number of files."""
+        keys = self.list(prefix)
+        for key in keys:
+            rel = key[len(prefix):].lstrip("/")
+            self.download(key, os.path.join(local_dir, rel))
+        print(f"[object_store] {self.bucket}/{prefix}: {len(keys)} files -> {local_dir}")
+        return len(keys)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copy refresh state from / to the storage bucket.")
+    parser.add_argument("--bucket", default=os.environ.get("STORAGE_BUCKET"))
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("pull", help="download every object under a prefix")
+    p.add_argument("prefix")
+    p.add_argument("local_dir")
+    p = sub.add_parser("ls", help="list the keys under a prefix")
+    p.add_argument("prefix", nargs="?", default="")
+    sub.add_parser("create", help="create the (private) bucket")
+    args = parser.parse_args()
+    if not args.bucket:
+        parser.error("--bucket or STORAGE_BUCKET is required")
+
+    store = ObjectStore(args.bucket)
+    if args.cmd == "pull":
+        store.pull(args.prefix, args.local_dir)
+    elif args.cmd == "ls":
+        for key in store.list(args.prefix):
+            print(key)
+    elif args.cmd == "create":
+        from supabase_utils import get_supabase
+        get_supabase().storage.create_bucket(args.bucket, options={"public": False})
+        print(f"[object_store] created bucket {args.bucket}")
+
+
+if __name__ == "__main__":
+    main()
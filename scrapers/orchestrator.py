@@ -0,0 +1,418 @@
+"""
+Stage-pipelined refresh of all supermarkets.
+
+Instead of one thread per chain running refresh_*_daily end to end, every chain is split
+into stages and the stages of all chains are scheduled together:
+
+    discover  -> token / category tree / sitemap + existing rows from the DB   (I/O pool)
+    fetch     -> one work unit (AH taxonomyId, Dirk webGroupId, Hoogvliet category)  (I/O pool)
+    map       -> raw JSON -> ProductRecords (parse_unit etc.)                  (CPU process pool)
+    diff      -> compare with the DB rows                                      (scheduler thread)
+    translate -> product_name_en / Hoogvliet promotion pages for changed rows  (I/O pool)
+    write     -> batched write_rows                                            (I/O pool)
+
+I/O tasks share one thread pool, with a concurrency limit per host (HOST_LIMITS), so a slow
+chain only holds the slots of its own host. CPU work runs in a process pool and does not
+contend on the GIL with the network stages.
+
+The stages of a chain come from its ChainAdapter (chain_adapter.py, <chain>_core.ADAPTER),
+so a new chain only implements discover / fetch / map and gets all of the above.
+run() returns (and prints) a per-chain, per-stage timing summary as JSON.
+
+With a RefreshScheduler (refresh_scheduler.py) only the work units picked for this run
+are crawled; missing SKUs are then only marked on a full sweep.
+"""
+from __future__ import annotations
+
+import json
+import multiprocessing
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from functools import partial
+from typing import Any, Callable, Dict, List
+
+from snapshots import SNAPSHOTS
+from supabase_utils import write_rows
+from telemetry import TELEMETRY
+
+
+STAGES = ("discover", "fetch", "map", "diff", "translate", "write")
+
+HOST_LIMITS = {
+    "api.ah.nl": 4,
+    "web-dirk-gateway.detailresult.nl": 4,
+    "navigator-group1.tweakwise.com": 4,
+    "www.hoogvliet.com": 4,
+    "translate.google.com": 8,
+    "db": 4,
+}
+DEFAULT_HOST_LIMIT = 4
+
+WRITE_BATCH_SIZE = 500
+
+
+# ---------------------------------------------------------------------------
+# Task wrappers (module level so they can be pickled for the process pool)
+# ---------------------------------------------------------------------------
+def _run_timed(fn: Callable[[Any], Any], arg: Any):
+    """Run fn(arg) and return (result, wall_s, cpu_s, mem_peak_bytes) measured where it ran."""
+    return TELEMETRY.measure(fn, arg)
+
+
+def _discover(adapter) -> Dict[str, Any]:
+    return {"units": adapter.discover(), "old_by_sku": adapter.fetch_existing()}
+
+
+# ---------------------------------------------------------------------------
+# Per-chain state
+# ---------------------------------------------------------------------------
+class _StageStats:
+    __slots__ = ("tasks", "errors", "wall_s", "cpu_s", "first_start", "last_end")
+
+    def __init__(self):
+        self.tasks = 0
+        self.errors = 0
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.first_start = None
+        self.last_end = None
+
+    def add(self, wall: float, cpu: float, error: bool = False):
+        now = time.perf_counter()
+        self.tasks += 1
+        self.errors += int(error)
+        self.wall_s += wall
+        self.cpu_s += cpu
+        start = now - wall
+        if self.first_start is None or start < self.first_start:
+            self.first_start = start
+        self.last_end = now
+
+    def as_dict(self) -> Dict[str, Any]:
+        span = 0.0
+        if self.first_start is not None:
+            span = self.last_end - self.first_start
+        return {
+            "tasks": self.tasks,
+            "errors": self.errors,
+            "wall_s": round(self.wall_s, 3),
+            "cpu_s": round(self.cpu_s, 3),
+            "span_s": round(span, 3),
+        }
+
+
+class _ChainRun:
+    def __init__(self, name: str, adapter):
+        self.name = name
+        self.adapter = adapter
+        self.plan: Dict[str, Any] | None = None
+        self.status = "running"
+        self.error: str | None = None
+
+        self.seen_skus: set = set()
+        self.rows: List[Dict[str, Any]] = []
+        self.pending_units = 0
+        self.enrich_in_flight = 0
+        self.failed_units = 0
+        self.full_sweep = True
+        self.finalized = False
+
+        self.counts = defaultdict(int)
+        self.stages = {stage: _StageStats() for stage in STAGES}
+
+    def summary(self) -> Dict[str, Any]:
+        out = {
+            "status": self.status,
+            "counts": dict(self.counts),
+            "stages": {stage: st.as_dict() for stage, st in self.stages.items()},
+        }
+        if self.error:
+            out["error"] = self.error
+        return out
+
+
+# ---------------------------------------------------------------------------
+# Orchestrator
+# ---------------------------------------------------------------------------
+class Orchestrator:
+    """
+    Schedules the stages of several chains on shared pools.
+
+    chains: {"ah": ah_core.ADAPTER, ...}, ChainAdapters (chain_adapter.py).
+    cpu_workers=0 runs the map stage on the I/O pool instead of a process pool.
+    scheduler: optional RefreshScheduler that picks the units per chain and learns change rates.
+    """
+
+    def __init__(
+        self,
+        chains: Dict[str, Any],
+        io_workers: int = 32,
+        cpu_workers: int | None = None,
+        host_limits: Dict[str, int] | None = None,
+        write_batch_size: int = WRITE_BATCH_SIZE,
+        scheduler=None,
+    ):
+        self.runs = {name: _ChainRun(name, adapter) for name, adapter in chains.items()}
+        self.io_workers = io_workers
+        self.cpu_workers = max(1, (os.cpu_count() or 2) - 1) if cpu_workers is None else cpu_workers
+        self.host_limits = dict(HOST_LIMITS if host_limits is None else host_limits)
+        self.write_batch_size = write_batch_size
+        self.scheduler = scheduler
+
+        self._io: ThreadPoolExecutor | None = None
+        self._cpu: ProcessPoolExecutor | None = None
+        self._futures: Dict[Any, tuple] = {}
+        self._host_in_flight: Dict[str, int] = defaultdict(int)
+        self._host_waiting: Dict[str, deque] = defaultdict(deque)
+
+    # ----- scheduling -----
+    def _submit(
+        self,
+        run: _ChainRun,
+        stage: str,
+        fn,
+        arg,
+        host: str | None = None,
+        cpu: bool = False,
+        unit=None,
+    ):
+        if host is not None:
+            limit = self.host_limits.get(host, DEFAULT_HOST_LIMIT)
+            if self._host_in_flight[host] >= limit:
+                self._host_waiting[host].append((run, stage, fn, arg, cpu, unit))
+                return
+            self._host_in_flight[host] += 1
+
+        pool = self._cpu if (cpu and self._cpu is not None) else self._io
+        fut = pool.submit(_run_timed, fn, arg)
+        self._futures[fut] = (run, stage, host, arg, unit)
+
+    def _release(self, host: str | None):
+        if host is None:
+            return
+        self._host_in_flight[host] -= 1
+        if self._host_waiting[host]:
+            run, stage, fn, arg, cpu, unit = self._host_waiting[host].popleft()
+            self._submit(run, stage, fn, arg, host=host, cpu=cpu, unit=unit)
+
+    # ----- stage handlers -----
+    def _on_discover(self, run: _ChainRun, plan: Dict[str, Any]):
+        run.plan = plan
+        run.counts["existing"] = len(plan["old_by_sku"])
+
+        adapter = run.adapter
+        units = plan["units"]
+        if self.scheduler is not None:
+            run.counts["units_total"] = len(units)
+            units, run.full_sweep = self.scheduler.select(run.name, units, adapter.unit_key)
+        run.pending_units = len(units)
+        print(f"[orchestrator] {run.name}: {run.pending_units} work units")
+
+        for unit in units:
+            self._submit(run, "fetch", adapter.fetch, unit, host=adapter.fetch_host, unit=unit)
+        self._maybe_finalize(run)
+
+    def _on_fetch(self, run: _ChainRun, raw, unit):
+        self._submit(run, "map", run.adapter.map, raw, cpu=True, unit=unit)
+
+    def _on_map(self, run: _ChainRun, records, unit):
+        adapter = run.adapter
+        old_by_sku = run.plan["old_by_sku"]
+        changed = 0
+
+        wall0 = time.perf_counter()
+        cpu0 = time.thread_time()
+
+        # SNAPSHOT_DIR -> the crawled products also go to today's Parquet snapshot
+        SNAPSHOTS.add(adapter.table, records)
+
+        for new in records:
+            if new.get("sku") is None:
+                continue
+            sku = str(new["sku"])
+            if sku in run.seen_skus:
+                continue
+            run.seen_skus.add(sku)
+
+            old = old_by_sku.get(sku)
+            if old is not None:
+                run.counts["joint"] += 1
+                row = adapter.build_update_row(sku, old, new)
+                if row is not None:
+                    run.counts["updated"] += 1
+            else:
+                row = adapter.build_insert_row(sku, new)
+                if row is not None:
+                    run.counts["added"] += 1
+
+            if row is None:
+                continue
+            changed += 1
+            if adapter.needs_enrich(row):
+                run.enrich_in_flight += 1
+                self._submit(run, "translate", adapter.enrich, row, host=adapter.enrich_host)
+            else:
+                self._buffer(run, row)
+
+        wall, cpu = time.perf_counter() - wall0, time.thread_time() - cpu0
+        run.stages["diff"].add(wall, cpu)
+        TELEMETRY.add_stage(run.name, "diff", wall, cpu)
+        TELEMETRY.count("rows_diffed", len(records), table=adapter.table)
+        if self.scheduler is not None:
+            self.scheduler.observe(
+                run.name,
+                adapter.unit_key(unit),
+                products=len(records),
+                changed=changed,
+                cost=adapter.unit_cost(len(records)),
+            )
+        self._unit_done(run)
+
+    def _on_translate(self, run: _ChainRun, row):
+        run.enrich_in_flight -= 1
+        self._buffer(run, row)
+        self._maybe_finalize(run)
+
+    def _unit_done(self, run: _ChainRun):
+        run.pending_units -= 1
+        self._maybe_finalize(run)
+
+    def _buffer(self, run: _ChainRun, row: Dict[str, Any]):
+        run.rows.append(row)
+        if len(run.rows) >= self.write_batch_size:
+            self._flush(run)
+
+    def _flush(self, run: _ChainRun):
+        if not run.rows:
+            return
+        batch, run.rows = run.rows, []
+        # CHANGE_LOG_DIR -> the added / removed / repriced SKUs of written batches go to the change log
+        write = partial(write_rows, run.adapter.table, conflict_col="sku", old_by_sku=run.plan["old_by_sku"])
+        self._submit(run, "write", write, batch, host="db")
+
+    def _maybe_finalize(self, run: _ChainRun):
+        if run.finalized or run.pending_units > 0 or run.enrich_in_flight > 0:
+            return
+        run.finalized = True
+
+        old_by_sku = run.plan["old_by_sku"]
+        if run.failed_units:
+            # An incomplete crawl must not mark the products it did not see as unavailable.
+            print(
+                f"[orchestrator] {run.name}: {run.failed_units} work units failed, "
+                f"not marking missing SKUs"
+            )
+        elif not run.full_sweep:
+            print(f"[orchestrator] {run.name}: scheduled subset of units, not marking missing SKUs")
+        else:
+            for sku in old_by_sku.keys() - run.seen_skus:
+                run.counts["missing"] += 1
+                self._buffer(run, {"sku": sku, "availability": False})
+
+        run.counts["seen"] = len(run.seen_skus)
+        self._flush(run)
+        SNAPSHOTS.finish(run.adapter.table, complete=not run.failed_units and run.full_sweep)
+
+    # ----- main loop -----
+    def run(self) -> Dict[str, Any]:
+        started_at = datetime.now(timezone.utc)
+        t0 = time.perf_counter()
+
+        self._io = ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="refresh-io")
+        if self.cpu_workers > 0:
+            # The I/O pool threads are already running: fork would copy their held locks
+            # (and open connections) into the children, so start them from a clean process.
+            method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            self._cpu = ProcessPoolExecutor(
+                max_workers=self.cpu_workers,
+                mp_context=multiprocessing.get_context(method),
+            )
+
+        try:
+            for run in self.runs.values():
+                self._submit(run, "discover", _discover, run.adapter)
+
+            while self._futures:
+                done, _ = wait(list(self._futures), return_when=FIRST_COMPLETED)
+                for fut in done:
+                    run, stage, host, arg, unit = self._futures.pop(fut)
+                    self._release(host)
+                    self._handle(run, stage, fut, arg, unit)
+        finally:
+            self._io.shutdown(wait=True)
+            if self._cpu is not None:
+                self._cpu.shutdown(wait=True)
+
+        for run in self.runs.values():
+            if run.status == "running":
+                run.status = "partial" if run.failed_units else "ok"
+            if self.scheduler is not None and run.plan is not None:
+                run.counts["full_sweep"] = run.full_sweep
+                self.scheduler.finish(run.name, full_sweep=run.full_sweep and run.status == "ok")
+        if self.scheduler is not None:
+            self.scheduler.save()
+
+        summary = {
+            "started_at": started_at.isoformat(),
+            "wall_s": round(time.perf_counter() - t0, 3),
+            "io_workers": self.io_workers,
+            "cpu_workers": self.cpu_workers,
+            "chains": {name: run.summary() for name, run in self.runs.items()},
+        }
+        if self.scheduler is not None:
+            summary["scheduler"] = self.scheduler.selection
+        return summary
+
+    def _handle(self, run: _ChainRun, stage: str, fut, arg, unit):
+        try:
+            result, wall, cpu, mem = fut.result()
+        except Exception as e:
+            run.stages[stage].add(0.0, 0.0, error=True)
+            TELEMETRY.add_stage(run.name, stage, 0.0, 0.0, error=True)
+            self._on_error(run, stage, arg, e)
+            return
+
+        run.stages[stage].add(wall, cpu)
+        TELEMETRY.add_stage(run.name, stage, wall, cpu, mem)
+        if stage == "discover":
+            self._on_discover(run, result)
+        elif stage == "fetch":
+            self._on_fetch(run, result, unit)
+        elif stage == "map":
+            self._on_map(run, result, unit)
+        elif stage == "translate":
+            self._on_translate(run, result)
+        elif stage == "write":
+            # what write_rows really wrote (it skips rows it cannot send)
+            run.counts["written"] += result
+
+    def _on_error(self, run: _ChainRun, stage: str, arg, e: Exception):
+        print(f"[orchestrator] ❌ {run.name} {stage} failed: {e}")
+
+        if stage == "discover":
+            run.status = "error"
+            run.error = str(e)
+        elif stage in ("fetch", "map"):
+            run.failed_units += 1
+            self._unit_done(run)
+        elif stage == "translate":
+            # Translation / promotion page failed: still write the row, without the
+            # private keys the enrich step would have consumed.
+            row = {k: v for k, v in arg.items() if not k.startswith("_")}
+            self._on_translate(run, row)
+        elif stage == "write":
+            run.counts["write_errors"] += 1
+
+
+def run_all(chains: Dict[str, Any], summary_path: str | None = None, **kwargs) -> Dict[str, Any]:
+    """Run the orchestrator, print the summary as JSON and optionally write it to a file."""
+    summary = Orchestrator(chains, **kwargs).run()
+    text = json.dumps(summary, indent=2)
+    print(text)
+    if summary_path:
+        with open(summary_path, "w") as f:
+            f.write(text)
+    return summary
@@ -0,0 +1,291 @@
+"""
+Direct Postgres bulk loader for the full crawls and the daily refresh.
+
+Instead of pushing rows through PostgREST, rows are streamed with COPY into a
+temporary staging table (private to the connection, dropped at commit) and merged
+with a single statement:
+
+    INSERT INTO <table> (...) SELECT ... FROM <staging>
+    ON CONFLICT (sku) DO UPDATE SET ...
+    WHERE (<table>.*) IS DISTINCT FROM (EXCLUDED.*)
+
+so rows whose values did not change are not rewritten.
+
+Only used when a database URL is given (DATABASE_URL env var, e.g. the Supabase
+"Connection string" from Project settings -> Database). Try it against a local Postgres:
+
+    DATABASE_URL=postgresql://postgres@localhost/postgres python scrapers/pg_loader.py
+"""
+from __future__ import annotations
+
+import csv
+import io
+import json
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Sequence
+
+import pandas as pd
+import psycopg2
+from psycopg2 import sql
+
+from supabase_utils import sanitize_frame, sanitize_value
+
+
+NULL = r"\N"
+
+
+def get_database_url() -> str | None:
+    return os.environ.get("DATABASE_URL") or None
+
+
+# ---------------------------------------------------------------------------
+# COPY helpers
+# ---------------------------------------------------------------------------
+def _copy_value(v: Any) -> Any:
+    v = sanitize_value(v)
+    if v is None:
+        return NULL
+    if isinstance(v, bool):
+        return "true" if v else "false"
+    if isinstance(v, (list, dict)):
+        return json.dumps(v)
+    return v
+
+
+class _CsvStream(io.RawIOBase):
+    """
+    File-like object that renders rows to CSV lazily, so COPY can stream
+    an iterator of rows without building the whole payload in memory.
+    """
+
+    def __init__(self, rows: Iterable[Sequence[Any]]):
+        self._rows = iter(rows)
+        self._buf = io.StringIO()
+        self._writer = csv.writer(self._buf, lineterminator="\n")
+        self._pending = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def _fill(self, size: int):
+        while len(self._pending) < size:
+            try:
+                row = next(self._rows)
+            except StopIteration:
+                return
+            self._writer.writerow([_copy_value(v) for v in row])
+            self._pending += self._buf.getvalue().encode("utf-8")
+            self._buf.seek(0)
+            self._buf.truncate(0)
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = 1 << 62
+        self._fill(size)
+        chunk, self._pending = self._pending[:size], self._pending[size:]
+        return chunk
+
+
+# ---------------------------------------------------------------------------
+# Loader
+# ---------------------------------------------------------------------------
+class PgBulkLoader:
+    """
+    Keeps one connection open and loads batches of rows with COPY + merge.
+    """
+
+    def __init__(self, database_url: str | None = None):
+        database_url = database_url or get_database_url()
+        if not database_url:
+            raise ValueError("PgBulkLoader needs a database URL (or DATABASE_URL).")
+        self.conn = psycopg2.connect(database_url)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def load(
+        self,
+        table_name: str,
+        rows: Iterable[Dict[str, Any]],
+        conflict_col: str = "sku",
+    ) -> int:
+        """
+        Load rows into `table_name`. Rows are grouped by their column set, because a
+        partial row ({"sku", "availability"}) must not NULL the other columns.
+
+        Returns the number of rows actually inserted or updated.
+        """
+        groups: Dict[tuple, List[tuple]] = {}
+        for row in rows:
+            cols = tuple(row.keys())
+            groups.setdefault(cols, []).append(tuple(row[c] for c in cols))
+
+        written = 0
+        try:
+            for cols, values in groups.items():
+                written += self._load_group(table_name, cols, _CsvStream(values), conflict_col)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        print(f"[pg_loader] {table_name}: {written} rows inserted/updated")
+        return written
+
+    def load_frame(
+        self,
+        table_name: str,
+        df: pd.DataFrame,
+        conflict_col: str = "sku",
+    ) -> int:
+        """
+        Load a whole DataFrame: sanitize per column and let pandas write the COPY
+        payload as CSV, without going through Python dicts.
+        """
+        if df.empty:
+            return 0
+
+        buf = io.StringIO()
+        sanitize_frame(df).to_csv(buf, index=False, header=False, na_rep=NULL)
+        buf.seek(0)
+
+        try:
+            written = self._load_group(table_name, tuple(df.columns), buf, conflict_col)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+        print(f"[pg_loader] {table_name}: {written} rows inserted/updated")
+        return written
+
+    def _load_group(
+        self,
+        table_name: str,
+        cols: Sequence[str],
+        source,
+        conflict_col: str,
+    ) -> int:
+        staging_id = sql.Identifier(f"_staging_{table_name}")
+        table_id = sql.Identifier(table_name)
+        col_ids = sql.SQL(", ").join(sql.Identifier(c) for c in cols)
+        # "store_id,sku" -> composite key
+        conflict_cols = [c.strip() for c in conflict_col.split(",")]
+        conflict_id = sql.SQL(", ").join(sql.Identifier(c) for c in conflict_cols)
+        update_cols = [c for c in cols if c not in conflict_cols]
+
+        with self.conn.cursor() as cur:
+            # Same column types as the target, no constraints, no WAL. TEMP keeps it
+            # private to this connection, so parallel loaders never share a staging
+            # table; ON COMMIT DROP means it never outlives the batch. Only the loaded
+            # columns are copied (not LIKE <table>): a partial row must not trip the
+            # NOT NULL of a column it does not carry.
+            cur.execute(
+                sql.SQL(
+                    "CREATE TEMP TABLE {} ON COMMIT DROP AS SELECT {} FROM {} WITH NO DATA"
+                ).format(staging_id, col_ids, table_id)
+            )
+            cur.execute(
+                sql.SQL("ALTER TABLE {} ADD COLUMN _seq bigserial").format(staging_id)
+            )
+
+            cur.copy_expert(
+                sql.SQL("COPY {} ({}) FROM STDIN WITH (FORMAT csv, NULL {})")
+                .format(staging_id, col_ids, sql.Literal(NULL))
+                .as_string(cur),
+                source,
+            )
+
+            # Last occurrence of a key wins, like the dict-based dedup in the cores.
+            deduped = sql.SQL(
+                "SELECT DISTINCT ON ({conflict}) {cols} FROM {staging} "
+                "ORDER BY {conflict}, _seq DESC"
+            ).format(conflict=conflict_id, cols=col_ids, staging=staging_id)
+
+            if update_cols:
+                assignments = sql.SQL(", ").join(
+                    sql.SQL("{c} = EXCLUDED.{c}").format(c=sql.Identifier(c))
+                    for c in update_cols
+                )
+                current = sql.SQL(", ").join(
+                    sql.SQL("{}.{}").format(table_id, sql.Identifier(c))
+                    for c in update_cols
+                )
+                incoming = sql.SQL(", ").join(
+                    sql.SQL("EXCLUDED.{}").format(sql.Identifier(c)) for c in update_cols
+                )
+                on_conflict = sql.SQL(
+                    "DO UPDATE SET {} WHERE ROW({}) IS DISTINCT FROM ROW({})"
+                ).format(assignments, current, incoming)
+            else:
+                on_conflict = sql.SQL("DO NOTHING")
+
+            cur.execute(
+                sql.SQL("INSERT INTO {} ({}) {} ON CONFLICT ({}) {}").format(
+                    table_id, col_ids, deduped, conflict_id, on_conflict
+                )
+            )
+            written = cur.rowcount
+
+            # the next column group of the same transaction reuses the name
+            cur.execute(sql.SQL("DROP TABLE {}").format(staging_id))
+
+        return written
+
+
+_local = threading.local()
+
+
+def shared_loader(database_url: str | None = None) -> PgBulkLoader:
+    """
+    The PgBulkLoader of the calling thread, connected on first use and kept open, so
+    repeated write_rows / write_frame calls do not reconnect for every batch.
+    """
+    loader = getattr(_local, "loader", None)
+    if loader is None or loader.conn.closed:
+        loader = _local.loader = PgBulkLoader(database_url)
+    return loader
+
+
+def copy_merge_rows(
+    table_name: str,
+    rows: Iterable[Dict[str, Any]],
+    conflict_col: str = "sku",
+    database_url: str | None = None,
+) -> int:
+    """Load the rows through the thread's shared connection (shared_loader)."""
+    return shared_loader(database_url).load(table_name, rows, conflict_col=conflict_col)
+
+
+# ---------------------------------------------------------------------------
+# Local check: python scrapers/pg_loader.py (needs DATABASE_URL)
+# ---------------------------------------------------------------------------
+if __name__ == "__main__":
+    with PgBulkLoader() as loader:
+        with loader.conn.cursor() as cur:
+            cur.execute(
+                "CREATE TABLE IF NOT EXISTS _pg_loader_check ("
+                "sku text PRIMARY KEY, current_price float8, availability boolean)"
+            )
+        loader.conn.commit()
+
+        rows = [
+            {"sku": "1", "current_price": 1.99, "availability": True},
+            {"sku": "2", "current_price": float("nan"), "availability": True},
+        ]
+        print("first load  ->", loader.load("_pg_loader_check", rows))     # 2
+        print("same rows   ->", loader.load("_pg_loader_check", rows))     # 0
+        print("partial row ->", loader.load("_pg_loader_check", [{"sku": "1", "availability": False}]))  # 1
+
+        with loader.conn.cursor() as cur:
+            cur.execute("SELECT * FROM _pg_loader_check ORDER BY sku")
+            print(cur.fetchall())
+            cur.execute("DROP TABLE _pg_loader_check")
+        loader.conn.commit()
@@ -0,0 +1,233 @@
+"""
+Streaming crawl -> diff -> upsert pipeline for the daily refresh.
+
+The fetchers (iter_ah_products, iter_dirk_products, iter_hoogvliet_products) are generators.
+Here they run on a producer thread, every product is diffed against the DB rows as soon
+as it arrives, and the resulting rows go to a write-behind upserter on its own thread.
+So network fetch, diff and database writes overlap, and the only thing kept for the
+whole run is the set of seen SKUs (needed for missing_skus at the end).
+"""
+from __future__ import annotations
+
+import os
+import queue
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Set
+
+from snapshots import SNAPSHOTS
+from supabase_utils import get_supabase, write_rows
+from telemetry import TELEMETRY
+
+
+_DONE = object()
+
+
+# ---------------------------------------------------------------------------
+# Producer: run a generator on a background thread
+# ---------------------------------------------------------------------------
+def iter_in_background(iterable: Iterable[Any], maxsize: int = 1000) -> Iterator[Any]:
+    """
+    Consume `iterable` on a daemon thread and yield its items through a bounded queue.
+    Exceptions raised by the producer are re-raised in the consumer.
+    """
+    q: queue.Queue = queue.Queue(maxsize=maxsize)
+    error: List[BaseException] = []
+
+    def produce():
+        try:
+            for item in iterable:
+                q.put(item)
+        except BaseException as e:
+            error.append(e)
+        finally:
+            q.put(_DONE)
+
+    t = threading.Thread(target=produce, name="pipeline-producer", daemon=True)
+    t.start()
+
+    while True:
+        item = q.get()
+        if item is _DONE:
+            break
+        yield item
+
+    t.join()
+    if error:
+        raise error[0]
+
+
+# ---------------------------------------------------------------------------
+# Consumer: write-behind batch upserter
+# ---------------------------------------------------------------------------
+class BatchUpserter:
+    """
+    Collect rows and upsert them in batches on a background thread.
+
+    put() only blocks when `max_pending` batches are already waiting to be written,
+    so a slow database slows the crawl down instead of growing memory. With old_by_sku
+    the written batches go to the change log (write_rows), failed ones do not.
+    """
+
+    def __init__(
+        self,
+        table_name: str,
+        conflict_col: str | None = "sku",
+        batch_size: int = 500,
+        max_pending: int = 4,
+        old_by_sku: Dict[str, Dict[str, Any]] | None = None,
+    ):
+        self.table_name = table_name
+        self.old_by_sku = old_by_sku
+        self.conflict_col = conflict_col
+        self.batch_size = batch_size
+        self.rows_written = 0
+        self.error: Exception | None = None    # set when the writer could not connect
+
+        self._batch: List[Dict[str, Any]] = []
+        self._queue: queue.Queue = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(
+            target=self._run, name=f"upserter-{table_name}", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        # DATABASE_URL -> one Postgres connection for the whole run (pg_loader.py),
+        # otherwise one Supabase client.
+        loader = None
+        supabase = None
+        try:
+            if os.environ.get("DATABASE_URL"):
+                from pg_loader import PgBulkLoader
+                loader = PgBulkLoader()
+            else:
+                supabase = get_supabase()
+        except Exception as e:
+            # no client, nothing can be written: keep taking batches so put() never
+            # blocks, and let put() / flush() / close() raise the error
+            print(f"[BatchUpserter] ❌ {self.table_name}: no database connection: {e}")
+            self.error = e
+            while self._queue.get() is not _DONE:
+                pass
+            return
+
+        try:
+            while True:
+                batch = self._queue.get()
+                if batch is _DONE:
+                    break
+                try:
+                    self.rows_written += write_rows(
+                        self.table_name,
+                        batch,
+                        conflict_col=self.conflict_col,
+                        supabase=supabase,
+                        loader=loader,
+                        old_by_sku=self.old_by_sku,
+                    )
+                except Exception as e:
+                    print(f"[BatchUpserter] ❌ batch of {len(batch)} rows failed: {e}")
+        finally:
+            if loader is not None:
+                loader.close()
+
+    def put(self, row: Dict[str, Any]):
+        self._batch.append(row)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.error is not None:
+            raise self.error
+        if self._batch:
+            self._queue.put(self._batch)
+            self._batch = []
+
+    def close(self) -> int:
+        """Flush the last batch, wait for the writer thread, return rows written."""
+        try:
+            self.flush()
+        finally:
+            self._queue.put(_DONE)
+            self._thread.join()
+        if self.error is not None:
+            raise self.error
+        return self.rows_written
+
+
+# ---------------------------------------------------------------------------
+# Streaming refresh
+# ---------------------------------------------------------------------------
+def run_streaming_refresh(
+    table_name: str,
+    old_by_sku: Dict[str, Dict[str, Any]],
+    products: Iterable[Dict[str, Any]],
+    build_update_row: Callable[[str, Dict[str, Any], Dict[str, Any]], Dict[str, Any] | None],
+    build_insert_row: Callable[[str, Dict[str, Any]], Dict[str, Any] | None],
+    label: str | None = None,
+    batch_size: int = 500,
+    mark_missing: bool = True,
+) -> Dict[str, int]:
+    """
+    Same diff as the refresh_*_daily functions, but one product at a time:
+    - sku in old_by_sku      -> build_update_row(sku, old, new), skipped if it returns None
+    - sku not in old_by_sku  -> build_insert_row(sku, new), skipped if it returns None
+    - after the crawl, old_skus - seen_skus -> availability = False
+      (skipped with mark_missing=False, e.g. when part of the crawl failed)
+    - the rows that were written go to the change log (change_log.py, CHANGE_LOG_DIR)
+    - every product also goes to today's snapshot (snapshots.py, SNAPSHOT_DIR),
+      marked incomplete with mark_missing=False
+
+    The first occurrence of a SKU wins; later duplicates are ignored.
+    """
+    label = label or table_name
+    seen_skus: Set[str] = set()
+    counts = {"joint": 0, "updated": 0, "added": 0, "missing": 0}
+
+    upserter = BatchUpserter(table_name, conflict_col="sku", batch_size=batch_size, old_by_sku=old_by_sku)
+    write = upserter.put
+
+    with TELEMETRY.stage(table_name, "stream"):
+        try:
+            for new in iter_in_background(products):
+                if new.get("sku") is None:
+                    continue
+                sku = str(new["sku"])
+                if sku in seen_skus:
+                    continue
+                seen_skus.add(sku)
+                SNAPSHOTS.add(table_name, (new,))
+
+                old = old_by_sku.get(sku)
+                if old is not None:
+                    counts["joint"] += 1
+                    row = build_update_row(sku, old, new)
+                    if row is not None:
+                        counts["updated"] += 1
+                        write(row)
+                else:
+                    row = build_insert_row(sku, new)
+                    if row is not None:
+                        counts["added"] += 1
+                        write(row)
+
+            if mark_missing:
+                for sku in old_by_sku.keys() - seen_skus:
+                    counts["missing"] += 1
+                    write({"sku": sku, "availability": False})
+            else:
+                print(f"[{label}] incomplete crawl, not marking missing SKUs")
+        finally:
+            try:
+                written = upserter.close()
+            finally:
+                SNAPSHOTS.finish(table_name, complete=mark_missing)
+
+    print(f"[{label}] seen_skus:    {len(seen_skus)}")
+    print(f"[{label}] missing_skus: {counts['missing']}")
+    print(f"[{label}] joint_skus:   {counts['joint']} ({counts['updated']} changed)")
+    print(f"[{label}] add_skus:     {counts['added']}")
+    print(f"[{label}] Done, {written} rows written.")
+
+    TELEMETRY.count("rows_diffed", len(seen_skus), table=table_name)
+    counts["written"] = written
+    return counts
@@ -0,0 +1,595 @@
+"""
+Append-only price history of the refreshed chains, with precomputed rollups.
+
+Every row the refresh writes (supabase_utils.write_rows) is offered to HISTORY. At the
+end of the run HISTORY.flush() keeps the SKUs whose price or availability really
+changed and appends them as one block to the month partition of the chain:
+
+    <PRICE_HISTORY_DIR>/<chain>/2026-10.bin   blocks of that month
+    <PRICE_HISTORY_DIR>/rollups.sqlite        last state + rolling min / max per SKU
+
+A block is varints (and the UTF-8 of new SKUs):
+
+    ts, number of new SKUs, per new SKU: byte length + SKU (they get the next ids),
+    n, then per SKU (sorted by id):
+        id - previous id, flags (1 available, 2 current price, 4 regular price),
+        zigzag(cents - cents of the previous event of this SKU in this month) per price
+
+so an unchanged SKU costs nothing and a price change usually 4-6 bytes. Every month
+decodes on its own: it carries its own SKU dictionary, and the first event of a SKU in
+a month is relative to 0. A block torn by a crash is cut off before the next append.
+
+The rollups (min / max current price over ROLLUP_DAYS, last price change) are updated
+for the SKUs that changed and for the SKUs whose oldest point left a window since the
+last run (next_expiry), so they never rescan the event files. Queries are one indexed
+SQLite lookup:
+
+    python scrapers/price_history.py sku ah 123456
+    python scrapers/price_history.py lowest ah --days 30 --limit 20
+    python scrapers/price_history.py rebuild ah       # rollups from the event files
+    python scrapers/price_history.py pull             # local copy from STORAGE_BUCKET
+
+Disabled (record / flush do nothing) unless PRICE_HISTORY_DIR is set. With
+STORAGE_BUCKET set as well (object_store.py), flush() first pulls rollups.sqlite and
+the month partitions it appends to, and pushes them back afterwards; the bucket is the
+durable copy, PRICE_HISTORY_DIR a working copy. Runs of the workflows writing it must
+not overlap (they share a concurrency group).
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from object_store import ObjectStore
+
+
+HISTORY_TABLES = ("ah", "dirk", "hoogvliet")
+ROLLUP_DAYS = (7, 30, 90)
+DAY_S = 86400
+STORE_PREFIX = "price_history"
+
+AVAILABLE, HAS_CURRENT, HAS_REGULAR = 1, 2, 4
+
+
+# ---------------------------------------------------------------------------
+# Encoding
+# ---------------------------------------------------------------------------
+def write_varint(buf: bytearray, n: int):
+    while n > 0x7F:
+        buf.append((n & 0x7F) | 0x80)
+        n >>= 7
+    buf.append(n)
+
+
+def read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    n = shift = 0
+    while True:
+        b = data[pos]
+        pos += 1
+        n |= (b & 0x7F) << shift
+        if b < 0x80:
+            return n, pos
+        shift += 7
+
+
+def zigzag(n: int) -> int:
+    return (n << 1) if n >= 0 else ((-n << 1) - 1)
+
+
+def unzigzag(n: int) -> int:
+    return (n >> 1) if not n & 1 else -((n + 1) >> 1)
+
+
+def to_cents(v: Any) -> int | None:
+    if v is None:
+        return None
+    try:
+        return int(round(float(v) * 100))
+    except (TypeError, ValueError):
+        return None
+
+
+def month_of(ts: int) -> str:
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m")
+
+
+class Partition:
+    """
+    What decoding a month partition leaves behind, and what the next block appending
+    to it needs: the partition's SKU dictionary, the last prices per SKU id, and the
+    byte length up to the end of the last complete block.
+    """
+
+    def __init__(self):
+        self.skus: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.last: Dict[int, List[int]] = {}
+        self.end = 0
+
+
+def encode_block(
+    ts: int,
+    events: List[Tuple[str, bool, int | None, int | None]],
+    part: Partition,
+) -> bytes:
+    """
+    events: (sku, available, current_cents, regular_cents). SKUs new to the partition
+    get the next ids and are written into the block; `part` is updated.
+    """
+    new_skus = [sku for sku, *_ in events if sku not in part.ids]
+    for sku in new_skus:
+        part.ids[sku] = len(part.skus)
+        part.skus.append(sku)
+
+    buf = bytearray()
+    write_varint(buf, ts)
+    write_varint(buf, len(new_skus))
+    for sku in new_skus:
+        raw = sku.encode("utf-8")
+        write_varint(buf, len(raw))
+        buf += raw
+    rows = sorted((part.ids[sku], available, current, regular) for sku, available, current, regular in events)
+    write_varint(buf, len(rows))
+    prev_id = 0
+    for sku_id, available, current, regular in rows:
+        base = part.last.setdefault(sku_id, [0, 0])
+        flags = (AVAILABLE if available else 0)
+        flags |= (HAS_CURRENT if current is not None else 0) | (HAS_REGULAR if regular is not None else 0)
+        write_varint(buf, sku_id - prev_id)
+        write_varint(buf, flags)
+        if current is not None:
+            write_varint(buf, zigzag(current - base[0]))
+            base[0] = current
+        if regular is not None:
+            write_varint(buf, zigzag(regular - base[1]))
+            base[1] = regular
+        prev_id = sku_id
+    part.end += len(buf)
+    return bytes(buf)
+
+
+def _decode_block(data: bytes, pos: int, part: Partition):
+    """One block at `pos` -> (events, new SKUs, last prices it sets, end). IndexError if torn."""
+    ts, pos = read_varint(data, pos)
+    n_new, pos = read_varint(data, pos)
+    new_skus = []
+    for _ in range(n_new):
+        size, pos = read_varint(data, pos)
+        if pos + size > len(data):
+            raise IndexError("torn SKU")
+        new_skus.append(data[pos:pos + size].decode("utf-8"))
+        pos += size
+    known = len(part.skus)
+
+    n, pos = read_varint(data, pos)
+    events, bases, sku_id = [], {}, 0
+    for _ in range(n):
+        delta, pos = read_varint(data, pos)
+        flags, pos = read_varint(data, pos)
+        sku_id += delta
+        base = bases[sku_id] = list(part.last.get(sku_id, (0, 0)))
+        current = regular = None
+        if flags & HAS_CURRENT:
+            d, pos = read_varint(data, pos)
+            current = base[0] = base[0] + unzigzag(d)
+        if flags & HAS_REGULAR:
+            d, pos = read_varint(data, pos)
+            regular = base[1] = base[1] + unzigzag(d)
+        sku = part.skus[sku_id] if sku_id < known else new_skus[sku_id - known]
+        events.append((ts, sku, bool(flags & AVAILABLE), current, regular))
+    return events, new_skus, bases, pos
+
+
+def decode_blocks(data: bytes, part: Partition | None = None) -> Iterator[Tuple[int, str, bool, int | None, int | None]]:
+    """
+    Yield (ts, sku, available, current_cents, regular_cents). A torn last block is
+    skipped; `part` only takes in complete blocks, and part.end is where they end.
+    """
+    part = Partition() if part is None else part
+    while part.end < len(data):
+        try:
+            events, new_skus, bases, end = _decode_block(data, part.end, part)
+        except (IndexError, UnicodeDecodeError):
+            print(f"[price_history] torn block after byte {part.end} of a partition, ignored")
+            return
+        for sku in new_skus:
+            part.ids[sku] = len(part.skus)
+            part.skus.append(sku)
+        part.last.update(bases)
+        part.end = end
+        yield from events
+
+
+# ---------------------------------------------------------------------------
+# Rollups
+# ---------------------------------------------------------------------------
+def window_min_max(points: List[List[int]], now: int, days: int) -> Tuple[int | None, int | None]:
+    """points: [ts, cents] price changes, oldest first; the price in effect at the window start counts."""
+    start = now - days * DAY_S
+    values = []
+    for ts, cents in points:
+        if ts <= start:
+            values = [cents]
+        else:
+            values.append(cents)
+    return (min(values), max(values)) if values else (None, None)
+
+
+def next_expiry(points: List[List[int]], now: int) -> int | None:
+    """First time after `now` at which a window drops a price without a new event."""
+    times = []
+    for days in ROLLUP_DAYS:
+        start = now - days * DAY_S
+        first_inside = next((i for i, (ts, _) in enumerate(points) if ts > start), len(points))
+        # when points[i] reaches the window start, every point before it leaves the window
+        i = max(first_inside, 1)
+        if i < len(points):
+            times.append(points[i][0] + days * DAY_S)
+    return min(times) if times else None
+
+
+def prune_points(points: List[List[int]], now: int) -> List[List[int]]:
+    """Keep the changes inside the largest window plus the one in effect at its start."""
+    start = now - max(ROLLUP_DAYS) * DAY_S
+    keep = [p for p in points if p[0] > start]
+    older = [p for p in points if p[0] <= start]
+    return older[-1:] + keep
+
+
+# ---------------------------------------------------------------------------
+# Store
+# ---------------------------------------------------------------------------
+class PriceHistory:
+    def __init__(self, root: str | None = None, store: ObjectStore | None = None):
+        self.root = root if root is not None else os.environ.get("PRICE_HISTORY_DIR") or None
+        self.store = store if store is not None else ObjectStore.from_env()
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Dict[str, Dict[str, Any]]] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.root is not None
+
+    # ----- collect -----
+    def record(self, table: str, rows: Iterable[Dict[str, Any]]):
+        """Remember the price / availability of written rows; the last row of a SKU wins."""
+        if not self.enabled or table not in HISTORY_TABLES:
+            return
+        with self._lock:
+            pending = self._pending.setdefault(table, {})
+            for row in rows:
+                if row.get("sku") is None:
+                    continue
+                ev = pending.setdefault(str(row["sku"]), {})
+                if "availability" in row:
+                    ev["available"] = bool(row["availability"])
+                for col, key in (("current_price", "current"), ("regular_price", "regular")):
+                    if col in row:
+                        ev[key] = to_cents(row[col])
+
+    # ----- files -----
+    def _chain_dir(self, chain: str) -> str:
+        path = os.path.join(self.root, chain)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _partition(self, chain: str, month: str) -> str:
+        return os.path.join(self._chain_dir(chain), f"{month}.bin")
+
+    def _rollups_path(self) -> str:
+        return os.path.join(self.root, "rollups.sqlite")
+
+    # ----- durable copy (object_store.py) -----
+    def _key(self, path: str) -> str:
+        return STORE_PREFIX + "/" + os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def _pull(self, paths: List[str]):
+        if self.store is not None:
+            for path in paths:
+                self.store.download(self._key(path), path)
+
+    def _push(self, paths: List[str]):
+        if self.store is not None:
+            for path in paths:
+                if os.path.exists(path):
+                    self.store.upload(path, self._key(path))
+
+    def _db(self) -> sqlite3.Connection:
+        os.makedirs(self.root, exist_ok=True)
+        conn = sqlite3.connect(self._rollups_path())
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS sku_state (
+                chain          TEXT NOT NULL,
+                sku            TEXT NOT NULL,
+                last_ts        INTEGER NOT NULL,
+                available      INTEGER,
+                current_cents  INTEGER,
+                regular_cents  INTEGER,
+                last_change_ts INTEGER,
+                points         TEXT NOT NULL DEFAULT '[]',
+                next_expiry    INTEGER,
+                PRIMARY KEY (chain, sku)
+            );
+            CREATE INDEX IF NOT EXISTS sku_state_expiry ON sku_state (chain, next_expiry);
+            CREATE TABLE IF NOT EXISTS rollups (
+                chain     TEXT NOT NULL,
+                sku       TEXT NOT NULL,
+                days      INTEGER NOT NULL,
+                min_cents INTEGER,
+                max_cents INTEGER,
+                PRIMARY KEY (chain, sku, days)
+            );
+            CREATE INDEX IF NOT EXISTS rollups_min ON rollups (chain, days, min_cents);
+            """
+        )
+        return conn
+
+    # ----- write -----
+    def flush(self, ts: int | None = None) -> Dict[str, int]:
+        """Append the changed SKUs of this run and update the rollups. Returns events per chain."""
+        if not self.enabled:
+            return {}
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        ts = int(time.time()) if ts is None else int(ts)
+        partitions = [self._partition(chain, month_of(ts)) for chain in HISTORY_TABLES]
+        self._pull([self._rollups_path()] + partitions)
+
+        written = {}
+        conn = self._db()
+        try:
+            for chain in HISTORY_TABLES:
+                events = pending.get(chain) or {}
+                written[chain] = self._flush_chain(conn, chain, events, ts)
+        finally:
+            conn.close()
+        # partitions first: rollups behind the events are fixed by `rebuild`, not the reverse
+        self._push([p for p, chain in zip(partitions, HISTORY_TABLES) if written[chain]])
+        self._push([self._rollups_path()])
+        print(f"[price_history] {json.dumps(written)} events -> {self.root}")
+        return written
+
+    def _flush_chain(self, conn: sqlite3.Connection, chain: str, events: Dict[str, Dict[str, Any]], ts: int) -> int:
+        states = self._states(conn, chain, list(events))
+        changed = {}
+        for sku, ev in events.items():
+            state = states.get(sku) or {}
+            new = {
+                "available": ev.get("available", state.get("available", True)),
+                "current": ev["current"] if "current" in ev else state.get("current"),
+                "regular": ev["regular"] if "regular" in ev else state.get("regular"),
+            }
+            if new != {k: state.get(k) for k in new}:
+                changed[sku] = new
+
+        if changed:
+            self._append(chain, changed, ts)
+
+        with conn:
+            for sku, new in changed.items():
+                state = states.get(sku) or {"points": [], "last_change_ts": None, "current": None}
+                points = state["points"]
+                last_change_ts = state["last_change_ts"]
+                if new["current"] is not None and new["current"] != state.get("current"):
+                    points.append([ts, new["current"]])
+                    last_change_ts = ts
+                conn.execute(
+                    "INSERT OR REPLACE INTO sku_state VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL)",
+                    (chain, sku, ts, int(new["available"]), new["current"], new["regular"],
+                     last_change_ts, json.dumps(prune_points(points, ts))),
+                )
+            self._update_rollups(conn, chain, list(changed), ts)
+        return len(changed)
+
+    def _states(self, conn: sqlite3.Connection, chain: str, skus: List[str]) -> Dict[str, Dict[str, Any]]:
+        states = {}
+        for start in range(0, len(skus), 500):
+            chunk = skus[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            for sku, available, current, regular, last_change_ts, points in conn.execute(
+                "SELECT sku, available, current_cents, regular_cents, last_change_ts, points "
+                f"FROM sku_state WHERE chain = ? AND sku IN ({marks})",
+                [chain, *chunk],
+            ):
+                states[sku] = {
+                    "available": bool(available),
+                    "current": current,
+                    "regular": regular,
+                    "last_change_ts": last_change_ts,
+                    "points": json.loads(points),
+                }
+        return states
+
+    def _append(self, chain: str, changed: Dict[str, Dict[str, Any]], ts: int):
+        path = self._partition(chain, month_of(ts))
+        part = Partition()
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                data = f.read()
+            for _ in decode_blocks(data, part):
+                pass
+            if part.end < len(data):
+                # a torn block would make every block after it undecodable
+                with open(path, "r+b") as f:
+                    f.truncate(part.end)
+                print(f"[price_history] {path}: cut {len(data) - part.end} bytes of a torn block")
+
+        events = [(sku, new["available"], new["current"], new["regular"]) for sku, new in changed.items()]
+        block = encode_block(ts, events, part)
+        with open(path, "ab") as f:
+            f.write(block)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _update_rollups(self, conn: sqlite3.Connection, chain: str, skus: List[str], now: int):
+        """Recompute the windows of the changed SKUs and of the SKUs whose windows expired."""
+        expired = [r[0] for r in conn.execute(
+            "SELECT sku FROM sku_state WHERE chain = ? AND next_expiry <= ?", (chain, now)
+        )]
+        todo = sorted(set(skus) | set(expired))
+        for start in range(0, len(todo), 500):
+            chunk = todo[start:start + 500]
+            marks = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT sku, points FROM sku_state WHERE chain = ? AND sku IN ({marks})", [chain, *chunk]
+            ).fetchall()
+            for sku, points in rows:
+                points = prune_points(json.loads(points), now)
+                for days in ROLLUP_DAYS:
+                    lo, hi = window_min_max(points, now, days)
+                    conn.execute("INSERT OR REPLACE INTO rollups VALUES (?, ?, ?, ?, ?)", (chain, sku, days, lo, hi))
+                conn.execute(
+                    "UPDATE sku_state SET points = ?, next_expiry = ? WHERE chain = ? AND sku = ?",
+                    (json.dumps(points), next_expiry(points, now), chain, sku),
+                )
+
+    def rebuild(self, chain: str, now: int | None = None) -> int:
+        """Drop the rollups of a chain and replay its event files (e.g. after losing rollups.sqlite)."""
+        now = int(time.time()) if now is None else now
+        states: Dict[str, Dict[str, Any]] = {}
+        for ts, sku, available, current, regular in self.iter_events(chain):
+            state = states.setdefault(sku, {"points": [], "last_change_ts": None, "current": None, "regular": None})
+            if current is not None and current != state["current"]:
+                state["points"] = prune_points(state["points"] + [[ts, current]], ts)
+                state["last_change_ts"] = ts
+                state["current"] = current
+            if regular is not None:
+                state["regular"] = regular
+            state["available"], state["last_ts"] = available, ts
+
+        conn = self._db()
+        try:
+            with conn:
+                conn.execute("DELETE FROM sku_state WHERE chain = ?", (chain,))
+                conn.execute("DELETE FROM rollups WHERE chain = ?", (chain,))
+                conn.executemany(
+                    "INSERT INTO sku_state VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL)",
+                    [(chain, sku, s["last_ts"], int(s["available"]), s["current"], s["regular"],
+                      s["last_change_ts"], json.dumps(s["points"])) for sku, s in states.items()],
+                )
+                self._update_rollups(conn, chain, list(states), now)
+        finally:
+            conn.close()
+        print(f"[price_history] {chain}: rebuilt rollups of {len(states)} SKUs")
+        return len(states)
+
+    # ----- read -----
+    def months(self, chain: str) -> List[str]:
+        path = os.path.join(self.root, chain)
+        if not os.path.isdir(path):
+            return []
+        return sorted(name[:-4] for name in os.listdir(path) if name.endswith(".bin"))
+
+    def iter_events(
+        self, chain: str, since: str | None = None, until: str | None = None
+    ) -> Iterator[Tuple[int, str, bool, int | None, int | None]]:
+        """(ts, sku, available, current_cents, regular_cents) for the months since..until ("YYYY-MM")."""
+        for month in self.months(chain):
+            if (since and month < since) or (until and month > until):
+                continue
+            with open(self._partition(chain, month), "rb") as f:
+                yield from decode_blocks(f.read())
+
+    def sku(self, chain: str, sku: str) -> Dict[str, Any] | None:
+        """Last state + rollups of one SKU, prices in euros."""
+        conn = self._db()
+        try:
+            row = conn.execute(
+                "SELECT last_ts, available, current_cents, regular_cents, last_change_ts "
+                "FROM sku_state WHERE chain = ? AND sku = ?", (chain, str(sku)),
+            ).fetchone()
+            if row is None:
+                return None
+            out = {
+                "sku": str(sku),
+                "last_event": row[0],
+                "available": bool(row[1]),
+                "current_price": _euros(row[2]),
+                "regular_price": _euros(row[3]),
+                "last_change": row[4],
+            }
+            for days, lo, hi in conn.execute(
+                "SELECT days, min_cents, max_cents FROM rollups WHERE chain = ? AND sku = ?", (chain, str(sku))
+            ):
+                out[f"min_{days}d"], out[f"max_{days}d"] = _euros(lo), _euros(hi)
+            return out
+        finally:
+            conn.close()
+
+    def lowest(self, chain: str, days: int = 30, limit: int | None = None) -> List[Dict[str, Any]]:
+        """SKUs whose current price is the lowest of the last `days` days (and below their max)."""
+        conn = self._db()
+        try:
+            sql = (
+                "SELECT s.sku, s.current_cents, r.max_cents FROM rollups r "
+                "JOIN sku_state s ON s.chain = r.chain AND s.sku = r.sku "
+                "WHERE r.chain = ? AND r.days = ? AND s.available = 1 "
+                "AND s.current_cents = r.min_cents AND r.max_cents > r.min_cents "
+                "ORDER BY 1.0 * s.current_cents / r.max_cents"
+            )
+            params: List[Any] = [chain, days]
+            if limit:
+                sql += " LIMIT ?"
+                params.append(limit)
+            return [
+                {"sku": sku, "current_price": _euros(cur), f"max_{days}d": _euros(hi)}
+                for sku, cur, hi in conn.execute(sql, params)
+            ]
+        finally:
+            conn.close()
+
+
+def _euros(cents: int | None) -> float | None:
+    return None if cents is None else cents / 100
+
+
+HISTORY = PriceHistory()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query the price history.")
+    parser.add_argument("--dir", default=os.environ.get("PRICE_HISTORY_DIR", "price_history"))
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("sku", help="last state + rollups of one SKU")
+    p.add_argument("chain")
+    p.add_argument("sku")
+    p = sub.add_parser("lowest", help="SKUs at their lowest price of the window")
+    p.add_argument("chain")
+    p.add_argument("--days", type=int, default=30, choices=ROLLUP_DAYS)
+    p.add_argument("--limit", type=int, default=20)
+    p = sub.add_parser("events", help="raw events of one SKU")
+    p.add_argument("chain")
+    p.add_argument("sku")
+    p = sub.add_parser("rebuild", help="recompute the rollups from the event files")
+    p.add_argument("chain")
+    sub.add_parser("pull", help="copy the history from STORAGE_BUCKET into --dir")
+    args = parser.parse_args()
+
+    history = PriceHistory(args.dir)
+    if args.cmd == "sku":
+        print(json.dumps(history.sku(args.chain, args.sku), indent=2))
+    elif args.cmd == "lowest":
+        print(json.dumps(history.lowest(args.chain, args.days, args.limit), indent=2))
+    elif args.cmd == "events":
+        for ts, sku, available, current, regular in history.iter_events(args.chain):
+            if sku == args.sku:
+                print(json.dumps({"ts": ts, "available": available,
+                                  "current_price": _euros(current), "regular_price": _euros(regular)}))
+    elif args.cmd == "rebuild":
+        history.rebuild(args.chain)
+    elif args.cmd == "pull":
+        if history.store is None:
+            parser.error("STORAGE_BUCKET is not set")
+        history.store.pull(STORE_PREFIX, args.dir)
+
+
+if __name__ == "__main__":
+    main()
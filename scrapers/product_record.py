@@ -0,0 +1,103 @@
+"""
+Compact product record shared by ah_core, dirk_core and hoogvliet_core.
+
+Raw API responses (AH search JSON, Dirk GraphQL items, Hoogvliet Tweakwise/Intershop
+items) are mapped into a ProductRecord as soon as they arrive, so a crawl only keeps
+the fields below alive instead of the whole payload (images, descriptions, offers...).
+"""
+from __future__ import annotations
+
+from collections.abc import Mapping
+from typing import Any, Iterable, Iterator
+
+import pandas as pd
+
+
+FIELDS = (
+    "sku",
+    "url",
+    "product_name_du",
+    "brand",
+    "unit_du",
+    "unit_qty",
+    "unit_type_en",
+    "regular_price",
+    "current_price",
+    "valid_from",
+    "valid_to",
+)
+
+_FIELD_SET = frozenset(FIELDS)
+
+
+class ProductRecord(Mapping):
+    """
+    One product as a __slots__ object (no per-instance __dict__).
+
+    It is a read-only Mapping, so the refresh code can keep using
+    p["sku"] / p.get("current_price") exactly like it did with dicts.
+    """
+
+    __slots__ = FIELDS
+
+    def __init__(
+        self,
+        sku=None,
+        url=None,
+        product_name_du=None,
+        brand=None,
+        unit_du=None,
+        unit_qty=None,
+        unit_type_en=None,
+        regular_price=None,
+        current_price=None,
+        valid_from=None,
+        valid_to=None,
+    ):
+        self.sku = sku
+        self.url = url
+        self.product_name_du = product_name_du
+        self.brand = brand
+        self.unit_du = unit_du
+        self.unit_qty = unit_qty
+        self.unit_type_en = unit_type_en
+        self.regular_price = regular_price
+        self.current_price = current_price
+        self.valid_from = valid_from
+        self.valid_to = valid_to
+
+    # ----- Mapping interface -----
+    def __getitem__(self, key: str) -> Any:
+        if key not in _FIELD_SET:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(FIELDS)
+
+    def __len__(self) -> int:
+        return len(FIELDS)
+
+    # ----- helpers -----
+    def as_tuple(self) -> tuple:
+        return tuple(getattr(self, f) for f in FIELDS)
+
+    def to_row(self) -> dict:
+        return dict(zip(FIELDS, self.as_tuple()))
+
+    def __getstate__(self):
+        return self.as_tuple()
+
+    def __setstate__(self, state):
+        for f, v in zip(FIELDS, state):
+            setattr(self, f, v)
+
+    def __repr__(self) -> str:
+        return f"ProductRecord(sku={self.sku!r}, product_name_du={self.product_name_du!r})"
+
+
+def records_to_frame(records: Iterable[ProductRecord]) -> pd.DataFrame:
+    """Build a DataFrame straight from the record tuples (no intermediate dicts)."""
+    return pd.DataFrame.from_records(
+        (r.as_tuple() for r in records), columns=list(FIELDS)
+    )
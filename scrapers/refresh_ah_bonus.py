@@ -0,0 +1,26 @@
+"""
+Intra-day AH promotion refresh: only the bonus page, no taxonomy crawl.
+Run by .github/workflows/refresh_ah_bonus.yml every few hours; refresh_daily.py
+still does the full catalog.
+"""
+import json
+
+from ah_core import refresh_ah_bonus
+from change_log import CHANGES
+from price_history import HISTORY
+from telemetry import TELEMETRY, start_run
+
+
+def main():
+    start_run()
+    try:
+        counts = refresh_ah_bonus()
+        print(json.dumps({"ah_bonus": counts}, indent=2))
+    finally:
+        HISTORY.flush()
+        CHANGES.flush()
+        TELEMETRY.write_outputs()
+
+
+if __name__ == "__main__":
+    main()
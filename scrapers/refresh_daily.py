@@ -1,21 +1,59 @@
+import json
+import os
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
 
 
+import hoogvliet_core
+import dirk_core
+import ah_core
 from hoogvliet_core import refresh_hoogvliet_daily
 from dirk_core import refresh_dirk_daily
 from ah_core import refresh_ah_daily
+from dirk_stores import refresh_dirk_store_prices, store_ids_from_env
+from dirk_stores import scheduler_from_env as dirk_store_scheduler_from_env
+from orchestrator import run_all
+from change_log import CHANGES
+from price_history import HISTORY
+from snapshots import SNAPSHOTS
+from refresh_scheduler import from_env as scheduler_from_env
+from telemetry import TELEMETRY, start_run
 # from jumbo_core import refresh_jumbo_daily_once
 
 
+# REFRESH_MODE:
+#   stages  (default) -> stage-pipelined orchestrator over shared pools (see orchestrator.py)
+#   threads           -> one thread per chain running refresh_*_daily end to end
+#   stream            -> like threads, but each chain crawls/diffs/upserts as a pipeline (see pipeline.py)
+REFRESH_MODE = os.environ.get("REFRESH_MODE", "stages").lower()
+STREAMING = REFRESH_MODE == "stream"
+
+# stages mode + REFRESH_BUDGET -> only the units most likely to have changed (see refresh_scheduler.py)
+
+# optional: also write the JSON summary to this file
+SUMMARY_PATH = os.environ.get("REFRESH_SUMMARY_PATH")
+
+CHAINS = {
+    "hoogvliet": hoogvliet_core.ADAPTER,
+    "dirk": dirk_core.ADAPTER,
+    "ah": ah_core.ADAPTER,
+    # "jumbo": jumbo_core.ADAPTER,  -> a ChainAdapter, see chain_adapter.py
+}
+
 TASKS = {
-    "hoogvliet": refresh_hoogvliet_daily,
-    "dirk": refresh_dirk_daily,
-    "ah": refresh_ah_daily,
+    "hoogvliet": partial(refresh_hoogvliet_daily, streaming=STREAMING),
+    "dirk": partial(refresh_dirk_daily, streaming=STREAMING),
+    "ah": partial(refresh_ah_daily, streaming=STREAMING),
     # "jumbo": refresh_jumbo_daily_once,
 }
 
 
-def main():
+def _timed(name, func):
+    with TELEMETRY.stage(name, "refresh"):
+        return func()
+
+
+def main_threads():
     print("=== Start daily refresh for all supermarkets (in parallel) ===")
 
     results = {}
@@ -23,14 +61,14 @@ def main():
     # max_workers = len(TASKS)
     with ThreadPoolExecutor(max_workers=len(TASKS)) as executor:
         future_to_name = {
-            executor.submit(func): name
+            executor.submit(_timed, name, func): name
             for name, func in TASKS.items()
         }
 
         for future in as_completed(future_to_name):
             name = future_to_name[future]
             try:
-                result = future.result()  
+                result = future.result()
                 results[name] = {"status": "ok", "result": result}
                 print(f"[OK] {name} daily refresh finished: {result}")
             except Exception as e:
@@ -38,7 +76,36 @@ def main():
                 print(f"[ERROR] {name} daily refresh failed: {e}")
 
     print("=== All daily refresh tasks finished ===")
-    print("Summary:", results)
+    text = json.dumps({"mode": REFRESH_MODE, "chains": results}, indent=2, default=str)
+    print(text)
+    if SUMMARY_PATH:
+        with open(SUMMARY_PATH, "w") as f:
+            f.write(text)
+
+
+def main():
+    # TELEMETRY_REPORT_PATH / TELEMETRY_PROM_PATH -> per-run report (see telemetry.py)
+    start_run()
+    try:
+        if REFRESH_MODE in ("threads", "stream"):
+            main_threads()
+        else:
+            print("=== Start daily refresh for all supermarkets (stage pipeline) ===")
+            run_all(CHAINS, summary_path=SUMMARY_PATH, scheduler=scheduler_from_env())
+            print("=== All daily refresh tasks finished ===")
+
+        # DIRK_STORE_IDS -> per-store price deltas against today's reference prices (see dirk_stores.py)
+        store_ids = store_ids_from_env()
+        if store_ids:
+            try:
+                refresh_dirk_store_prices(store_ids, scheduler=dirk_store_scheduler_from_env(store_ids))
+            except Exception as e:
+                print(f"[ERROR] dirk store prices failed: {e}")
+    finally:
+        HISTORY.flush()
+        CHANGES.flush()
+        SNAPSHOTS.close()
+        TELEMETRY.write_outputs()
 
 
 if __name__ == "__main__":
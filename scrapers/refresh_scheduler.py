@@ -0,0 +1,188 @@
+"""
+Change-rate-aware selection of work units for the daily refresh.
+
+A segment is one work unit of a chain: an AH taxonomyId, a Dirk webGroupId or a
+Hoogvliet top category. For every segment the scheduler remembers, across runs:
+
+    rate          EWMA of the observed change rate (changes per product per hour)
+    products      products seen in the last crawl
+    cost          EWMA of the requests one crawl of the segment takes
+    last_crawled  unix time of the last successful crawl
+
+Per run and chain, segments are picked greedily by the expected number of changed
+products per request,
+
+    products * (1 - exp(-rate * hours_since_last_crawl)) / cost
+
+until the request budget is spent. Segments never crawled come first, and every
+`full_sweep_hours` the whole chain is crawled (and missing SKUs are marked), so no
+segment goes stale forever. State is a JSON file (REFRESH_SCHEDULER_STATE).
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Tuple
+
+
+DEFAULT_RATE = 0.005        # changes per product per hour for a segment seen once
+ALPHA = 0.3                 # EWMA weight of the newest observation
+FULL_SWEEP_HOURS = 72.0
+
+
+def parse_budgets(text: str | None) -> Dict[str, int]:
+    """
+    "300" -> {"*": 300};  "ah=400,dirk=60,hoogvliet=300" -> per chain.
+    """
+    budgets: Dict[str, int] = {}
+    for part in (text or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        if "=" in part:
+            chain, value = part.split("=", 1)
+            budgets[chain.strip()] = int(value)
+        else:
+            budgets["*"] = int(part)
+    return budgets
+
+
+class RefreshScheduler:
+    def __init__(
+        self,
+        state_path: str,
+        budgets: Dict[str, int],
+        full_sweep_hours: float = FULL_SWEEP_HOURS,
+        alpha: float = ALPHA,
+        now: float | None = None,
+    ):
+        self.state_path = state_path
+        self.budgets = budgets
+        self.full_sweep_hours = full_sweep_hours
+        self.alpha = alpha
+        self.now = time.time() if now is None else now
+        self._lock = threading.Lock()
+        self.state: Dict[str, Any] = {"version": 1, "chains": {}}
+        self.selection: Dict[str, Dict[str, Any]] = {}
+
+        if os.path.exists(state_path):
+            with open(state_path) as f:
+                self.state = json.load(f)
+            print(f"[scheduler] loaded state from {state_path}")
+
+    def _chain(self, chain: str) -> Dict[str, Any]:
+        return self.state["chains"].setdefault(chain, {"last_full_sweep": None, "segments": {}})
+
+    def _hours_since(self, ts: float | None) -> float:
+        return math.inf if ts is None else max(0.0, (self.now - ts) / 3600.0)
+
+    # ----- selection -----
+    def score(self, chain: str, seg: Dict[str, Any] | None) -> float:
+        """Expected changed products per request; inf for segments without history."""
+        if seg is None or seg.get("last_crawled") is None:
+            return math.inf
+        age = self._hours_since(seg["last_crawled"])
+        p_changed = 1.0 - math.exp(-seg.get("rate", DEFAULT_RATE) * age)
+        return max(seg.get("products", 0), 1) * p_changed / max(seg.get("cost", 1.0), 1.0)
+
+    def select(
+        self,
+        chain: str,
+        units: Iterable[Any],
+        unit_key: Callable[[Any], Any] | None = None,
+    ) -> Tuple[List[Any], bool]:
+        """
+        Pick the units to crawl this run. Returns (units, full_sweep).
+        full_sweep=True means every unit was picked, so missing SKUs may be marked.
+        """
+        units = list(units)
+        key = unit_key or (lambda u: u)
+        budget = self.budgets.get(chain, self.budgets.get("*"))
+
+        with self._lock:
+            state = self._chain(chain)
+            sweep_due = self._hours_since(state.get("last_full_sweep")) >= self.full_sweep_hours
+
+            if budget is None or sweep_due:
+                reason = "no budget" if budget is None else "full sweep due"
+                self.selection[chain] = {"units": len(units), "of": len(units), "reason": reason}
+                print(f"[scheduler] {chain}: all {len(units)} units ({reason})")
+                return units, True
+
+            segments = state["segments"]
+            ranked = sorted(
+                units,
+                key=lambda u: self.score(chain, segments.get(str(key(u)))),
+                reverse=True,
+            )
+
+            picked, spent = [], 0.0
+            for u in ranked:
+                cost = max((segments.get(str(key(u))) or {}).get("cost", 1.0), 1.0)
+                if picked and spent + cost > budget:
+                    continue
+                picked.append(u)
+                spent += cost
+
+        full = len(picked) == len(units)
+        self.selection[chain] = {
+            "units": len(picked),
+            "of": len(units),
+            "requests_est": round(spent, 1),
+            "budget": budget,
+        }
+        print(f"[scheduler] {chain}: {len(picked)}/{len(units)} units, ~{spent:.0f}/{budget} requests")
+        return picked, full
+
+    # ----- learning -----
+    def observe(self, chain: str, key: Any, products: int, changed: int, cost: float):
+        """Record one successful crawl of a segment: `changed` of `products` rows changed."""
+        with self._lock:
+            segments = self._chain(chain)["segments"]
+            seg = segments.setdefault(str(key), {"rate": DEFAULT_RATE, "cost": float(cost), "crawls": 0})
+
+            age = self._hours_since(seg.get("last_crawled"))
+            if products > 0 and 0 < age < math.inf:
+                # fraction changed over `age` hours -> per-hour rate (Poisson: 1 - exp(-rate * age))
+                fraction = min(changed / products, 0.99)
+                observed = -math.log(1.0 - fraction) / age
+                seg["rate"] = self.alpha * observed + (1 - self.alpha) * seg["rate"]
+
+            seg["cost"] = self.alpha * cost + (1 - self.alpha) * seg.get("cost", cost)
+            seg["products"] = products
+            seg["last_crawled"] = self.now
+            seg["crawls"] = seg.get("crawls", 0) + 1
+
+    def finish(self, chain: str, full_sweep: bool):
+        """full_sweep=True only if every unit of the chain was crawled without errors."""
+        if full_sweep:
+            with self._lock:
+                self._chain(chain)["last_full_sweep"] = self.now
+
+    def save(self):
+        tmp = self.state_path + ".tmp"
+        with self._lock:
+            with open(tmp, "w") as f:
+                json.dump(self.state, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.state_path)
+        print(f"[scheduler] state -> {self.state_path}")
+
+
+def from_env() -> RefreshScheduler | None:
+    """
+    REFRESH_BUDGET            requests per chain and run, "300" or "ah=400,dirk=60,hoogvliet=300"
+    REFRESH_SCHEDULER_STATE   JSON state file (default refresh_scheduler_state.json)
+    REFRESH_FULL_SWEEP_HOURS  crawl everything at least this often (default 72)
+    No REFRESH_BUDGET -> no scheduler, every run is a full crawl.
+    """
+    budgets = parse_budgets(os.environ.get("REFRESH_BUDGET"))
+    if not budgets:
+        return None
+    return RefreshScheduler(
+        os.environ.get("REFRESH_SCHEDULER_STATE", "refresh_scheduler_state.json"),
+        budgets,
+        full_sweep_hours=float(os.environ.get("REFRESH_FULL_SWEEP_HOURS", FULL_SWEEP_HOURS)),
+    )
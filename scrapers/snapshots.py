@@ -0,0 +1,416 @@
+"""
+Columnar catalog snapshots: one compressed Parquet file per chain and crawl date.
+
+Every daily refresh (all REFRESH_MODEs and the sharded crawl) and every full crawl
+offers the products it crawled to SNAPSHOTS. They are written while the crawl runs,
+one row group at a time, so a snapshot never sits in memory as a whole:
+
+    <SNAPSHOT_DIR>/chain=ah/date=2026-10-19/part-0.parquet
+    <SNAPSHOT_DIR>/chain=ah/date=2026-10-19/_SUCCESS.json   rows, complete, written_at
+
+Columns are product_record.FIELDS (the crawled values, before translation), with the
+prices as float64 and the dates as ISO strings. The file is written to a .tmp name and
+renamed on finish(), so a reader never sees half a snapshot; a second crawl on the same
+day replaces the first, unless the first was complete and the second is not.
+complete=False in _SUCCESS.json marks a crawl that skipped work units (failed or not
+picked by the scheduler), so it is not the whole catalog.
+
+The layout is hive-partitioned, so pyarrow.dataset / DuckDB / polars read the whole
+directory as one table. The reader below memory-maps single snapshots:
+
+    python scrapers/snapshots.py dates ah
+    python scrapers/snapshots.py scan ah 2026-10-19 --columns sku,current_price --where unit_type_en=kg
+    python scrapers/snapshots.py diff ah 2026-10-18 2026-10-19 --limit 20
+    python scrapers/snapshots.py pull --chain ah      # local copy from STORAGE_BUCKET
+
+Disabled (add / finish do nothing) unless SNAPSHOT_DIR is set. With STORAGE_BUCKET set
+as well (object_store.py), finish() uploads the snapshot under snapshots/ with the same
+layout, the marker last, and checks the bucket's marker before replacing a complete
+snapshot. SNAPSHOT_KEEP_DAYS drops snapshots older than that many days on close(),
+locally and in the bucket.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import threading
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from chain_adapter import normalize_date, normalize_price
+from object_store import ObjectStore
+from product_record import FIELDS
+
+
+SNAPSHOT_CHAINS = ("ah", "dirk", "hoogvliet")
+ROW_GROUP_SIZE = 20_000
+COMPRESSION = "zstd"
+STORE_PREFIX = "snapshots"
+MARKER = "_SUCCESS.json"
+
+SCHEMA = pa.schema(
+    [
+        (f, pa.float64() if f in ("unit_qty", "regular_price", "current_price") else pa.string())
+        for f in FIELDS
+    ]
+)
+# the columns diff() compares for "changed"
+DIFF_COLUMNS = ("regular_price", "current_price", "valid_from", "valid_to", "unit_qty", "unit_type_en")
+
+
+def today() -> str:
+    return datetime.now(timezone.utc).date().isoformat()
+
+
+def _missing(v: Any) -> bool:
+    # None, or NaN from a DataFrame (add_frame)
+    return v is None or (isinstance(v, float) and v != v)
+
+
+def _float(v: Any) -> float | None:
+    if _missing(v):
+        return None
+    try:
+        return normalize_price(v)
+    except (TypeError, ValueError):
+        return None
+
+
+def _date(v: Any) -> str | None:
+    # the APIs send "2025-11-04T00:00:00" as well as date objects
+    if _missing(v):
+        return None
+    return (normalize_date(v) or "")[:10] or None
+
+
+def _str(v: Any) -> str | None:
+    return None if _missing(v) else str(v)
+
+
+CONVERTERS = {f: _str for f in FIELDS}
+CONVERTERS.update(unit_qty=_float, regular_price=_float, current_price=_float,
+                  valid_from=_date, valid_to=_date)
+
+
+# ---------------------------------------------------------------------------
+# Writer
+# ---------------------------------------------------------------------------
+class _SnapshotFile:
+    def __init__(self, directory: str, row_group_size: int):
+        self.directory = directory
+        self.path = os.path.join(directory, "part-0.parquet")
+        self.tmp_path = self.path + ".tmp"
+        self.row_group_size = row_group_size
+        self.seen: set = set()
+        self.columns: Dict[str, List[Any]] = {f: [] for f in FIELDS}
+        self.rows = 0
+        os.makedirs(directory, exist_ok=True)
+        self.writer = pq.ParquetWriter(self.tmp_path, SCHEMA, compression=COMPRESSION)
+
+    def add(self, record) -> bool:
+        sku = record.get("sku")
+        if sku is None or str(sku) in self.seen:
+            return False
+        self.seen.add(str(sku))
+        for f in FIELDS:
+            self.columns[f].append(CONVERTERS[f](record.get(f)))
+        if len(self.columns["sku"]) >= self.row_group_size:
+            self.write_group()
+        return True
+
+    def write_group(self):
+        n = len(self.columns["sku"])
+        if not n:
+            return
+        self.writer.write_table(pa.Table.from_pydict(self.columns, schema=SCHEMA))
+        self.rows += n
+        self.columns = {f: [] for f in FIELDS}
+
+    @property
+    def marker_path(self) -> str:
+        return os.path.join(self.directory, MARKER)
+
+    def close(self):
+        self.write_group()
+        self.writer.close()
+
+    def publish(self, complete: bool):
+        os.replace(self.tmp_path, self.path)
+        tmp = self.marker_path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({
+                "rows": self.rows,
+                "complete": complete,
+                "written_at": datetime.now(timezone.utc).isoformat(),
+            }, f)
+        os.replace(tmp, self.marker_path)
+
+    def discard(self):
+        os.remove(self.tmp_path)
+
+
+class Snapshots:
+    def __init__(
+        self,
+        root: str | None = None,
+        row_group_size: int = ROW_GROUP_SIZE,
+        store: ObjectStore | None = None,
+    ):
+        self.root = root if root is not None else os.environ.get("SNAPSHOT_DIR") or None
+        self.row_group_size = row_group_size
+        self.store = store if store is not None else ObjectStore.from_env()
+        self._lock = threading.Lock()
+        self._open: Dict[str, _SnapshotFile] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.root is not None
+
+    def path(self, chain: str, day: str) -> str:
+        return os.path.join(self.root, f"chain={chain}", f"date={day}")
+
+    # ----- durable copy (object_store.py) -----
+    def _key(self, path: str) -> str:
+        return STORE_PREFIX + "/" + os.path.relpath(path, self.root).replace(os.sep, "/")
+
+    def _published(self, snap: _SnapshotFile) -> Dict[str, Any] | None:
+        """_SUCCESS.json of the snapshot already published for that day: local, else the bucket's."""
+        marker = None
+        if os.path.exists(snap.marker_path):
+            with open(snap.marker_path) as f:
+                marker = json.load(f)
+        if (marker is None or not marker.get("complete")) and self.store is not None:
+            data = self.store.get(self._key(snap.marker_path))
+            if data is not None:
+                marker = json.loads(data)
+        return marker
+
+    # ----- write -----
+    def add(self, chain: str, records: Iterable[Any], day: str | None = None) -> int:
+        """Append crawled products (ProductRecords or dicts) to today's snapshot; first SKU wins."""
+        if not self.enabled or chain not in SNAPSHOT_CHAINS:
+            return 0
+        with self._lock:
+            snap = self._open.get(chain)
+            if snap is None:
+                snap = _SnapshotFile(self.path(chain, day or today()), self.row_group_size)
+                self._open[chain] = snap
+            return sum(snap.add(r) for r in records)
+
+    def add_frame(self, chain: str, df, day: str | None = None) -> int:
+        """Full crawls: the FIELDS columns of a DataFrame."""
+        cols = [f for f in FIELDS if f in df.columns]
+        return self.add(chain, (dict(zip(cols, t)) for t in df[cols].itertuples(index=False, name=None)), day)
+
+    def finish(self, chain: str, complete: bool = True) -> int | None:
+        """Close the snapshot of a chain and publish it. Returns its row count."""
+        with self._lock:
+            snap = self._open.pop(chain, None)
+        if snap is None:
+            return None
+        snap.close()
+        published = self._published(snap)
+        if not complete and published and published.get("complete"):
+            # an incomplete crawl must not replace the whole catalog of the same day
+            snap.discard()
+            print(f"[snapshots] {chain}: kept the complete snapshot in {snap.directory}, "
+                  f"{snap.rows} rows of this incomplete crawl dropped")
+            return snap.rows
+        snap.publish(complete)
+        if self.store is not None:
+            # the marker last: a snapshot is published once its marker is there
+            self.store.upload(snap.path, self._key(snap.path))
+            self.store.upload(snap.marker_path, self._key(snap.marker_path))
+        print(f"[snapshots] {chain}: {snap.rows} rows -> {snap.path}" + ("" if complete else " (incomplete)"))
+        return snap.rows
+
+    def close(self):
+        """End of the run: publish what is still open as incomplete, prune old snapshots."""
+        if not self.enabled:
+            return
+        for chain in list(self._open):
+            self.finish(chain, complete=False)
+        keep_days = os.environ.get("SNAPSHOT_KEEP_DAYS")
+        if keep_days:
+            self.prune(int(keep_days))
+
+    def prune(self, keep_days: int, now: date | None = None) -> int:
+        cutoff = ((now or datetime.now(timezone.utc).date()) - timedelta(days=keep_days)).isoformat()
+        removed = set()
+        for chain in SNAPSHOT_CHAINS:
+            for day in self.dates(chain, complete_only=False):
+                if day < cutoff:
+                    shutil.rmtree(self.path(chain, day))
+                    removed.add((chain, day))
+            if self.store is not None:
+                old = []
+                for key in self.store.list(f"{STORE_PREFIX}/chain={chain}"):
+                    part = key.split("/")[2]            # snapshots/chain=ah/date=.../file
+                    if part.startswith("date=") and part[len("date="):] < cutoff:
+                        old.append(key)
+                        removed.add((chain, part[len("date="):]))
+                self.store.delete(old)
+        if removed:
+            print(f"[snapshots] pruned {len(removed)} snapshots older than {cutoff}")
+        return len(removed)
+
+    # ----- read -----
+    def dates(self, chain: str, complete_only: bool = False) -> List[str]:
+        """Published snapshot dates of a chain, oldest first."""
+        base = os.path.join(self.root, f"chain={chain}")
+        if not os.path.isdir(base):
+            return []
+        out = []
+        for name in sorted(os.listdir(base)):
+            marker = os.path.join(base, name, "_SUCCESS.json")
+            if not name.startswith("date=") or not os.path.exists(marker):
+                continue
+            if complete_only:
+                with open(marker) as f:
+                    if not json.load(f).get("complete"):
+                        continue
+            out.append(name[len("date="):])
+        return out
+
+    def open(self, chain: str, day: str) -> pq.ParquetFile:
+        """The snapshot as a memory-mapped ParquetFile (pages are read on demand)."""
+        path = os.path.join(self.path(chain, day), "part-0.parquet")
+        return pq.ParquetFile(pa.memory_map(path, "r"))
+
+    def scan(
+        self,
+        chain: str,
+        day: str,
+        columns: List[str] | None = None,
+        where: Dict[str, Any] | None = None,
+        batch_size: int = 65_536,
+    ) -> Iterator[pa.RecordBatch]:
+        """
+        Record batches of one snapshot, only `columns` decoded. where={"unit_type_en": "kg"}
+        keeps the rows equal to every value (the filter columns are read as well).
+        """
+        pf = self.open(chain, day)
+        wanted = list(columns or SCHEMA.names)
+        read = wanted + [c for c in (where or {}) if c not in wanted]
+        for batch in pf.iter_batches(batch_size=batch_size, columns=read):
+            if where:
+                mask = None
+                for col, value in where.items():
+                    m = pc.equal(batch.column(col), pa.scalar(value, SCHEMA.field(col).type))
+                    mask = m if mask is None else pc.and_(mask, m)
+                batch = batch.filter(mask)
+            if batch.num_rows:
+                yield batch.select(wanted) if read != wanted else batch
+
+    def read(self, chain: str, day: str, columns: List[str] | None = None) -> pa.Table:
+        return pq.read_table(
+            os.path.join(self.path(chain, day), "part-0.parquet"),
+            columns=columns,
+            memory_map=True,
+        )
+
+    def diff(
+        self,
+        chain: str,
+        day_a: str,
+        day_b: str,
+        columns: Iterable[str] = DIFF_COLUMNS,
+    ) -> Dict[str, pa.Table]:
+        """
+        Compare two snapshots on sku, reading only sku + `columns`:
+            added    SKUs only in day_b
+            removed  SKUs only in day_a
+            changed  SKUs in both with a different value in one of `columns`
+                     (<col>_a / <col>_b side by side)
+        """
+        columns = list(columns)
+        a = self.read(chain, day_a, ["sku"] + columns)
+        b = self.read(chain, day_b, ["sku"] + columns)
+
+        added = b.join(a.select(["sku"]), "sku", join_type="left anti")
+        removed = a.join(b.select(["sku"]), "sku", join_type="left anti")
+
+        joined = a.join(b, "sku", join_type="inner", left_suffix="_a", right_suffix="_b")
+        mask = None
+        for col in columns:
+            left, right = joined.column(f"{col}_a"), joined.column(f"{col}_b")
+            # null-aware "is distinct from"
+            m = pc.or_kleene(
+                pc.fill_null(pc.not_equal(left, right), False),
+                pc.xor(pc.is_null(left), pc.is_null(right)),
+            )
+            mask = m if mask is None else pc.or_(mask, m)
+        changed = joined.filter(mask) if mask is not None else joined.slice(0, 0)
+
+        return {"added": added, "removed": removed, "changed": changed}
+
+
+SNAPSHOTS = Snapshots()
+
+
+def _parse_where(items: List[str]) -> Dict[str, Any]:
+    where = {}
+    for item in items or []:
+        col, value = item.split("=", 1)
+        where[col] = float(value) if SCHEMA.field(col).type == pa.float64() else value
+    return where
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Read the Parquet catalog snapshots.")
+    parser.add_argument("--dir", default=os.environ.get("SNAPSHOT_DIR", "snapshots"))
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("dates", help="snapshot dates of a chain")
+    p.add_argument("chain")
+    p.add_argument("--complete", action="store_true", help="only complete crawls")
+    p = sub.add_parser("scan", help="rows of one snapshot as JSON lines")
+    p.add_argument("chain")
+    p.add_argument("date")
+    p.add_argument("--columns", default=None, help="comma-separated, default all")
+    p.add_argument("--where", action="append", metavar="COL=VALUE")
+    p.add_argument("--limit", type=int, default=None)
+    p = sub.add_parser("diff", help="added / removed / changed SKUs between two dates")
+    p.add_argument("chain")
+    p.add_argument("date_a")
+    p.add_argument("date_b")
+    p.add_argument("--limit", type=int, default=10, help="rows to print per group")
+    p = sub.add_parser("pull", help="download the snapshots from STORAGE_BUCKET into --dir")
+    p.add_argument("--chain", default=None, help="one chain, default all")
+    args = parser.parse_args()
+
+    snapshots = Snapshots(args.dir)
+    if args.cmd == "dates":
+        print("\n".join(snapshots.dates(args.chain, complete_only=args.complete)))
+    elif args.cmd == "scan":
+        columns = args.columns.split(",") if args.columns else None
+        left = args.limit
+        for batch in snapshots.scan(args.chain, args.date, columns, _parse_where(args.where)):
+            for row in batch.to_pylist()[:left]:
+                print(json.dumps(row, ensure_ascii=False))
+            if left is not None:
+                left -= min(left, batch.num_rows)
+                if left == 0:
+                    break
+    elif args.cmd == "diff":
+        result = snapshots.diff(args.chain, args.date_a, args.date_b)
+        print(json.dumps({k: t.num_rows for k, t in result.items()}))
+        for name, table in result.items():
+            for row in table.slice(0, args.limit).to_pylist():
+                print(json.dumps({"kind": name, **row}, ensure_ascii=False))
+    elif args.cmd == "pull":
+        if snapshots.store is None:
+            parser.error("STORAGE_BUCKET is not set")
+        if args.chain:
+            snapshots.store.pull(f"{STORE_PREFIX}/chain={args.chain}", os.path.join(args.dir, f"chain={args.chain}"))
+        else:
+            snapshots.store.pull(STORE_PREFIX, args.dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,19 @@
 import os
 import math
-from typing import List, Dict, Any
+import datetime
+import threading
+from typing import List, Dict, Any, Tuple
 
 import pandas as pd
 import numpy as np
+import requests
 from supabase import create_client
 
+from change_log import CHANGES
+from embedder import embed_new_rows
+from price_history import HISTORY
+from telemetry import TELEMETRY
+
 
 
 def get_supabase():
@@ -15,10 +23,37 @@ def get_supabase():
     return create_client(url, key)
 
 
+# ---------- optional columns ----------
+# Columns added by a DDL next to the code that writes them (EMBEDDING_TEXT_HASH_DDL,
+# EMBEDDING_PACKED_DDL). Until it has been run, the writers leave them out.
+
+_columns: Dict[Tuple[str, str], bool] = {}
+_columns_lock = threading.Lock()
+
+
+def has_column(table_name: str, column: str) -> bool:
+    """Whether table_name has column; asked once per process and table."""
+    key = (table_name, column)
+    with _columns_lock:
+        if key not in _columns:
+            try:
+                get_supabase().table(table_name).select(column).limit(1).execute()
+                _columns[key] = True
+            except Exception as e:
+                # PostgREST: 42703 undefined_column
+                if "42703" not in str(e) and "does not exist" not in str(e):
+                    raise
+                print(f"[supabase] {table_name} has no {column} column, it is not written")
+                _columns[key] = False
+        return _columns[key]
+
+
 # ---------- helper to make values JSON-safe ----------
 
 def sanitize_value(v: Any) -> Any:
-    import datetime
+    # None / str / bool are already JSON-safe (most cells), return early
+    if v is None or isinstance(v, (str, bool)):
+        return v
 
     # floats: kill NaN / inf
     if isinstance(v, (float, np.floating)):
@@ -38,10 +73,6 @@ def sanitize_value(v: Any) -> Any:
     if isinstance(v, (pd.Timestamp, datetime.date, datetime.datetime)):
         return v.isoformat()
 
-    # None stays None (becomes null in JSON)
-    if v is None:
-        return None
-
     return v
 
 
@@ -49,6 +80,53 @@ def sanitize_rows(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
     return [{k: sanitize_value(v) for k, v in row.items()} for row in rows]
 
 
+# ---------- columnar version for DataFrames ----------
+
+def _iso(v: Any) -> Any:
+    # same strings as sanitize_value: isoformat keeps the UTC offset and sub-seconds
+    if isinstance(v, (pd.Timestamp, datetime.date, datetime.datetime)) and not pd.isna(v):
+        return v.isoformat()
+    return None if v is pd.NaT else v
+
+
+# object columns pandas reports as one of these hold no dates, no need to visit the cells
+_PLAIN_INFERRED = {"string", "bytes", "empty", "integer", "floating", "mixed-integer-float", "boolean", "decimal"}
+
+
+def sanitize_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Column-wise equivalent of sanitize_rows for a whole DataFrame:
+    - float columns: ±inf -> NaN (NaN is written as null)
+    - datetime columns (by dtype, tz-aware or not): ISO strings, offset kept
+    - object columns holding date/datetime objects, also mixed: ISO strings
+    numpy scalars need no work here, the pandas JSON/CSV writers handle them natively.
+    """
+    out = {}
+    for col in df.columns:
+        s = df[col]
+
+        if pd.api.types.is_float_dtype(s.dtype):
+            s = s.mask(s.isin([np.inf, -np.inf]))
+
+        elif pd.api.types.is_datetime64_any_dtype(s.dtype):
+            s = s.astype(object).map(_iso)
+
+        elif s.dtype == object:
+            if pd.api.types.infer_dtype(s, skipna=True) not in _PLAIN_INFERRED:
+                s = s.map(_iso)
+
+        out[col] = s
+
+    return pd.DataFrame(out, index=df.index)
+
+
+def frame_to_json(df: pd.DataFrame) -> bytes:
+    """
+    Serialize a sanitized DataFrame as a JSON array of records, straight from the
+    columns with pandas' C encoder (no intermediate list of dicts).
+    """
+    return df.to_json(orient="records", double_precision=15).encode("utf-8")
+
 
 def upsert_rows(
     table_name: str,
@@ -60,14 +138,16 @@ def upsert_rows(
     - upsert one row at a time
     - if one row fails → log it and continue with the next row
     - no retries, no crashes
+    Returns the skus of the rows that failed.
     """
     if not rows:
         print("[upsert_rows] No rows to upsert.")
-        return
+        return []
 
     supabase = get_supabase()
     safe_rows = sanitize_rows(rows)
     total = len(safe_rows)
+    failed = []
 
     for idx, row in enumerate(safe_rows, start=1):
         sku = row.get("sku")
@@ -77,9 +157,167 @@ def upsert_rows(
                 q = q.upsert(row, on_conflict=conflict_col)
             else:
                 q = q.upsert(row)  
-            q.execute()
+            with TELEMETRY.timed_call(f"POST supabase/rest/v1/{table_name}"):
+                q.execute()
             print(f"[upsert_rows] OK {idx}/{total} sku={sku}")
         except Exception as e:
             print(f"[upsert_rows] ❌ Skip {idx}/{total} sku={sku} due to error: {e}")
+            TELEMETRY.count("errors", kind="upsert_row", table=table_name)
+            failed.append(sku)
 
     print("[upsert_rows] Done.")
+    return failed
+
+
+def upsert_batch(
+    table_name: str,
+    rows: List[Dict[str, Any]],
+    conflict_col: str | None = None,
+    supabase=None,
+):
+    """
+    Upsert many rows with one request per column set.
+    - PostgREST fills columns missing from a row with NULL in a bulk upsert, so rows
+      are grouped by their keys first (e.g. {"sku", "availability"} vs. full rows)
+    - if a group fails → fall back to upsert_rows for that group (row by row)
+    Returns the skus of the rows that could not be written.
+    """
+    if not rows:
+        return []
+
+    supabase = supabase or get_supabase()
+
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for row in sanitize_rows(rows):
+        groups.setdefault(tuple(sorted(row.keys())), []).append(row)
+
+    failed = []
+    for group in groups.values():
+        try:
+            q = supabase.table(table_name)
+            if conflict_col:
+                q = q.upsert(group, on_conflict=conflict_col)
+            else:
+                q = q.upsert(group)
+            with TELEMETRY.timed_call(f"POST supabase/rest/v1/{table_name}"):
+                q.execute()
+            print(f"[upsert_batch] OK {len(group)} rows -> {table_name}")
+        except Exception as e:
+            print(f"[upsert_batch] ❌ batch of {len(group)} failed ({e}), retrying row by row")
+            TELEMETRY.count("retries", kind="upsert_batch", table=table_name)
+            failed += upsert_rows(table_name, group, conflict_col=conflict_col)
+    return failed
+
+
+def write_rows(
+    table_name: str,
+    rows: List[Dict[str, Any]],
+    conflict_col: str = "sku",
+    supabase=None,
+    loader=None,
+    old_by_sku: Dict[str, Dict[str, Any]] | None = None,
+):
+    """
+    Bulk write path used by the full crawls and the daily refresh.
+    - EMBEDDER set → new products get embedding_du in the same upsert (embedder.py)
+    - DATABASE_URL set (or a PgBulkLoader given) → COPY into a staging table + one merge (pg_loader.py)
+    - otherwise → PostgREST upsert_batch
+    - old_by_sku given → the rows that were written go to the change log (change_log.py),
+      only after the write, so a failed batch never shows up as a change
+    Returns the number of rows written.
+    """
+    if not rows:
+        print("[write_rows] No rows to write.")
+        return 0
+
+    embed_new_rows(table_name, rows)
+
+    failed = []
+    if loader is not None:
+        backend = "copy"
+        loader.load(table_name, rows, conflict_col=conflict_col)
+    elif os.environ.get("DATABASE_URL"):
+        from pg_loader import copy_merge_rows
+        backend = "copy"
+        copy_merge_rows(table_name, rows, conflict_col=conflict_col)
+    else:
+        backend = "postgrest"
+        failed = upsert_batch(table_name, rows, conflict_col=conflict_col, supabase=supabase)
+    if failed:
+        skipped = {str(sku) for sku in failed}
+        rows = [r for r in rows if str(r.get("sku")) not in skipped]
+    TELEMETRY.count("rows_written", len(rows), table=table_name, backend=backend)
+    # CHANGE_LOG_DIR / PRICE_HISTORY_DIR set -> the changes that were written are recorded
+    if old_by_sku is not None:
+        CHANGES.record(table_name, rows, old_by_sku)
+    HISTORY.record(table_name, rows)
+    return len(rows)
+
+
+def upsert_frame(
+    table_name: str,
+    df: pd.DataFrame,
+    conflict_col: str | None = "sku",
+    batch_size: int = 1000,
+):
+    """
+    Bulk upsert a DataFrame through PostgREST.
+    - sanitize once per column (sanitize_frame), serialize each batch with frame_to_json
+      and POST it as the request body
+    - if a batch fails → fall back to upsert_rows for that batch (row by row)
+    """
+    if df.empty:
+        print("[upsert_frame] No rows to upsert.")
+        return
+
+    if conflict_col:
+        # one statement cannot update the same row twice
+        df = df.drop_duplicates(subset=[conflict_col], keep="last")
+    df = sanitize_frame(df)
+
+    base_url = os.environ["SUPABASE_URL"].rstrip("/")
+    key = os.environ["SUPABASE_SERVICE_KEY"]
+    headers = {
+        "apikey": key,
+        "Authorization": f"Bearer {key}",
+        "Content-Type": "application/json",
+        "Prefer": "resolution=merge-duplicates,return=minimal",
+    }
+    params = {"on_conflict": conflict_col} if conflict_col else None
+
+    total = len(df)
+    with requests.Session() as session:
+        for start in range(0, total, batch_size):
+            batch = df.iloc[start:start + batch_size]
+            try:
+                resp = session.post(
+                    f"{base_url}/rest/v1/{table_name}",
+                    params=params,
+                    headers=headers,
+                    data=frame_to_json(batch),
+                    timeout=60,
+                )
+                resp.raise_for_status()
+                print(f"[upsert_frame] OK {start + len(batch)}/{total} -> {table_name}")
+            except Exception as e:
+                print(f"[upsert_frame] ❌ batch {start}-{start + len(batch)} failed ({e}), retrying row by row")
+                TELEMETRY.count("retries", kind="upsert_frame", table=table_name)
+                upsert_rows(table_name, batch.to_dict(orient="records"), conflict_col=conflict_col)
+
+    print("[upsert_frame] Done.")
+
+
+def write_frame(table_name: str, df: pd.DataFrame, conflict_col: str = "sku"):
+    """
+    DataFrame version of write_rows:
+    - DATABASE_URL set → COPY the frame as CSV into the staging table + one merge (pg_loader.py)
+    - otherwise → upsert_frame
+    """
+    if os.environ.get("DATABASE_URL"):
+        from pg_loader import shared_loader
+        shared_loader().load_frame(table_name, df, conflict_col=conflict_col)
+        backend = "copy"
+    else:
+        upsert_frame(table_name, df, conflict_col=conflict_col)
+        backend = "postgrest"
+    TELEMETRY.count("rows_written", len(df), table=table_name, backend=backend)
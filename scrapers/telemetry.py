@@ -0,0 +1,431 @@
+"""
+Per-run performance telemetry for the scrapers.
+
+One process-wide collector (TELEMETRY) records:
+    stages    wall / CPU seconds and tracemalloc peak per (chain, stage)
+    requests  count, bytes, errors and latency p50/p95/p99 per endpoint
+    counters  retries, errors, rows diffed, rows written, ... with labels
+
+HTTP calls made with `requests` (all chain cores, upsert_frame) are recorded by
+install_requests_hook(); Supabase client calls are timed in supabase_utils.
+
+At the end of a run:
+    TELEMETRY.report()          -> dict (written as JSON by write_outputs)
+    TELEMETRY.prometheus()      -> Prometheus text exposition format
+
+Env vars (read by start_run / write_outputs):
+    TELEMETRY_REPORT_PATH   write the JSON run report here
+    TELEMETRY_PROM_PATH     write the Prometheus text here (node_exporter textfile collector)
+    TELEMETRY_PROM_PORT     serve /metrics on this port while the run is going
+    TELEMETRY_TRACEMALLOC   "0" disables tracemalloc (it slows allocation down)
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import re
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+_ID_SEGMENT = re.compile(r"\d")
+
+
+def endpoint_name(method: str, url: str) -> str:
+    """
+    "GET https://api.ah.nl/mobile-services/product/search/v2?taxonomyId=1"
+        -> "GET api.ah.nl/mobile-services/product/search/v2"
+    Path segments with digits become ":id" and the rest of the path is dropped,
+    so product pages do not create one endpoint per product.
+    """
+    parts = urlsplit(url)
+    segments = []
+    for seg in parts.path.split("/"):
+        if not seg:
+            continue
+        if _ID_SEGMENT.search(seg) and not re.fullmatch(r"v\d+", seg):
+            segments.append(":id")
+            break
+        segments.append(seg)
+    return f"{method.upper()} {parts.netloc}/{'/'.join(segments)}"
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+# ---------------------------------------------------------------------------
+# Metric containers
+# ---------------------------------------------------------------------------
+class StageMetrics:
+    __slots__ = ("calls", "errors", "wall_s", "cpu_s", "mem_peak_bytes")
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.mem_peak_bytes = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "wall_s": round(self.wall_s, 3),
+            "cpu_s": round(self.cpu_s, 3),
+            "mem_peak_bytes": self.mem_peak_bytes,
+        }
+
+
+class EndpointMetrics:
+    __slots__ = ("count", "errors", "bytes", "latencies", "status")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes = 0
+        self.latencies: List[float] = []
+        self.status: Dict[str, int] = defaultdict(int)
+
+    def as_dict(self) -> Dict[str, Any]:
+        lat = sorted(self.latencies)
+        out = {
+            "count": self.count,
+            "errors": self.errors,
+            "bytes": self.bytes,
+            "latency_sum_s": round(sum(lat), 3),
+            "status": dict(self.status),
+        }
+        for q in QUANTILES:
+            out[f"p{int(q * 100)}_ms"] = round(percentile(lat, q) * 1000, 1)
+        return out
+
+
+# ---------------------------------------------------------------------------
+# Collector
+# ---------------------------------------------------------------------------
+class Telemetry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active_stages = 0
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = datetime.now(timezone.utc)
+            self._t0 = time.perf_counter()
+            self.stages: Dict[Tuple[str, str], StageMetrics] = defaultdict(StageMetrics)
+            self.endpoints: Dict[str, EndpointMetrics] = defaultdict(EndpointMetrics)
+            self.counters: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = defaultdict(float)
+
+    # ----- stages -----
+    def _mem_enter(self) -> int | None:
+        if not tracemalloc.is_tracing():
+            return None
+        with self._lock:
+            # The peak is process-wide: only reset it when no other stage is running,
+            # so overlapping stages report the peak of the whole overlap.
+            if self._active_stages == 0:
+                tracemalloc.reset_peak()
+            self._active_stages += 1
+        return tracemalloc.get_traced_memory()[0]
+
+    def _mem_exit(self, start: int | None) -> int | None:
+        if start is None:
+            return None
+        peak = tracemalloc.get_traced_memory()[1]
+        with self._lock:
+            self._active_stages = max(0, self._active_stages - 1)
+        return max(0, peak - start)
+
+    def add_stage(
+        self,
+        chain: str,
+        stage: str,
+        wall: float,
+        cpu: float,
+        mem_peak: int | None = None,
+        error: bool = False,
+    ):
+        with self._lock:
+            m = self.stages[(chain, stage)]
+            m.calls += 1
+            m.errors += int(error)
+            m.wall_s += wall
+            m.cpu_s += cpu
+            if mem_peak is not None and mem_peak > m.mem_peak_bytes:
+                m.mem_peak_bytes = mem_peak
+
+    @contextmanager
+    def stage(self, chain: str, stage: str):
+        """with TELEMETRY.stage("ah", "fetch"): ...  (CPU time is the calling thread's)"""
+        mem0 = self._mem_enter()
+        wall0 = time.perf_counter()
+        cpu0 = time.thread_time()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.add_stage(
+                chain,
+                stage,
+                time.perf_counter() - wall0,
+                time.thread_time() - cpu0,
+                self._mem_exit(mem0),
+                error=error,
+            )
+
+    def measure(self, fn: Callable[[Any], Any], arg: Any):
+        """Run fn(arg) -> (result, wall_s, cpu_s, mem_peak_bytes or None), measured where it runs."""
+        mem0 = self._mem_enter()
+        wall0 = time.perf_counter()
+        cpu0 = time.thread_time()
+        try:
+            result = fn(arg)
+        finally:
+            mem = self._mem_exit(mem0)
+        return result, time.perf_counter() - wall0, time.thread_time() - cpu0, mem
+
+    # ----- requests -----
+    def record_request(
+        self,
+        endpoint: str,
+        seconds: float,
+        nbytes: int = 0,
+        status: int | str | None = None,
+        error: bool = False,
+    ):
+        with self._lock:
+            m = self.endpoints[endpoint]
+            m.count += 1
+            m.errors += int(error)
+            m.bytes += nbytes
+            m.latencies.append(seconds)
+            if status is not None:
+                m.status[str(status)] += 1
+
+    @contextmanager
+    def timed_call(self, endpoint: str):
+        """Time a non-`requests` call (e.g. the Supabase client) as an endpoint."""
+        t0 = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.record_request(endpoint, time.perf_counter() - t0, error=error)
+
+    # ----- counters -----
+    def count(self, name: str, n: float = 1, **labels: Any):
+        """TELEMETRY.count("rows_written", 500, table="ah")"""
+        key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+        with self._lock:
+            self.counters[key] += n
+
+    # ----- output -----
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            stages: Dict[str, Dict[str, Any]] = defaultdict(dict)
+            for (chain, stage), m in sorted(self.stages.items()):
+                stages[chain][stage] = m.as_dict()
+
+            counters: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+            for (name, labels), value in sorted(self.counters.items()):
+                counters[name].append({"labels": dict(labels), "value": value})
+
+            return {
+                "started_at": self.started_at.isoformat(),
+                "wall_s": round(time.perf_counter() - self._t0, 3),
+                "tracemalloc": tracemalloc.is_tracing(),
+                "stages": dict(stages),
+                "requests": {ep: m.as_dict() for ep, m in sorted(self.endpoints.items())},
+                "counters": dict(counters),
+            }
+
+    def prometheus(self, prefix: str = "scraper") -> str:
+        def labels(**kv) -> str:
+            inner = ",".join(f'{k}="{_escape(v)}"' for k, v in kv.items())
+            return "{" + inner + "}" if inner else ""
+
+        lines: List[str] = []
+
+        def family(name: str, kind: str, help_text: str):
+            lines.append(f"# HELP {prefix}_{name} {help_text}")
+            lines.append(f"# TYPE {prefix}_{name} {kind}")
+
+        with self._lock:
+            stage_items = sorted(self.stages.items())
+            endpoint_items = sorted(self.endpoints.items())
+            counter_items = sorted(self.counters.items())
+
+        family("stage_wall_seconds", "gauge", "Wall time spent in a stage.")
+        for (chain, stage), m in stage_items:
+            lines.append(f"{prefix}_stage_wall_seconds{labels(chain=chain, stage=stage)} {m.wall_s:.6f}")
+        family("stage_cpu_seconds", "gauge", "CPU time spent in a stage.")
+        for (chain, stage), m in stage_items:
+            lines.append(f"{prefix}_stage_cpu_seconds{labels(chain=chain, stage=stage)} {m.cpu_s:.6f}")
+        family("stage_calls", "gauge", "Stage invocations.")
+        for (chain, stage), m in stage_items:
+            lines.append(f"{prefix}_stage_calls{labels(chain=chain, stage=stage)} {m.calls}")
+        family("stage_errors", "gauge", "Stage invocations that raised.")
+        for (chain, stage), m in stage_items:
+            lines.append(f"{prefix}_stage_errors{labels(chain=chain, stage=stage)} {m.errors}")
+        family("stage_mem_peak_bytes", "gauge", "tracemalloc peak above the start of the stage.")
+        for (chain, stage), m in stage_items:
+            lines.append(f"{prefix}_stage_mem_peak_bytes{labels(chain=chain, stage=stage)} {m.mem_peak_bytes}")
+
+        family("request_duration_seconds", "summary", "HTTP request latency per endpoint.")
+        for ep, m in endpoint_items:
+            lat = sorted(m.latencies)
+            for q in QUANTILES:
+                lines.append(
+                    f"{prefix}_request_duration_seconds{labels(endpoint=ep, quantile=q)} {percentile(lat, q):.6f}"
+                )
+            lines.append(f"{prefix}_request_duration_seconds_sum{labels(endpoint=ep)} {sum(lat):.6f}")
+            lines.append(f"{prefix}_request_duration_seconds_count{labels(endpoint=ep)} {m.count}")
+        family("request_bytes", "gauge", "Response bytes per endpoint.")
+        for ep, m in endpoint_items:
+            lines.append(f"{prefix}_request_bytes{labels(endpoint=ep)} {m.bytes}")
+        family("request_errors", "gauge", "Failed requests per endpoint (exception or HTTP >= 400).")
+        for ep, m in endpoint_items:
+            lines.append(f"{prefix}_request_errors{labels(endpoint=ep)} {m.errors}")
+
+        seen = set()
+        for (name, lbls), value in counter_items:
+            metric = re.sub(r"[^a-zA-Z0-9_]", "_", name)
+            if metric not in seen:
+                family(metric, "gauge", f"{name} during the run.")
+                seen.add(metric)
+            lines.append(f"{prefix}_{metric}{labels(**dict(lbls))} {value:g}")
+
+        return "\n".join(lines) + "\n"
+
+    def write_outputs(self, report_path: str | None = None, prom_path: str | None = None) -> Dict[str, Any]:
+        """Write the JSON report / Prometheus text (defaults from the env vars); return the report."""
+        report_path = report_path or os.environ.get("TELEMETRY_REPORT_PATH")
+        prom_path = prom_path or os.environ.get("TELEMETRY_PROM_PATH")
+        report = self.report()
+        if report_path:
+            with open(report_path, "w") as f:
+                json.dump(report, f, indent=2)
+            print(f"[telemetry] run report -> {report_path}")
+        if prom_path:
+            with open(prom_path, "w") as f:
+                f.write(self.prometheus())
+            print(f"[telemetry] prometheus metrics -> {prom_path}")
+        return report
+
+
+def _escape(v: Any) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+TELEMETRY = Telemetry()
+
+
+def _after_fork_in_child():
+    # A forked process-pool worker may inherit the lock in a held state.
+    TELEMETRY._lock = threading.Lock()
+    TELEMETRY._active_stages = 0
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+# ---------------------------------------------------------------------------
+# requests instrumentation
+# ---------------------------------------------------------------------------
+_hook_installed = False
+
+
+def install_requests_hook():
+    """
+    Wrap requests.Session.send, so every requests.get/post/Session call is recorded
+    (module-level requests.get goes through a Session too). Safe to call twice.
+    """
+    global _hook_installed
+    if _hook_installed:
+        return
+    import requests
+
+    original_send = requests.Session.send
+
+    def send(self, request, **kwargs):
+        endpoint = endpoint_name(request.method or "GET", request.url or "")
+        t0 = time.perf_counter()
+        try:
+            resp = original_send(self, request, **kwargs)
+        except Exception:
+            TELEMETRY.record_request(endpoint, time.perf_counter() - t0, error=True)
+            TELEMETRY.count("errors", kind="request", endpoint=endpoint)
+            raise
+
+        # stream=True responses are not read here, so fall back to Content-Length.
+        if kwargs.get("stream"):
+            nbytes = int(resp.headers.get("Content-Length") or 0)
+        else:
+            nbytes = len(resp.content or b"")
+        TELEMETRY.record_request(
+            endpoint,
+            time.perf_counter() - t0,
+            nbytes=nbytes,
+            status=resp.status_code,
+            error=resp.status_code >= 400,
+        )
+        return resp
+
+    requests.Session.send = send
+    _hook_installed = True
+
+
+# ---------------------------------------------------------------------------
+# Run lifecycle
+# ---------------------------------------------------------------------------
+def _serve_prometheus(port: int):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = TELEMETRY.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, name="telemetry-http", daemon=True).start()
+    print(f"[telemetry] serving prometheus metrics on :{port}/metrics")
+
+
+def start_run():
+    """Reset the collector, hook requests, start tracemalloc and the optional /metrics server."""
+    TELEMETRY.reset()
+    install_requests_hook()
+    if os.environ.get("TELEMETRY_TRACEMALLOC", "1") != "0" and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    port = os.environ.get("TELEMETRY_PROM_PORT")
+    if port:
+        _serve_prometheus(int(port))
@@ -0,0 +1,344 @@
+"""
+Pluggable work queue for sharded crawls (crawl_coordinator.py / crawl_worker.py).
+
+A task is one crawl work unit (an AH taxonomyId, a batch of Dirk webGroupIds, a Hoogvliet
+category page or Intershop SKU batch). Workers lease a task for `lease_s` seconds; if the
+worker dies and the lease expires, the task goes back to the queue and is retried, up to
+`max_attempts` times. Results are stored with the task until the coordinator reads them.
+
+Backends (picked by URL in get_queue):
+    sqlite:///path/to/crawl_queue.db   -> SQLiteWorkQueue (one host, or a shared filesystem)
+    redis://localhost:6379/0           -> RedisWorkQueue  (several hosts)
+"""
+from __future__ import annotations
+
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Iterator, List
+
+
+class Task:
+    __slots__ = ("id", "run_id", "kind", "payload", "attempts", "worker")
+
+    def __init__(self, id, run_id: str, kind: str, payload: Any, attempts: int, worker: str | None = None):
+        self.id = id
+        self.run_id = run_id
+        self.kind = kind
+        self.payload = payload
+        self.attempts = attempts
+        self.worker = worker    # who holds the lease; complete / fail only apply for them
+
+    def __repr__(self) -> str:
+        return f"Task(id={self.id!r}, kind={self.kind!r}, attempts={self.attempts})"
+
+
+def new_run_id() -> str:
+    return time.strftime("%Y%m%d-%H%M%S-") + uuid.uuid4().hex[:6]
+
+
+# ---------------------------------------------------------------------------
+# SQLite backend
+# ---------------------------------------------------------------------------
+class SQLiteWorkQueue:
+    """
+    Work queue in one SQLite file. Leasing runs in a BEGIN IMMEDIATE transaction,
+    so several worker processes can share the file safely.
+    """
+
+    def __init__(self, path: str, max_attempts: int = 3):
+        self.path = path
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+
+        with self._conn() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id      TEXT NOT NULL,
+                    kind        TEXT NOT NULL,
+                    payload     TEXT NOT NULL,
+                    status      TEXT NOT NULL DEFAULT 'pending',
+                    attempts    INTEGER NOT NULL DEFAULT 0,
+                    lease_until REAL,
+                    worker      TEXT,
+                    result      TEXT,
+                    error       TEXT
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS tasks_run ON tasks (run_id, kind)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._local.conn = conn
+        return conn
+
+    def publish(self, run_id: str, kind: str, payloads: List[Any]) -> int:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.executemany(
+            "INSERT INTO tasks (run_id, kind, payload) VALUES (?, ?, ?)",
+            [(run_id, kind, json.dumps(p)) for p in payloads],
+        )
+        conn.execute("COMMIT")
+        return len(payloads)
+
+    def lease(self, worker_id: str, lease_s: float = 300) -> Task | None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # expired leases -> back to pending (retry), or failed after max_attempts
+            conn.execute(
+                "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+                "error = COALESCE(error, 'lease expired') "
+                "WHERE status = 'leased' AND lease_until < ?",
+                (self.max_attempts, now),
+            )
+            row = conn.execute(
+                "SELECT id, run_id, kind, payload, attempts FROM tasks "
+                "WHERE status = 'pending' ORDER BY id LIMIT 1"
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            task_id, run_id, kind, payload, attempts = row
+            conn.execute(
+                "UPDATE tasks SET status = 'leased', attempts = attempts + 1, "
+                "lease_until = ?, worker = ? WHERE id = ?",
+                (now + lease_s, worker_id, task_id),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        return Task(task_id, run_id, kind, json.loads(payload), attempts + 1, worker_id)
+
+    def renew(self, task: Task, lease_s: float = 300):
+        self._conn().execute(
+            "UPDATE tasks SET lease_until = ? WHERE id = ? AND status = 'leased' AND worker = ?",
+            (time.time() + lease_s, task.id, task.worker),
+        )
+
+    def complete(self, task: Task, result: Any) -> bool:
+        """
+        Store the result. False if the lease was lost meanwhile (expired and requeued or
+        leased by another worker): the task is then left alone.
+        """
+        cur = self._conn().execute(
+            "UPDATE tasks SET status = 'done', result = ?, error = NULL, lease_until = NULL "
+            "WHERE id = ? AND status = 'leased' AND worker = ?",
+            (json.dumps(result), task.id, task.worker),
+        )
+        return cur.rowcount == 1
+
+    def fail(self, task: Task, error: str) -> bool:
+        """Give the task back for a retry, or mark it failed after max_attempts. False if the lease was lost."""
+        cur = self._conn().execute(
+            "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, "
+            "error = ?, lease_until = NULL WHERE id = ? AND status = 'leased' AND worker = ?",
+            (self.max_attempts, error, task.id, task.worker),
+        )
+        return cur.rowcount == 1
+
+    def progress(self, run_id: str, kind: str | None = None) -> Dict[str, int]:
+        sql = "SELECT status, COUNT(*) FROM tasks WHERE run_id = ?"
+        params: tuple = (run_id,)
+        if kind is not None:
+            sql += " AND kind = ?"
+            params += (kind,)
+        rows = self._conn().execute(sql + " GROUP BY status", params).fetchall()
+        counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        counts.update(dict(rows))
+        return counts
+
+    def results(self, run_id: str, kind: str | None = None) -> Iterator[Any]:
+        sql = "SELECT result FROM tasks WHERE run_id = ? AND status = 'done'"
+        params: tuple = (run_id,)
+        if kind is not None:
+            sql += " AND kind = ?"
+            params += (kind,)
+        for (result,) in self._conn().execute(sql + " ORDER BY id", params):
+            yield json.loads(result)
+
+    def purge(self, run_id: str):
+        self._conn().execute("DELETE FROM tasks WHERE run_id = ?", (run_id,))
+
+
+# ---------------------------------------------------------------------------
+# Redis backend
+# ---------------------------------------------------------------------------
+_LEASE_LUA = """
+-- KEYS[1] = pending list, KEYS[2] = lease zset, KEYS[3] = task key prefix
+-- ARGV[1] = now, ARGV[2] = lease deadline, ARGV[3] = max attempts, ARGV[4] = worker id
+local expired = redis.call('ZRANGEBYSCORE', KEYS[2], '-inf', ARGV[1])
+for _, id in ipairs(expired) do
+    redis.call('ZREM', KEYS[2], id)
+    local key = KEYS[3] .. id
+    if tonumber(redis.call('HGET', key, 'attempts')) >= tonumber(ARGV[3]) then
+        redis.call('HSET', key, 'status', 'failed', 'error', 'lease expired')
+    else
+        redis.call('HSET', key, 'status', 'pending')
+        redis.call('LPUSH', KEYS[1], id)
+    end
+end
+local id = redis.call('RPOP', KEYS[1])
+if not id then
+    return false
+end
+local key = KEYS[3] .. id
+redis.call('HINCRBY', key, 'attempts', 1)
+redis.call('HSET', key, 'status', 'leased', 'worker', ARGV[4])
+redis.call('ZADD', KEYS[2], ARGV[2], id)
+return id
+"""
+
+# complete / fail only while the caller still holds the lease, checked and applied atomically
+_COMPLETE_LUA = """
+-- KEYS[1] = lease zset, KEYS[2] = task key; ARGV[1] = task id, ARGV[2] = worker id, ARGV[3] = result
+if redis.call('HGET', KEYS[2], 'status') ~= 'leased' or redis.call('HGET', KEYS[2], 'worker') ~= ARGV[2] then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+redis.call('HSET', KEYS[2], 'status', 'done', 'result', ARGV[3], 'error', '')
+return 1
+"""
+
+_FAIL_LUA = """
+-- KEYS[1] = lease zset, KEYS[2] = task key, KEYS[3] = pending list
+-- ARGV[1] = task id, ARGV[2] = worker id, ARGV[3] = error, ARGV[4] = max attempts
+if redis.call('HGET', KEYS[2], 'status') ~= 'leased' or redis.call('HGET', KEYS[2], 'worker') ~= ARGV[2] then
+    return 0
+end
+redis.call('ZREM', KEYS[1], ARGV[1])
+if tonumber(redis.call('HGET', KEYS[2], 'attempts')) >= tonumber(ARGV[4]) then
+    redis.call('HSET', KEYS[2], 'status', 'failed', 'error', ARGV[3])
+else
+    redis.call('HSET', KEYS[2], 'status', 'pending', 'error', ARGV[3])
+    redis.call('LPUSH', KEYS[3], ARGV[1])
+end
+return 1
+"""
+
+
+class RedisWorkQueue:
+    """
+    Work queue in Redis (a local redis-server is enough as a stand-in for a shared one).
+
+    Keys (prefix "wq"):
+        wq:pending         list of task ids waiting to be leased
+        wq:leases          zset task id -> lease deadline
+        wq:task:<id>       hash run_id / kind / payload / status / attempts / result / error
+        wq:run:<run_id>    set of the task ids of a run
+    Leasing (incl. requeueing expired leases) is one Lua script, so it is atomic.
+    """
+
+    def __init__(self, url: str, max_attempts: int = 3, prefix: str = "wq"):
+        import redis
+
+        self.r = redis.Redis.from_url(url, decode_responses=True)
+        self.max_attempts = max_attempts
+        self.prefix = prefix
+        self._lease_script = self.r.register_script(_LEASE_LUA)
+        self._complete_script = self.r.register_script(_COMPLETE_LUA)
+        self._fail_script = self.r.register_script(_FAIL_LUA)
+
+    def _key(self, *parts) -> str:
+        return ":".join((self.prefix,) + tuple(str(p) for p in parts))
+
+    def publish(self, run_id: str, kind: str, payloads: List[Any]) -> int:
+        pipe = self.r.pipeline()
+        for payload in payloads:
+            task_id = uuid.uuid4().hex
+            pipe.hset(
+                self._key("task", task_id),
+                mapping={
+                    "run_id": run_id,
+                    "kind": kind,
+                    "payload": json.dumps(payload),
+                    "status": "pending",
+                    "attempts": 0,
+                },
+            )
+            pipe.sadd(self._key("run", run_id), task_id)
+            pipe.lpush(self._key("pending"), task_id)
+        pipe.execute()
+        return len(payloads)
+
+    def lease(self, worker_id: str, lease_s: float = 300) -> Task | None:
+        now = time.time()
+        task_id = self._lease_script(
+            keys=[self._key("pending"), self._key("leases"), self._key("task", "")],
+            args=[now, now + lease_s, self.max_attempts, worker_id],
+        )
+        if not task_id:
+            return None
+
+        h = self.r.hgetall(self._key("task", task_id))
+        return Task(task_id, h["run_id"], h["kind"], json.loads(h["payload"]), int(h["attempts"]), worker_id)
+
+    def renew(self, task: Task, lease_s: float = 300):
+        self.r.zadd(self._key("leases"), {task.id: time.time() + lease_s}, xx=True)
+
+    def complete(self, task: Task, result: Any) -> bool:
+        """Store the result. False if the lease was lost meanwhile: the task is then left alone."""
+        return bool(self._complete_script(
+            keys=[self._key("leases"), self._key("task", task.id)],
+            args=[task.id, task.worker, json.dumps(result)],
+        ))
+
+    def fail(self, task: Task, error: str) -> bool:
+        """Give the task back for a retry, or mark it failed after max_attempts. False if the lease was lost."""
+        return bool(self._fail_script(
+            keys=[self._key("leases"), self._key("task", task.id), self._key("pending")],
+            args=[task.id, task.worker, error, self.max_attempts],
+        ))
+
+    def _task_ids(self, run_id: str) -> List[str]:
+        return sorted(self.r.smembers(self._key("run", run_id)))
+
+    def progress(self, run_id: str, kind: str | None = None) -> Dict[str, int]:
+        counts = {"pending": 0, "leased": 0, "done": 0, "failed": 0}
+        pipe = self.r.pipeline()
+        for task_id in self._task_ids(run_id):
+            pipe.hmget(self._key("task", task_id), "kind", "status")
+        for task_kind, status in pipe.execute():
+            if kind is None or task_kind == kind:
+                counts[status] = counts.get(status, 0) + 1
+        return counts
+
+    def results(self, run_id: str, kind: str | None = None) -> Iterator[Any]:
+        for task_id in self._task_ids(run_id):
+            h = self.r.hmget(self._key("task", task_id), "kind", "status", "result")
+            if h[1] != "done" or (kind is not None and h[0] != kind):
+                continue
+            yield json.loads(h[2])
+
+    def purge(self, run_id: str):
+        ids = self._task_ids(run_id)
+        pipe = self.r.pipeline()
+        for task_id in ids:
+            pipe.delete(self._key("task", task_id))
+            pipe.zrem(self._key("leases"), task_id)
+            pipe.lrem(self._key("pending"), 0, task_id)
+        pipe.delete(self._key("run", run_id))
+        pipe.execute()
+
+
+def get_queue(url: str, max_attempts: int = 3):
+    """sqlite:///path.db or redis://host:port/db -> work queue."""
+    if url.startswith("sqlite:///"):
+        return SQLiteWorkQueue(url[len("sqlite:///"):], max_attempts=max_attempts)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisWorkQueue(url, max_attempts=max_attempts)
+    raise ValueError(f"unsupported work queue url: {url}")
@@ -0,0 +1,122 @@
+"""
+The scrapers, the backfill and the HF space are run from their own directories
+(flat imports), so the tests put them on sys.path the same way.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for sub in ("scrapers", "backend", "hf-space"):
+    sys.path.insert(0, os.path.join(ROOT, sub))
+
+
+class FakeStore:
+    """object_store.ObjectStore in a dict."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def get(self, key):
+        return self.objects.get(key)
+
+    def put(self, key, data, content_type=None):
+        self.objects[key] = data
+
+    def create(self, key, data, content_type=None):
+        if key in self.objects:
+            return False
+        self.objects[key] = data
+        return True
+
+    def delete(self, keys):
+        for key in keys:
+            self.objects.pop(key, None)
+
+    def list(self, prefix):
+        return sorted(k for k in self.objects if k.startswith(prefix + "/"))
+
+    def upload(self, path, key):
+        with open(path, "rb") as f:
+            self.objects[key] = f.read()
+
+    def download(self, key, path):
+        if key not in self.objects:
+            return False
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(self.objects[key])
+        return True
+
+
+@pytest.fixture
+def store():
+    return FakeStore()
+
+
+class FakeQuery:
+    """The PostgREST query builder calls the code uses, over a list of row dicts."""
+
+    def __init__(self, rows, max_rows):
+        self.rows, self.max_rows = rows, max_rows
+        self.filters, self.order_col, self.n = [], None, None
+        self.negate = False
+
+    @property
+    def not_(self):
+        self.negate = True
+        return self
+
+    def _filter(self, test):
+        negate, self.negate = self.negate, False
+        self.filters.append((lambda r: not test(r)) if negate else test)
+        return self
+
+    def select(self, columns):
+        self.columns = [c.strip() for c in columns.split(",")]
+        return self
+
+    def eq(self, col, v):
+        return self._filter(lambda r: r.get(col) == v)
+
+    def gt(self, col, v):
+        return self._filter(lambda r: r.get(col) is not None and r[col] > v)
+
+    def in_(self, col, values):
+        return self._filter(lambda r: r.get(col) in set(values))
+
+    def is_(self, col, v):
+        assert v == "null"
+        return self._filter(lambda r: r.get(col) is None)
+
+    def order(self, col):
+        self.order_col = col
+        return self
+
+    def limit(self, n):
+        self.n = n
+        return self
+
+    def execute(self):
+        rows = [r for r in self.rows if all(f(r) for f in self.filters)]
+        if self.order_col:
+            rows.sort(key=lambda r: r[self.order_col])
+        # max-rows: the server cuts the response off without an error
+        rows = rows[:min(n for n in (self.n, self.max_rows) if n is not None)]
+        return type("Response", (), {"data": [{c: r.get(c) for c in self.columns} for r in rows]})
+
+
+class FakeSupabase:
+    """Tables of row dicts; every response capped at max_rows like PostgREST."""
+
+    def __init__(self, tables, max_rows=1000):
+        self.tables, self.max_rows = tables, max_rows
+
+    def table(self, name):
+        return FakeQuery(self.tables.setdefault(name, []), self.max_rows)
+
+
+@pytest.fixture
+def fake_supabase():
+    return FakeSupabase
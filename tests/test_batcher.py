@@ -0,0 +1,57 @@
+import asyncio
+
+import numpy as np
+
+from batcher import MicroBatcher
+
+
+class Model:
+    """encode_fn that embeds a text as [its number] and remembers every batch."""
+
+    def __init__(self, fail_on=None):
+        self.batches = []
+        self.fail_on = fail_on
+
+    def __call__(self, texts):
+        self.batches.append(list(texts))
+        if self.fail_on in texts:
+            raise RuntimeError("model failed")
+        return np.array([[float(t)] for t in texts], dtype="float32")
+
+
+def run(batcher, requests):
+    async def main():
+        batcher.start()
+        try:
+            return await asyncio.gather(*(batcher.embed(texts) for texts in requests), return_exceptions=True)
+        finally:
+            await batcher.stop()
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_share_a_batch_and_get_their_own_rows():
+    model = Model()
+    results = run(MicroBatcher(model, max_batch=8, max_wait_ms=50), [["1"], ["2", "3"], ["4"]])
+    assert model.batches == [["1", "2", "3", "4"]]
+    assert [r[:, 0].tolist() for r in results] == [[1.0], [2.0, 3.0], [4.0]]
+
+
+def test_a_request_that_does_not_fit_opens_the_next_batch():
+    model = Model()
+    batcher = MicroBatcher(model, max_batch=3, max_wait_ms=50)
+    results = run(batcher, [["1", "2"], ["3", "4"], ["5"]])
+    assert model.batches == [["1", "2"], ["3", "4", "5"]]
+    assert [r[:, 0].tolist() for r in results] == [[1.0, 2.0], [3.0, 4.0], [5.0]]
+    assert batcher.stats()["texts"] == 5
+
+
+def test_a_failed_batch_fails_its_requests_only():
+    model = Model(fail_on="2")
+    batcher = MicroBatcher(model, max_batch=2, max_wait_ms=50)
+    first, second = run(batcher, [["1", "2"], ["3"]])
+    assert isinstance(first, RuntimeError)
+    assert second[:, 0].tolist() == [3.0]
+
+
+def test_empty_request():
+    assert run(MicroBatcher(Model()), [[]])[0].shape == (0, 0)
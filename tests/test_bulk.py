@@ -0,0 +1,42 @@
+import asyncio
+import struct
+
+import pytest
+
+from bulk import BulkFormatError, read_length_prefixed, read_ndjson
+
+
+def read(reader, body, chunk=3):
+    async def chunks():
+        for i in range(0, len(body), chunk):
+            yield body[i:i + chunk]
+    return asyncio.run(reader(chunks()))
+
+
+def length_prefixed(*texts):
+    return b"".join(struct.pack(">I", len(t)) + t for t in texts)
+
+
+def test_length_prefixed_across_chunks():
+    body = length_prefixed("melk".encode(), "crème fraîche".encode(), b"")
+    assert read(read_length_prefixed, body) == ["melk", "crème fraîche", ""]
+
+
+def test_length_prefixed_bad_utf8_is_a_format_error():
+    with pytest.raises(BulkFormatError, match="text 2"):
+        read(read_length_prefixed, length_prefixed(b"melk", b"\xff\xfe"))
+
+
+def test_length_prefixed_trailing_bytes():
+    with pytest.raises(BulkFormatError, match="trailing"):
+        read(read_length_prefixed, length_prefixed(b"melk") + b"\x00\x00")
+
+
+def test_ndjson_strings_and_objects():
+    body = '"melk"\n{"text": "kaas"}\n\n"brood"'.encode()
+    assert read(read_ndjson, body) == ["melk", "kaas", "brood"]
+
+
+def test_ndjson_bad_utf8_is_a_format_error():
+    with pytest.raises(BulkFormatError, match="line 2"):
+        read(read_ndjson, b'"melk"\n"\xff"\n')
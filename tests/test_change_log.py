@@ -0,0 +1,45 @@
+import json
+
+from change_log import ChangeConsumer, ChangeLog
+
+OLD = {"1": {"sku": "1", "current_price": 2.49, "regular_price": 2.99, "availability": True}}
+
+
+def test_same_sku_twice_keeps_the_first_old_value_of_every_column(tmp_path):
+    log = ChangeLog(str(tmp_path))
+    log.record("ah", [{"sku": "1", "current_price": 1.99}], OLD)
+    log.record("ah", [{"sku": "1", "current_price": 1.79, "regular_price": 2.79}], OLD)
+    (event,) = log._pending.values()
+    assert event["op"] == "changed"
+    assert event["old"] == {"current_price": 2.49, "regular_price": 2.99}
+    assert event["new"] == {"current_price": 1.79, "regular_price": 2.79}
+
+
+def test_runs_on_different_runners_get_consecutive_versions(tmp_path, store):
+    for runner in ("a", "b"):
+        log = ChangeLog(str(tmp_path / runner), store=store)
+        log.record("ah", [{"sku": "1", "current_price": 1.99}], OLD)
+        log.flush()
+    assert sorted(store.objects) == ["change_log/v0000000001.jsonl", "change_log/v0000000002.jsonl"]
+
+
+def test_a_version_taken_meanwhile_is_not_overwritten(tmp_path, store, monkeypatch):
+    store.objects["change_log/v0000000001.jsonl"] = b"other run\n"
+    monkeypatch.setattr(store, "list", lambda prefix: [])      # listed before it was there
+    log = ChangeLog(str(tmp_path), store=store)
+    log.record("ah", [{"sku": "1", "current_price": 1.99}], OLD)
+    assert log.flush() == 2
+    assert store.objects["change_log/v0000000001.jsonl"] == b"other run\n"
+    assert json.loads(store.objects["change_log/v0000000002.jsonl"])["version"] == 2
+
+
+def test_consumer_reads_and_commits_through_the_bucket(tmp_path, store):
+    log = ChangeLog(str(tmp_path / "producer"), store=store)
+    log.record("ah", [{"sku": "1", "current_price": 1.99}], OLD)
+    log.flush()
+
+    consumer = ChangeConsumer("search-cache", str(tmp_path / "consumer"), store=store)
+    seen = []
+    assert consumer.process(seen.extend) == 1
+    assert [(e["version"], e["sku"]) for e in seen] == [(1, "1")]
+    assert ChangeConsumer("search-cache", str(tmp_path / "elsewhere"), store=store).pending() == []
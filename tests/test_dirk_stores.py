@@ -0,0 +1,62 @@
+import dirk_stores
+from dirk_stores import diff_store_prices, fetch_reference_prices, fetch_stored_deltas, map_store_price
+
+
+def _row(sku, regular, current, valid_from=None, valid_to=None):
+    return {"sku": sku, "regular_price": regular, "current_price": current,
+            "valid_from": valid_from, "valid_to": valid_to}
+
+
+def test_matching_reference_gives_no_rows():
+    prices = {"1": _row("1", 2.0, 2.0)}
+    assert diff_store_prices(12, prices, {"1": _row("1", 2.0, 2.0)}, {}) == ([], [])
+
+
+def test_new_and_changed_deltas_are_upserted():
+    reference = {"1": _row("1", 2.0, 2.0), "2": _row("2", 3.0, 3.0)}
+    stored = {"2": _row("2", 3.5, 3.5)}
+    prices = {"1": _row("1", 2.2, 2.2), "2": _row("2", 3.4, 3.4)}
+    upserts, deletes = diff_store_prices(12, prices, reference, stored)
+    assert upserts == [{"store_id": 12, **prices["1"]}, {"store_id": 12, **prices["2"]}]
+    assert deletes == []
+
+
+def test_unchanged_delta_is_not_rewritten():
+    stored = {"1": _row("1", 2.2, 2.2)}
+    prices = {"1": _row("1", 2.2, 2.2)}
+    assert diff_store_prices(12, prices, {"1": _row("1", 2.0, 2.0)}, stored) == ([], [])
+
+
+def test_delta_back_at_reference_is_deleted():
+    stored = {"1": _row("1", 2.2, 2.2)}
+    prices = {"1": _row("1", 2.0, 2.0)}
+    assert diff_store_prices(12, prices, {"1": _row("1", 2.0, 2.0)}, stored) == ([], ["1"])
+
+
+def test_dates_compare_by_day_and_prices_by_value():
+    reference = {"1": _row("1", 2, 1.5, "2025-11-04", "2025-11-10")}
+    prices = {"1": _row("1", 2.0, 1.50, "2025-11-04T00:00:00", "2025-11-10T00:00:00")}
+    assert diff_store_prices(12, prices, reference, {}) == ([], [])
+
+
+def test_sku_missing_from_reference_is_a_delta():
+    prices = {"9": _row("9", 1.0, 1.0)}
+    upserts, _ = diff_store_prices(12, prices, {}, {})
+    assert [u["sku"] for u in upserts] == ["9"]
+
+
+def test_map_store_price_zero_offer_means_no_offer():
+    raw = {"productId": 5, "normalPrice": 1.99, "offerPrice": 0,
+           "productOffer": {"startDate": "2025-11-04T00:00:00", "endDate": None}}
+    assert map_store_price(raw) == _row("5", 1.99, 1.99, "2025-11-04T00:00:00", None)
+
+
+def test_reads_page_past_the_max_rows_cap(monkeypatch, fake_supabase):
+    reference = [_row(str(sku), 1.0, 1.0) for sku in range(25)]
+    deltas = [{"store_id": sid, **_row(str(sku), 2.0, 2.0)} for sid in (12, 140) for sku in range(20)]
+    client = fake_supabase({"dirk": reference, dirk_stores.TABLE: deltas}, max_rows=7)
+    monkeypatch.setattr(dirk_stores, "get_supabase", lambda: client)
+
+    assert len(fetch_reference_prices()) == 25
+    stored = fetch_stored_deltas([12, 140, 66])
+    assert {sid: len(rows) for sid, rows in stored.items()} == {12: 20, 140: 20, 66: 0}
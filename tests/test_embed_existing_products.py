@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+import embed_existing_products as backfill
+import pipeline
+import supabase_utils
+
+
+@pytest.fixture
+def db(monkeypatch, fake_supabase):
+    """Fake Supabase capped at 7 rows per response; returns (client, written rows)."""
+    written = []
+
+    def connect(rows):
+        client = fake_supabase({"ah": rows}, max_rows=7)
+        for module in (backfill, pipeline, supabase_utils):
+            monkeypatch.setattr(module, "get_supabase", lambda: client)
+        monkeypatch.setattr(supabase_utils, "_columns", {})
+        monkeypatch.setattr(pipeline, "write_rows", lambda table, batch, **kw: written.extend(batch) or len(batch))
+        return client, written
+    return connect
+
+
+def products(n, **extra):
+    return [{"sku": f"{i:04d}", "brand": "AH", "product_name_du": f"product {i}", **extra} for i in range(n)]
+
+
+def test_missing_pages_read_past_the_max_rows_cap(db):
+    embedded = {"sku": "9999", "brand": "AH", "product_name_du": "melk", "embedding_du": "[1.0]"}
+    db(products(30, embedding_du=None) + [embedded])
+    pages = list(backfill.iter_missing_pages("ah", page_size=50))
+    assert sum(len(p) for p in pages) == 30
+    assert [r["sku"] for p in pages for r in p] == [f"{i:04d}" for i in range(30)]
+
+
+def test_pack_existing_reads_past_the_max_rows_cap(db):
+    _, written = db(products(20, embedding_du=json.dumps([1.0, 0.0]), embedding_packed=None))
+    assert backfill.pack_existing("ah", "f16", page_size=50) == 20
+    assert {r["sku"] for r in written} == {f"{i:04d}" for i in range(20)}
+
+
+def test_encode_batches_larger_than_a_page_are_collected_from_several(db, monkeypatch):
+    db(products(30, embedding_du=None))
+    monkeypatch.setattr(backfill, "MAX_PAGE_SIZE", 4)
+    page_sizes, batches = [], []
+    read_pages = backfill.iter_missing_pages
+
+    def spy(table, page_size, stale=False):
+        page_sizes.append(page_size)
+        return read_pages(table, page_size, stale=stale)
+
+    def encode(texts):
+        batches.append(len(texts))
+        return [[1.0, 0.0] for _ in texts]
+
+    monkeypatch.setattr(backfill, "iter_missing_pages", spy)
+    monkeypatch.setattr(backfill, "encode_texts", encode)
+    stats = backfill.process_table("ah", batch_size=12)
+    assert page_sizes == [4]
+    assert batches == [12, 12, 6]
+    assert stats["written"] == 30
+
+
+def test_remote_sized_batches_span_capped_pages(db):
+    client, written = db(products(2500, embedding_du=None))
+    client.max_rows = 1000
+
+    class Remote:
+        batches = []
+
+        def encode(self, texts):
+            self.batches.append(len(texts))
+            return [[1.0, 0.0] for _ in texts]
+
+    remote = Remote()
+    backfill.process_table("ah", batch_size=2048, pool=remote)
+    assert remote.batches == [2048, 452]
+    assert len(written) == 2500
+
+
+def test_stale_reembeds_only_rows_whose_text_changed(db, monkeypatch):
+    rows = products(4, embedding_du="[1.0]")
+    rows[0]["embedding_text_hash"] = backfill.text_hash("AH product 0")      # up to date
+    rows[1]["embedding_text_hash"] = backfill.text_hash("AH old name")       # renamed
+    rows[2]["embedding_text_hash"] = None                                    # never hashed
+    rows[3]["product_name_du"] = None                                        # no name, not read
+    _, written = db(rows)
+    encoded = []
+    monkeypatch.setattr(backfill, "encode_texts", lambda texts: encoded.extend(texts) or [[1.0]] * len(texts))
+
+    stats = backfill.process_table("ah", stale=True)
+    assert encoded == ["AH product 1", "AH product 2"]
+    assert (stats["fetched"], stats["up_to_date"], stats["encoded"]) == (3, 1, 2)
+    assert [(r["sku"], r["embedding_text_hash"]) for r in written] == [
+        ("0001", backfill.text_hash("AH product 1")),
+        ("0002", backfill.text_hash("AH product 2")),
+    ]
+
+
+def test_only_rows_without_an_embedding_are_encoded(db, monkeypatch):
+    rows = products(3, embedding_du=None)
+    rows[1]["embedding_du"] = "[1.0]"
+    rows[2]["brand"] = None
+    _, written = db(rows)
+    monkeypatch.setattr(backfill, "encode_texts", lambda texts: [[1.0]] * len(texts))
+    backfill.process_table("ah")
+    assert [r["sku"] for r in written] == ["0000", "0002"]
@@ -0,0 +1,74 @@
+import pytest
+
+import supabase_utils
+from embedder import Embedder
+
+
+class FakeTable:
+    def __init__(self, columns, calls, column=None):
+        self.columns, self.calls, self.column = columns, calls, column
+
+    def select(self, column):
+        return FakeTable(self.columns, self.calls, column)
+
+    def limit(self, n):
+        return self
+
+    def execute(self):
+        self.calls.append(self.column)
+        if self.column not in self.columns:
+            raise Exception({"code": "42703", "message": f"column ah.{self.column} does not exist"})
+
+
+class FakeSupabase:
+    def __init__(self, columns):
+        self.columns, self.calls = columns, []
+
+    def table(self, name):
+        return FakeTable(self.columns, self.calls)
+
+
+class FixedEmbedder(Embedder):
+    def _encode(self, texts):
+        return [[1.0, 0.0]] * len(texts)
+
+
+@pytest.fixture
+def db(monkeypatch):
+    def connect(columns):
+        fake = FakeSupabase(columns)
+        monkeypatch.setattr(supabase_utils, "_columns", {})
+        monkeypatch.setattr(supabase_utils, "get_supabase", lambda: fake)
+        return fake
+    return connect
+
+
+def rows():
+    return [{"sku": "1", "product_name_du": "Halfvolle melk"}, {"sku": "2", "product_name_du": "Kaas"}]
+
+
+def test_missing_columns_are_left_out_and_checked_once(db):
+    fake = db({"embedding_du"})
+    embedder = FixedEmbedder(packed="f16")
+    for _ in range(2):
+        batch = rows()
+        assert embedder.embed_rows("ah", batch) == 2
+        assert set(batch[0]) == {"sku", "product_name_du", "embedding_du"}
+    assert sorted(fake.calls) == ["embedding_packed", "embedding_text_hash"]
+
+
+def test_existing_columns_are_written(db):
+    db({"embedding_du", "embedding_text_hash", "embedding_packed"})
+    batch = rows()
+    FixedEmbedder(packed="f16").embed_rows("ah", batch)
+    assert batch[0]["embedding_packed"].startswith("f16:")
+    assert len(batch[0]["embedding_text_hash"]) == 64
+
+
+def test_other_errors_are_not_taken_for_a_missing_column(db, monkeypatch):
+    def down():
+        raise ConnectionError("connection refused")
+    db(set())
+    monkeypatch.setattr(supabase_utils, "get_supabase", down)
+    with pytest.raises(ConnectionError):
+        supabase_utils.has_column("ah", "embedding_packed")
@@ -0,0 +1,77 @@
+import pytest
+
+from embedding_cache import EmbeddingCache, embed_text, text_hash
+
+MODEL = "test-model"
+
+
+class Model:
+    """encode_fn that records what it was asked and embeds a text as [len(text), 1]."""
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    c = EmbeddingCache(str(tmp_path / "cache.sqlite"))
+    yield c
+    c.close()
+
+
+def test_encode_dedups_and_keeps_input_order(cache):
+    model = Model()
+    out = cache.encode(MODEL, ["melk", " melk ", "kaas ham", "melk"], model)
+    assert model.calls == [["melk", "kaas ham"]]
+    assert out == [[4.0, 1.0], [4.0, 1.0], [8.0, 1.0], [4.0, 1.0]]
+    assert cache.stats() == {"hits": 2, "misses": 2, "hit_rate": 0.5}
+
+
+def test_only_misses_reach_the_model(cache):
+    model = Model()
+    cache.encode(MODEL, ["melk"], model)
+    out = cache.encode(MODEL, ["kaas", "melk"], model)
+    assert model.calls == [["melk"], ["kaas"]]
+    assert out == [[4.0, 1.0], [4.0, 1.0]]
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_keys_are_per_model_and_normalized(cache):
+    model = Model()
+    cache.encode(MODEL, ["ﬁlet  americain"], model)       # NFKC folds the ligature
+    cache.encode(MODEL, ["filet americain"], model)
+    cache.encode("other-model", ["filet americain"], model)
+    assert model.calls == [["filet americain"], ["filet americain"]]
+
+
+def test_the_cache_survives_a_reopen(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    first = EmbeddingCache(path)
+    first.encode(MODEL, ["melk", "kaas"], Model())
+    first.close()
+
+    model = Model()
+    again = EmbeddingCache(path)
+    assert len(again) == 2
+    assert again.encode(MODEL, ["kaas"], model) == [[4.0, 1.0]]
+    assert model.calls == []
+    again.close()
+
+
+def test_empty_input(cache):
+    assert cache.encode(MODEL, [], Model()) == []
+
+
+def test_text_hash_follows_the_normalized_text():
+    assert text_hash("AH  melk ") == text_hash("AH melk")
+    assert text_hash("AH melk") != text_hash("AH Melk")
+
+
+def test_embed_text():
+    assert embed_text({"brand": " AH ", "product_name_du": "Melk"}) == "AH Melk"
+    assert embed_text({"brand": None, "product_name_du": "Melk"}) == "Melk"
+    assert embed_text({"brand": "AH", "product_name_du": "  "}) is None
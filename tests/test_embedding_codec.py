@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from embedding_codec import FORMATS, pack, unpack
+
+
+def unit_vector(seed, dim=384):
+    v = np.random.default_rng(seed).standard_normal(dim).astype("float32")
+    return v / np.linalg.norm(v)
+
+
+@pytest.mark.parametrize("fmt, tol", [("f16", 1e-3), ("i8", 1e-2)])
+def test_round_trip_stays_close(fmt, tol):
+    v = unit_vector(0)
+    packed = pack(v, fmt)
+    assert packed.startswith(fmt + ":")
+    out = unpack(packed)
+    assert out.dtype == np.float32
+    assert out.shape == v.shape
+    assert np.abs(out - v).max() < tol
+    assert float(out @ v) > 0.999
+
+
+def test_packed_sizes():
+    v = unit_vector(1)
+    assert len(pack(v, "f16")) == len("f16:") + 1024      # 768 bytes base64
+    assert len(pack(v, "i8")) == len("i8:") + 520         # 4 + 384 bytes base64
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_zero_vector(fmt):
+    assert not unpack(pack(np.zeros(8), fmt)).any()
+
+
+def test_i8_keeps_the_peak_exact():
+    v = np.array([0.5, -0.25, 0.125], dtype="float32")
+    assert unpack(pack(v, "i8"))[0] == pytest.approx(0.5)
+
+
+def test_list_input_and_bad_formats():
+    assert unpack(pack([1.0, 0.0], "f16")).tolist() == [1.0, 0.0]
+    with pytest.raises(ValueError):
+        pack([1.0], "f32")
+    with pytest.raises(ValueError):
+        unpack("f32:AAAA")
@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import orchestrator
+from orchestrator import Orchestrator
+
+
+class Adapter:
+    table = "ah"
+
+
+def test_written_counts_what_the_writes_returned(monkeypatch):
+    # write_rows skips one row of every batch; the second batch fails
+    results = iter([lambda batch: len(batch) - 1, None])
+
+    def write_rows(table, batch, **kwargs):
+        fn = next(results)
+        if fn is None:
+            raise ConnectionError("db down")
+        return fn(batch)
+
+    monkeypatch.setattr(orchestrator, "write_rows", write_rows)
+    orch = Orchestrator({"ah": Adapter()}, cpu_workers=0, write_batch_size=3)
+    run = orch.runs["ah"]
+    run.plan = {"old_by_sku": {}}
+    orch._io = ThreadPoolExecutor(max_workers=1)
+    try:
+        for i in range(6):
+            orch._buffer(run, {"sku": str(i)})
+        for fut, (run_, stage, host, arg, unit) in list(orch._futures.items()):
+            fut.exception()
+            orch._handle(run_, stage, fut, arg, unit)
+    finally:
+        orch._io.shutdown(wait=True)
+    assert run.counts["written"] == 2
+    assert run.counts["write_errors"] == 1
@@ -0,0 +1,40 @@
+"""
+Unit parsing per chain. The expected values are what each core returned before the
+chains shared chain_adapter.parse_unit; they are stored in the DB and must not move.
+"""
+import pytest
+
+import ah_core
+import dirk_core
+import hoogvliet_core
+
+CASES = [
+    # text                 AH               Dirk             Hoogvliet
+    ("ca. 115 g",          (0.115, "kg"),   (None, None),    (None, None)),
+    ("ca 2 kg",            (2.0, "kg"),     (None, None),    (None, None)),
+    ("los per 500 g",      (0.5, "kg"),     (None, None),    (None, None)),
+    ("2-3 pers | 20 min",  (1, "piece"),    (None, None),    (None, None)),
+    ("2 personen",         (1, "piece"),    (2.0, "piece"),  (2.0, "piece")),
+    ("4 + 2 stuks",        (6.0, "piece"),  (None, None),    (None, None)),
+    ("500 milliliter",     (500.0, "piece"), (500.0, "piece"), (0.5, "l")),
+    ("per stuk",           (1.0, "piece"),  (1.0, "piece"),  (1.0, "piece")),
+    ("6 x 250 g",          (1.5, "kg"),     (1.5, "kg"),     (1.5, "kg")),
+    ("2 x 1,5 l",          (3.0, "l"),      (3.0, "l"),      (3.0, "l")),
+    ("1 kg (ca. 5 stuk)",  (1.0, "kg"),     (1.0, "kg"),     (1.0, "kg")),
+    ("75 cl",              (0.75, "l"),     (0.75, "l"),     (0.75, "l")),
+    ("3 st.",              (3.0, "piece"),  (3.0, "piece"),  (3.0, "piece")),
+    ("mocca",              (1.0, "piece"),  (1.0, "piece"),  (1.0, "piece")),
+    (None,                 (None, None),    (None, None),    (None, None)),
+]
+
+
+@pytest.mark.parametrize("text, ah, dirk, hoogvliet", CASES)
+def test_parse_unit_per_chain(text, ah, dirk, hoogvliet):
+    assert ah_core.parse_unit(text) == ah
+    assert dirk_core.parse_unit(text) == dirk
+    assert hoogvliet_core.parse_unit(text) == hoogvliet
+
+
+def test_approx_prefix_through_the_adapter():
+    assert ah_core.parse_unit("ca. 250 gram") == (0.25, "kg")
+    assert ah_core.ADAPTER.parse_unit("ca 444 g") == (0.444, "kg")
@@ -0,0 +1,42 @@
+import threading
+
+import pytest
+
+import pipeline
+from pipeline import BatchUpserter
+
+
+def no_database():
+    raise KeyError("SUPABASE_URL")
+
+
+def test_a_writer_without_a_connection_raises_instead_of_blocking(monkeypatch):
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+    monkeypatch.setattr(pipeline, "get_supabase", no_database)
+    upserter = BatchUpserter("ah", batch_size=1, max_pending=1)
+    outcome = []
+
+    def feed():
+        try:
+            for i in range(100):
+                upserter.put({"sku": str(i)})
+        except KeyError as e:
+            outcome.append(e)
+
+    t = threading.Thread(target=feed, daemon=True)
+    t.start()
+    t.join(5)
+    assert not t.is_alive(), "put() blocked on a writer that is gone"
+    assert outcome
+    with pytest.raises(KeyError):
+        upserter.close()
+
+
+def test_rows_written_counts_what_write_rows_returns(monkeypatch):
+    monkeypatch.delenv("DATABASE_URL", raising=False)
+    monkeypatch.setattr(pipeline, "get_supabase", lambda: object())
+    monkeypatch.setattr(pipeline, "write_rows", lambda table, batch, **kw: len(batch) - 1)
+    upserter = BatchUpserter("ah", batch_size=2)
+    for i in range(5):
+        upserter.put({"sku": str(i)})
+    assert upserter.close() == 2
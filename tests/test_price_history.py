@@ -0,0 +1,87 @@
+import pytest
+
+from price_history import (
+    DAY_S,
+    Partition,
+    PriceHistory,
+    decode_blocks,
+    encode_block,
+    month_of,
+    read_varint,
+    unzigzag,
+    window_min_max,
+    write_varint,
+    zigzag,
+)
+
+T = 1_760_000_000
+
+
+@pytest.mark.parametrize("n", [0, 1, 127, 128, 300, 2**31, 2**63])
+def test_varint_round_trip(n):
+    buf = bytearray()
+    write_varint(buf, n)
+    assert read_varint(bytes(buf) + b"\x01", 0) == (n, len(buf))
+
+
+@pytest.mark.parametrize("n", [0, 1, -1, 2, -2, 150, -150, 10**9, -(10**9)])
+def test_zigzag_round_trip(n):
+    assert zigzag(n) >= 0
+    assert unzigzag(zigzag(n)) == n
+
+
+def test_zigzag_keeps_small_deltas_small():
+    assert [zigzag(n) for n in (0, -1, 1, -2, 2)] == [0, 1, 2, 3, 4]
+
+
+def test_blocks_round_trip_with_the_partition_dictionary():
+    part = Partition()
+    data = encode_block(T, [("b", True, 199, 249), ("a", False, None, None)], part)
+    data += encode_block(T + 60, [("b", True, 149, 249), ("c", True, 50, None)], part)
+    assert part.skus == ["b", "a", "c"]
+
+    decoded = Partition()
+    assert list(decode_blocks(data, decoded)) == [
+        (T, "b", True, 199, 249),
+        (T, "a", False, None, None),
+        (T + 60, "b", True, 149, 249),
+        (T + 60, "c", True, 50, None),
+    ]
+    assert (decoded.skus, decoded.last, decoded.end) == (part.skus, part.last, len(data))
+
+
+def test_torn_block_is_skipped_and_leaves_the_partition_untouched():
+    part = Partition()
+    first = encode_block(T, [("a", True, 100, None)], part)
+    second = encode_block(T + 60, [("a", True, 80, None), ("new", True, 5, None)], part)
+
+    decoded = Partition()
+    assert list(decode_blocks(first + second[:-1], decoded)) == [(T, "a", True, 100, None)]
+    assert decoded.end == len(first)
+    assert decoded.skus == ["a"]
+    assert decoded.last == {0: [100, 0]}
+
+
+def test_append_cuts_a_torn_block_first(tmp_path):
+    history = PriceHistory(str(tmp_path), store=None)
+    history.record("ah", [{"sku": "1", "current_price": 1.0}])
+    history.flush(T)
+    path = history._partition("ah", month_of(T))
+    with open(path, "ab") as f:
+        f.write(b"\x85\x80")                     # a block cut off mid-varint
+
+    history.record("ah", [{"sku": "1", "current_price": 2.0}])
+    history.flush(T + 60)
+    assert list(history.iter_events("ah")) == [(T, "1", True, 100, None), (T + 60, "1", True, 200, None)]
+
+
+def test_window_min_max_counts_the_price_in_effect_at_the_start():
+    points = [[T, 300], [T + 10 * DAY_S, 200], [T + 20 * DAY_S, 250]]
+    now = T + 25 * DAY_S
+    assert window_min_max(points, now, 3) == (250, 250)      # no change inside, 250 all along
+    assert window_min_max(points, now, 7) == (200, 250)      # 200 was in effect at the start
+    assert window_min_max(points, now, 30) == (200, 300)
+
+
+def test_window_min_max_without_points():
+    assert window_min_max([], T, 7) == (None, None)
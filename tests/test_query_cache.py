@@ -0,0 +1,23 @@
+import numpy as np
+import pytest
+
+from query_cache import QueryCache
+
+
+def test_cache_keeps_its_own_copy_of_a_batch_row():
+    batch = np.ones((4, 2), dtype="float32")
+    cache = QueryCache(10)
+    cache.put_many({"melk": batch[1]})
+    batch[1] = 0
+    cached = cache.get_many(["melk"])["melk"]
+    assert cached.tolist() == [1.0, 1.0]
+    assert cached.base is None
+
+
+@pytest.mark.parametrize("maxsize, kept", [(2, ["a", "c"]), (0, [])])
+def test_cache_evicts_least_recently_used(maxsize, kept):
+    cache = QueryCache(maxsize)
+    cache.put_many({"a": np.zeros(1), "b": np.zeros(1)})
+    cache.get_many(["a"])
+    cache.put_many({"c": np.zeros(1)})
+    assert sorted(cache.get_many(["a", "b", "c"])) == kept
@@ -0,0 +1,85 @@
+import math
+
+import pytest
+
+from refresh_scheduler import DEFAULT_RATE, RefreshScheduler, parse_budgets
+
+HOUR = 3600.0
+
+
+def _scheduler(tmp_path, budgets, now=0.0, **kwargs):
+    return RefreshScheduler(str(tmp_path / "state.json"), budgets, now=now, **kwargs)
+
+
+def test_parse_budgets():
+    assert parse_budgets("300") == {"*": 300}
+    assert parse_budgets(" ah=400, dirk=60 ,") == {"ah": 400, "dirk": 60}
+    assert parse_budgets(None) == {}
+
+
+def test_observe_updates_rate_and_cost_as_ewma(tmp_path):
+    s = _scheduler(tmp_path, {"*": 10}, alpha=0.5)
+    s.observe("ah", 1, products=100, changed=50, cost=4)
+    seg = s.state["chains"]["ah"]["segments"]["1"]
+    # first crawl: no age to turn the changes into a rate yet
+    assert seg["rate"] == DEFAULT_RATE
+    assert seg["cost"] == 4
+    assert seg["last_crawled"] == 0.0
+
+    s.now = 10 * HOUR
+    s.observe("ah", 1, products=100, changed=10, cost=2)
+    observed = -math.log(0.9) / 10
+    assert seg["rate"] == pytest.approx(0.5 * observed + 0.5 * DEFAULT_RATE)
+    assert seg["cost"] == pytest.approx(3.0)
+    assert seg["products"] == 100
+    assert seg["crawls"] == 2
+
+
+def test_observe_caps_a_fully_changed_segment(tmp_path):
+    s = _scheduler(tmp_path, {"*": 10}, alpha=1.0)
+    s.observe("ah", 1, products=10, changed=0, cost=1)
+    s.now = HOUR
+    s.observe("ah", 1, products=10, changed=10, cost=1)
+    assert s.state["chains"]["ah"]["segments"]["1"]["rate"] == pytest.approx(-math.log(0.01))
+
+
+def test_select_everything_without_budget_or_when_sweep_due(tmp_path):
+    s = _scheduler(tmp_path, {"ah": 1})
+    assert s.select("dirk", [1, 2, 3]) == ([1, 2, 3], True)     # no budget for dirk
+    assert s.select("ah", [1, 2, 3]) == ([1, 2, 3], True)       # never swept
+
+
+def test_select_ranks_by_expected_changes_per_request(tmp_path):
+    s = _scheduler(tmp_path, {"ah": 2})
+    s.finish("ah", full_sweep=True)
+    s.observe("ah", "slow", products=100, changed=0, cost=1)
+    s.observe("ah", "fast", products=100, changed=0, cost=1)
+    s.observe("ah", "costly", products=100, changed=0, cost=5)
+    segs = s.state["chains"]["ah"]["segments"]
+    segs["slow"]["rate"], segs["fast"]["rate"], segs["costly"]["rate"] = 0.001, 0.1, 0.1
+
+    s.now = 24 * HOUR
+    units = [["t", "slow"], ["t", "costly"], ["t", "new"], ["t", "fast"]]
+    picked, full = s.select("ah", units, unit_key=lambda u: u[1])
+    # never crawled first, then the best score that fits the budget of 2 requests
+    assert picked == [["t", "new"], ["t", "fast"]]
+    assert full is False
+    assert s.selection["ah"] == {"units": 2, "of": 4, "requests_est": 2.0, "budget": 2}
+
+
+def test_select_picks_one_unit_over_budget(tmp_path):
+    s = _scheduler(tmp_path, {"*": 1})
+    s.finish("ah", full_sweep=True)
+    s.observe("ah", 1, products=10, changed=0, cost=8)
+    s.now = HOUR
+    assert s.select("ah", [1]) == ([1], True)
+
+
+def test_state_survives_save_and_load(tmp_path):
+    s = _scheduler(tmp_path, {"*": 5})
+    s.observe("ah", 7, products=3, changed=1, cost=2)
+    s.finish("ah", full_sweep=True)
+    s.save()
+    again = _scheduler(tmp_path, {"*": 5}, now=HOUR)
+    assert again.state == s.state
+    assert again.select("ah", [7]) == ([7], True)
@@ -0,0 +1,42 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from supabase_utils import sanitize_frame, sanitize_value
+
+
+def _records(df):
+    return [
+        {k: (None if isinstance(v, float) and np.isnan(v) else v) for k, v in r.items()}
+        for r in sanitize_frame(df).to_dict("records")
+    ]
+
+
+def test_datetime_columns_keep_offset_and_microseconds():
+    df = pd.DataFrame({
+        "naive": pd.to_datetime(["2024-01-02 03:04:05.123456", None]),
+        "aware": pd.to_datetime(["2024-01-02T03:04:05+02:00", None], utc=True).tz_convert("Europe/Amsterdam"),
+    })
+    assert _records(df) == [
+        {"naive": "2024-01-02T03:04:05.123456", "aware": "2024-01-02T02:04:05+01:00"},
+        {"naive": None, "aware": None},
+    ]
+
+
+def test_object_columns_match_sanitize_value():
+    tz = datetime.timezone(datetime.timedelta(hours=2))
+    df = pd.DataFrame({
+        "first_null": [None, datetime.datetime(2024, 1, 2, 3, 4, 5, tzinfo=tz)],
+        "mixed": ["x", datetime.date(2024, 1, 2)],
+        "text": ["a", "b"],
+    })
+    expected = [{k: sanitize_value(v) for k, v in r.items()} for r in df.astype(object).to_dict("records")]
+    expected[0]["first_null"] = None
+    assert _records(df) == expected
+    assert _records(df)[1]["first_null"] == "2024-01-02T03:04:05+02:00"
+
+
+def test_float_infinities_become_null():
+    df = pd.DataFrame({"f": [1.5, np.inf, -np.inf]})
+    assert [r["f"] for r in _records(df)] == [1.5, None, None]
@@ -0,0 +1,56 @@
+import importlib.util
+import os
+
+import numpy as np
+import pytest
+
+from embedding_codec import pack
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def search_logic():
+    # render/ is deployed on its own; its imports resolve to the scrapers/ modules of the same name
+    spec = importlib.util.spec_from_file_location("render_search_logic", os.path.join(ROOT, "render", "search_logic.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Rpc:
+    def __init__(self, rows):
+        self.data = rows
+
+    def execute(self):
+        return self
+
+
+class Client:
+    def __init__(self, rows):
+        self.rows, self.calls = rows, []
+
+    def rpc(self, name, params):
+        self.calls.append(name)
+        return Rpc(self.rows)
+
+
+def test_packed_rows_are_unpacked_and_the_rest_parsed(search_logic, monkeypatch):
+    rows = [
+        {"sku": "1", "unit_price": 2.0, "embedding_packed": pack([1.0, 0.0]), "embedding_du": None},
+        {"sku": "2", "unit_price": 1.0, "embedding_packed": None, "embedding_du": "[0.6, 0.8]"},
+        {"sku": "3", "unit_price": 0.5, "embedding_packed": None, "embedding_du": None},
+    ]
+    monkeypatch.setattr(search_logic, "get_supabase", lambda: Client(rows))
+    monkeypatch.setattr(search_logic, "get_embedding_from_hf", lambda text: np.array([1.0, 0.0], dtype="float32"))
+
+    result = search_logic.search_one_product("melk", "du", ["ah"])["results"]
+    assert [r["sku"] for r in result] == ["2", "1"]
+    assert {r["sku"]: round(r["similarity"], 3) for r in result} == {"1": 1.0, "2": 0.6}
+
+
+def test_render_codec_is_a_copy():
+    def body(path):
+        with open(os.path.join(ROOT, path)) as f:
+            return [line for line in f if "embedding_codec.py" not in line]
+    assert body("render/embedding_codec.py") == body("scrapers/embedding_codec.py")
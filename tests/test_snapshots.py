@@ -0,0 +1,55 @@
+import json
+from datetime import date
+
+from snapshots import Snapshots
+
+
+def crawl(snapshots, skus, complete, day="2026-10-19"):
+    snapshots.add("ah", [{"sku": s, "current_price": "1.99"} for s in skus], day=day)
+    return snapshots.finish("ah", complete=complete)
+
+
+def marker(snapshots, day="2026-10-19"):
+    with open(snapshots.path("ah", day) + "/_SUCCESS.json") as f:
+        return json.load(f)
+
+
+def test_incomplete_crawl_keeps_the_complete_snapshot(tmp_path):
+    snapshots = Snapshots(str(tmp_path))
+    crawl(snapshots, ["1", "2", "3"], complete=True)
+    crawl(snapshots, ["1"], complete=False)
+    assert marker(snapshots)["complete"] is True
+    assert snapshots.read("ah", "2026-10-19").num_rows == 3
+
+
+def test_later_crawls_replace_an_incomplete_snapshot(tmp_path):
+    snapshots = Snapshots(str(tmp_path))
+    crawl(snapshots, ["1"], complete=False)
+    crawl(snapshots, ["1", "2"], complete=False)
+    assert snapshots.read("ah", "2026-10-19").num_rows == 2
+    crawl(snapshots, ["1", "2", "3"], complete=True)
+    assert marker(snapshots)["rows"] == 3
+    assert marker(snapshots)["complete"] is True
+
+
+def test_the_bucket_marker_counts_on_an_empty_runner(tmp_path, store):
+    crawl(Snapshots(str(tmp_path / "a"), store=store), ["1", "2"], complete=True)
+    assert sorted(store.objects) == [
+        "snapshots/chain=ah/date=2026-10-19/_SUCCESS.json",
+        "snapshots/chain=ah/date=2026-10-19/part-0.parquet",
+    ]
+    uploaded = dict(store.objects)
+
+    other = Snapshots(str(tmp_path / "b"), store=store)
+    crawl(other, ["1"], complete=False)
+    assert store.objects == uploaded
+    assert other.dates("ah") == []
+
+
+def test_prune_removes_local_and_bucket_copies(tmp_path, store):
+    snapshots = Snapshots(str(tmp_path), store=store)
+    crawl(snapshots, ["1"], complete=True, day="2026-09-01")
+    crawl(snapshots, ["1"], complete=True, day="2026-10-19")
+    assert snapshots.prune(30, now=date(2026, 10, 19)) == 1
+    assert snapshots.dates("ah") == ["2026-10-19"]
+    assert {k.split("/")[2] for k in store.objects} == {"date=2026-10-19"}
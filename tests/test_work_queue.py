@@ -0,0 +1,31 @@
+from work_queue import SQLiteWorkQueue
+
+
+def _queue(tmp_path, **kwargs):
+    q = SQLiteWorkQueue(str(tmp_path / "queue.db"), **kwargs)
+    q.publish("run", "unit", [{"n": 1}])
+    return q
+
+
+def test_complete_needs_the_lease(tmp_path):
+    q = _queue(tmp_path)
+    a = q.lease("a", lease_s=-1)                 # expires right away
+    b = q.lease("b", lease_s=300)                # requeued and leased by b
+    assert b.id == a.id
+
+    assert q.complete(a, {"from": "a"}) is False
+    assert q.fail(a, "late") is False
+    assert q.progress("run") == {"pending": 0, "leased": 1, "done": 0, "failed": 0}
+
+    assert q.complete(b, {"from": "b"}) is True
+    assert list(q.results("run")) == [{"from": "b"}]
+    assert q.complete(b, {"from": "b"}) is False  # already done
+
+
+def test_fail_requeues_then_gives_up(tmp_path):
+    q = _queue(tmp_path, max_attempts=2)
+    assert q.fail(q.lease("a"), "boom") is True
+    assert q.progress("run")["pending"] == 1
+    assert q.fail(q.lease("a"), "boom") is True
+    assert q.progress("run")["failed"] == 1
+    assert q.lease("a") is None